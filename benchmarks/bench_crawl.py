@@ -0,0 +1,255 @@
+"""End-to-end crawl benchmark against local PTT and LINE stand-ins
+
+Starts StubPttServer and StubLineServer (benchmarks/stubs.py) and runs
+each scenario twice, each time in its own process: a cold run on an empty
+data directory, which walks max_pages index (or search result) pages, and
+a warm run on the same directory after --new-pages pages of new posts
+were added to the stub board, like a scheduled run:
+
+    single          ptt_crawler.PTTCrawler.crawl_articles, one watchlist
+    multiple        run_crawlers_concurrently, shared index, threads
+    multiple-async  run_crawlers_concurrently on the asyncio engine
+    multiple-search run_crawlers_concurrently with the search strategy
+
+Reports pages/sec, articles/sec, parse ms/page, PTT requests per
+watchlist and peak RSS. The client's rate limit is off by default so the
+numbers measure the crawler, not the limiter. With --max-rate the stub
+throttles like PTT and --adaptive lets the client find the rate itself
+(see AimdController in ptt_http). Save a baseline before an
+upgrade and compare against it afterwards; the comparison exits 1 when a
+metric is worse than the baseline by more than the threshold.
+
+Usage:
+    python benchmarks/bench_crawl.py [--pages 30] [--new-pages 2] [--latency 0.02] [--error-rate 0.01] [--throttle-rate 0.02]
+    python benchmarks/bench_crawl.py --max-rate 20 --retry-after 1 --rate 10 --adaptive
+    python benchmarks/bench_crawl.py --save baseline.json
+    python benchmarks/bench_crawl.py --compare baseline.json [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stubs import StubLineServer, StubPttServer
+
+BOARD = 'Drama-Ticket'
+TICKET_KEYWORDS = ['售']
+ARTISTS_GROUPS = [['gracie'], ['babymonster', '寶怪'], ['iu']]
+SCENARIOS = ['single', 'multiple', 'multiple-async', 'multiple-search']
+
+# Metric -> True when higher is better
+METRICS = {
+    'pages_per_sec': True,
+    'articles_per_sec': True,
+    'parse_ms_per_page': False,
+    'requests_per_watchlist': False,
+    'peak_rss_mb': False,
+}
+
+
+class TimedParser:
+    """Wraps a ptt_parser backend and adds up the time spent parsing"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.name = parser.name
+        self.seconds = 0.0
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.seconds += elapsed
+                self.pages += 1
+
+    def parse_index(self, content, base_url):
+        return self._timed(self.parser.parse_index, content, base_url)
+
+    def parse_article(self, content):
+        return self._timed(self.parser.parse_article, content)
+
+
+def max_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def run_scenario(scenario, ptt_url, line_url, pages, rate, adaptive=False):
+    """Run one scenario in this process, return wall time, parse time and memory"""
+    import ptt_crawler
+    import ptt_crawler_multiple
+    from ptt_http import HostRateLimiter, get_default_client
+    from ptt_notify import close_outboxes
+    from ptt_parser import get_parser
+
+    client = get_default_client()
+    client.limiter = HostRateLimiter(default_rate=(rate, max(1, int(rate))) if rate else None,
+                                     max_in_flight=4 if adaptive else None, adaptive=adaptive)
+    client.backoff_base = 0.05
+    parser = TimedParser(get_parser())
+    options = {'parser': parser, 'base_url': ptt_url, 'line_api_url': line_url}
+
+    start = time.perf_counter()
+    if scenario == 'single':
+        crawler = ptt_crawler.PTTCrawler(
+            board=BOARD, ticket_keywords=TICKET_KEYWORDS, artist_keywords=ARTISTS_GROUPS[0],
+            max_pages=pages, line_token='token', line_user_id='user', **options
+        )
+        new_articles = crawler.crawl_articles()['new_articles_count']
+    else:
+        groups = ARTISTS_GROUPS
+        if scenario == 'multiple-search':
+            groups = [{'artists': group, 'strategy': 'search'} for group in ARTISTS_GROUPS]
+        results = ptt_crawler_multiple.run_crawlers_concurrently(
+            groups, BOARD, TICKET_KEYWORDS, pages, 'token', 'user',
+            use_async=scenario == 'multiple-async', crawler_options=options
+        )
+        new_articles = sum(result['new_articles_count'] for result in results)
+    wall = time.perf_counter() - start
+
+    # Deliver the notifications outside the timed part, the stub counts the pushes
+    close_outboxes()
+
+    return {
+        'wall': wall,
+        'parse_seconds': parser.seconds,
+        'parsed_pages': parser.pages,
+        'new_articles': new_articles,
+        'peak_rss_kb': max_rss_kb(),
+    }
+
+
+def summarize(scenario, phase, worker, counts, line_requests):
+    watchlists = 1 if scenario == 'single' else len(ARTISTS_GROUPS)
+    pages = counts.get('index', 0) + counts.get('not_modified', 0) + counts.get('search', 0)
+    requests = sum(counts.values())
+    wall = worker['wall']
+    return {
+        'scenario': scenario,
+        'phase': phase,
+        'pages_per_sec': pages / wall,
+        'articles_per_sec': counts.get('article', 0) / wall,
+        'parse_ms_per_page': worker['parse_seconds'] * 1000 / max(1, worker['parsed_pages']),
+        'requests_per_watchlist': requests / watchlists,
+        'peak_rss_mb': worker['peak_rss_kb'] / 1024,
+        'new_articles': worker['new_articles'],
+        'line_pushes': line_requests,
+        'injected_failures': counts.get('errors', 0) + counts.get('throttled', 0),
+        'wall_s': wall,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a line per metric that is worse than baseline by more than threshold"""
+    regressions = []
+    for result in results:
+        name = f"{result['scenario']}/{result['phase']}"
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--pages', type=int, default=30, help="max_pages of every crawler")
+    parser.add_argument('--new-pages', type=int, default=2, help="index pages added to the board before the warm run")
+    parser.add_argument('--board-pages', type=int, default=1200, help="index pages on the stub board")
+    parser.add_argument('--latency', type=float, default=0.02, help="stub response latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of PTT requests answered 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of PTT requests answered 429")
+    parser.add_argument('--max-rate', type=float, default=None, help="PTT requests/sec the stub serves before answering 429")
+    parser.add_argument('--retry-after', type=int, default=0, help="Retry-After seconds of the stub's 429 responses")
+    parser.add_argument('--rate', type=float, default=0.0, help="client requests/sec per host, 0 for no limit")
+    parser.add_argument('--adaptive', action='store_true', help="adapt the client rate to the responses, needs --rate")
+    parser.add_argument('--save', help="write the results to this baseline file")
+    parser.add_argument('--compare', help="compare the results with this baseline file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--ptt-url', help=argparse.SUPPRESS)
+    parser.add_argument('--line-url', help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        os.chdir(args.data_dir)
+        result = run_scenario(args.worker, args.ptt_url, args.line_url, args.pages, args.rate, args.adaptive)
+        # The crawl prints progress on stdout, the result goes last
+        print(json.dumps(result))
+        return
+
+    ptt = StubPttServer(board=BOARD, last_page=args.board_pages, latency=args.latency,
+                        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                        retry_after=args.retry_after, max_rate=args.max_rate).start()
+    line = StubLineServer(latency=args.latency).start()
+
+    results = []
+    try:
+        for scenario in args.scenarios:
+            ptt.last_page = args.board_pages
+            with tempfile.TemporaryDirectory() as data_dir:
+                for phase in ('cold', 'warm'):
+                    if phase == 'warm':
+                        ptt.last_page += args.new_pages
+                    ptt.reset_counts()
+                    line_requests = line.requests
+                    output = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), '--worker', scenario,
+                         '--data-dir', data_dir, '--ptt-url', ptt.url, '--line-url', line.url,
+                         '--pages', str(args.pages), '--rate', str(args.rate)]
+                        + (['--adaptive'] if args.adaptive else []),
+                        check=True, capture_output=True, text=True
+                    ).stdout
+                    worker = json.loads(output.strip().splitlines()[-1])
+                    results.append(summarize(scenario, phase, worker, dict(ptt.counts), line.requests - line_requests))
+    finally:
+        ptt.stop()
+        line.stop()
+
+    print(f"{'scenario':>16} {'phase':>5} {'pages/s':>9} {'articles/s':>11} {'parse ms/page':>14} "
+          f"{'req/watchlist':>14} {'peak RSS MB':>12} {'new':>5} {'pushes':>7} {'injected':>9}")
+    for r in results:
+        print(f"{r['scenario']:>16} {r['phase']:>5} {r['pages_per_sec']:>9.1f} {r['articles_per_sec']:>11.1f} "
+              f"{r['parse_ms_per_page']:>14.3f} {r['requests_per_watchlist']:>14.1f} {r['peak_rss_mb']:>12.1f} "
+              f"{r['new_articles']:>5} {r['line_pushes']:>7} {r['injected_failures']:>9}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({f"{r['scenario']}/{r['phase']}": r for r in results}, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
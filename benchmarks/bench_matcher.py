@@ -0,0 +1,97 @@
+"""Microbenchmark: compiled KeywordMatcher vs the per-keyword any() filter
+
+Usage:
+    python benchmarks/bench_matcher.py [--titles 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ptt_matcher import KeywordMatcher
+
+
+TICKET_KEYWORDS = ['售', '換票', '降售', '售票']
+CJK = '寶怪演唱會台北高雄場次票券座位區域搖滾站位'
+
+
+def random_keyword(rng):
+    if rng.random() < 0.3:
+        return ''.join(rng.choice(CJK) for _ in range(rng.randint(2, 3)))
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(rng.randint(4, 10)))
+
+
+def make_groups(rng, keyword_count, keywords_per_group=3):
+    groups = {}
+    for idx in range(max(1, keyword_count // keywords_per_group)):
+        artist_keywords = [random_keyword(rng) for _ in range(keywords_per_group)]
+        groups[idx] = (TICKET_KEYWORDS, artist_keywords)
+    return groups
+
+
+def make_titles(rng, groups, count):
+    artist_pool = [kw for _, artists in groups.values() for kw in artists]
+    titles = []
+    for _ in range(count):
+        prefix = rng.choice(['[售票]', '[換票]', '[徵票]', '[讓票]', '[公告]'])
+        if rng.random() < 0.2:
+            body = rng.choice(artist_pool).upper()
+        else:
+            body = random_keyword(rng)
+        titles.append(f"{prefix} {body} 台北場 {rng.randint(1, 4)}張")
+    return titles
+
+
+def any_match(groups, title):
+    """Reference path: PTTCrawler.match_title repeated for every group"""
+    matched = set()
+    for key, (ticket_keywords, artist_keywords) in groups.items():
+        ticket_keyword_match = not ticket_keywords or any(
+            keyword.lower() in title.lower()
+            for keyword in ticket_keywords
+        )
+        artist_keyword_match = not artist_keywords or any(
+            keyword.lower() in title.lower()
+            for keyword in artist_keywords
+        )
+        if ticket_keyword_match and artist_keyword_match:
+            matched.add(key)
+    return matched
+
+
+def run(keyword_count, title_count, repeat):
+    rng = random.Random(keyword_count)
+    groups = make_groups(rng, keyword_count)
+    titles = make_titles(rng, groups, title_count)
+    matcher = KeywordMatcher(groups)
+
+    for title in titles:
+        expected = any_match(groups, title)
+        actual = matcher.match(title)
+        if expected != actual:
+            raise AssertionError(f"Mismatch for {title!r}: any()={expected} matcher={actual}")
+
+    any_time = min(timeit.repeat(lambda: [any_match(groups, t) for t in titles], number=1, repeat=repeat))
+    matcher_time = min(timeit.repeat(lambda: [matcher.match(t) for t in titles], number=1, repeat=repeat))
+    return len(groups), any_time / title_count * 1e6, matcher_time / title_count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--keywords', type=int, nargs='+', default=[6, 30, 150, 600, 1500])
+    args = parser.parse_args()
+
+    print(f"{'artist kw':>10} {'groups':>7} {'any() us/title':>15} {'matcher us/title':>17} {'speedup':>8}")
+    for keyword_count in args.keywords:
+        group_count, any_us, matcher_us = run(keyword_count, args.titles, args.repeat)
+        print(f"{keyword_count:>10} {group_count:>7} {any_us:>15.2f} {matcher_us:>17.2f} {any_us / matcher_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
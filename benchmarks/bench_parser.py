@@ -0,0 +1,121 @@
+"""Parser backend benchmark with golden fixture check
+
+Every installed backend in ptt_parser must reproduce benchmarks/fixtures/
+golden.json (written by the bs4 reference parser) before it is timed.
+Each backend then runs in its own process so peak memory is not shared.
+
+Usage:
+    python benchmarks/bench_parser.py [--rounds 200] [--backends bs4 strainer lxml]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fixtures import BASE_URL, load_fixture, load_golden
+from ptt_parser import available_parsers, get_parser
+
+INDEX_FIXTURES = ['index_latest.html', 'index_middle.html', 'index_first.html']
+ARTICLE_FIXTURES = ['article.html', 'article_long.html', 'article_no_metalines.html']
+
+
+def check_golden(name):
+    """Return the fixtures where backend name disagrees with the golden output"""
+    parser = get_parser(name)
+    mismatches = []
+    for fixture, expected in load_golden().items():
+        content = load_fixture(fixture)
+        if fixture in INDEX_FIXTURES:
+            rows, prev_page_url = parser.parse_index(content, BASE_URL)
+            actual = {'rows': rows, 'prev_page_url': prev_page_url}
+        else:
+            actual = parser.parse_article(content)
+        if actual != expected:
+            mismatches.append(fixture)
+    return mismatches
+
+
+def max_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def measure(name, rounds):
+    """Time one backend in this process, return per-page ms and memory peaks"""
+    parser = get_parser(name)
+    index_pages = [load_fixture(f) for f in INDEX_FIXTURES]
+    article_pages = [load_fixture(f) for f in ARTICLE_FIXTURES]
+    rss_before = max_rss_kb()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for content in index_pages:
+            parser.parse_index(content, BASE_URL)
+    index_ms = (time.perf_counter() - start) * 1000 / (rounds * len(index_pages))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for content in article_pages:
+            parser.parse_article(content)
+    article_ms = (time.perf_counter() - start) * 1000 / (rounds * len(article_pages))
+
+    rss_growth = max_rss_kb() - rss_before
+
+    tracemalloc.start()
+    parser.parse_index(index_pages[0], BASE_URL)
+    parser.parse_article(article_pages[0])
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'backend': name,
+        'index_ms': index_ms,
+        'article_ms': article_ms,
+        'python_peak_kb': python_peak / 1024,
+        'rss_growth_kb': rss_growth,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--backends', nargs='+', default=None)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.rounds)))
+        return
+
+    backends = args.backends or available_parsers()
+    failed = False
+    for name in backends:
+        mismatches = check_golden(name)
+        if mismatches:
+            failed = True
+            print(f"{name}: output differs from golden fixtures: {', '.join(mismatches)}")
+    if failed:
+        sys.exit(1)
+    print(f"Golden fixtures match for: {', '.join(backends)}\n")
+
+    print(f"{'backend':>11} {'index ms/page':>14} {'article ms/page':>16} {'py peak KB':>11} {'RSS growth KB':>14}")
+    for name in backends:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', name, '--rounds', str(args.rounds)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output)
+        print(f"{name:>11} {result['index_ms']:>14.3f} {result['article_ms']:>16.3f} "
+              f"{result['python_peak_kb']:>11.1f} {result['rss_growth_kb']:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Cold-start benchmark of a scheduled run that finds nothing new
+
+Runs `python -m ptt_crawler_multiple once` against StubPttServer and
+StubLineServer (benchmarks/stubs.py), with the watchlists in a boards
+file in a temporary data directory:
+
+    warm-up   one full run, which stores the config snapshot, the index page
+              validators and the completed walk (see ptt_startup)
+    quiet     --runs runs without changes on the board
+    changed   one run after a new index page was added, which must crawl
+
+For every run it reports the time from spawning the process to the first
+request reaching the stub, the wall time of the process and the requests
+it made. A quiet run should exit after a single conditional request. One
+more quiet run under `python -X importtime` lists the slowest imports.
+`python -c pass` is timed too: the interpreter's own startup, site and
+.pth files included, is part of every number and outside the crawler's
+control. The crawler runs with -m so its own code is loaded from the
+bytecode cache like every other module; a script given by path is
+compiled again on every start. Run `python -m compileall .` first where
+PYTHONDONTWRITEBYTECODE is set.
+
+Exits 1 when the median first-request time of the quiet runs is above
+--target-ms.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--target-ms 150] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from stubs import StubLineServer, StubPttServer
+
+BOARD = 'Drama-Ticket'
+TICKET_KEYWORDS = ['售']
+ARTISTS_GROUPS = [['gracie'], ['babymonster', '寶怪'], ['iu']]
+
+
+def write_config(data_dir, ptt_url, line_url, max_pages):
+    path = os.path.join(data_dir, 'boards.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'base_url': ptt_url,
+            'line_api_url': line_url,
+            'boards': [{
+                'board': BOARD, 'ticket_keywords': TICKET_KEYWORDS,
+                'max_pages': max_pages, 'artists_groups': ARTISTS_GROUPS,
+            }],
+        }, f, ensure_ascii=False)
+    return path
+
+
+def run_crawler(ptt, data_dir, python_args=()):
+    """Run one crawl in its own process, return (first request ms, wall ms, request counts, output)"""
+    env = dict(os.environ, LINE_TOKEN='token', LINE_USER_ID='user', PYTHONPATH=REPO_DIR)
+    ptt.reset_counts()
+    start = time.time()
+    process = subprocess.run(
+        [sys.executable, *python_args, '-m', 'ptt_crawler_multiple', 'once'],
+        cwd=data_dir, env=env, capture_output=True, text=True, check=True
+    )
+    wall = (time.time() - start) * 1000
+    first = (ptt.first_request - start) * 1000 if ptt.first_request else None
+    return first, wall, dict(ptt.counts), process
+
+
+def interpreter_ms(runs):
+    """Median wall time of `python -c pass`"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def top_imports(stderr, top):
+    """Top-level imports of an -X importtime log, slowest first, as (cumulative ms, module)"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module importing them
+        if not name[1:].startswith(' '):
+            imports.append((int(cumulative) / 1000, name.strip()))
+    imports.sort(reverse=True)
+    return imports[:top], sum(ms for ms, _ in imports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help="quiet runs to time")
+    parser.add_argument('--pages', type=int, default=5, help="max_pages of the board")
+    parser.add_argument('--latency', type=float, default=0.0, help="stub response latency in seconds")
+    parser.add_argument('--target-ms', type=float, default=150, help="allowed median ms from process start to first request")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    ptt = StubPttServer(board=BOARD, latency=args.latency).start()
+    line = StubLineServer(latency=args.latency).start()
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            write_config(data_dir, ptt.url, line.url, args.pages)
+            rows.append(('warm-up',) + run_crawler(ptt, data_dir)[:3])
+            quiet = [run_crawler(ptt, data_dir)[:3] for _ in range(args.runs)]
+            rows.extend(('quiet',) + run for run in quiet)
+            _, _, _, traced = run_crawler(ptt, data_dir, ('-X', 'importtime'))
+            ptt.last_page += 1
+            rows.append(('changed',) + run_crawler(ptt, data_dir)[:3])
+    finally:
+        ptt.stop()
+        line.stop()
+
+    print(f"{'run':>8} {'first request ms':>17} {'wall ms':>9}  requests")
+    for name, first, wall, counts in rows:
+        first_text = f"{first:.1f}" if first is not None else '-'
+        print(f"{name:>8} {first_text:>17} {wall:>9.1f}  {json.dumps(counts)}")
+
+    quiet_first = [first for first, _, _ in quiet if first is not None]
+    quiet_requests = [sum(counts.values()) for _, _, counts in quiet]
+    median_first = statistics.median(quiet_first) if quiet_first else float('inf')
+    print(f"\nQuiet runs: median first request {median_first:.1f} ms, "
+          f"median wall {statistics.median(wall for _, wall, _ in quiet):.1f} ms, "
+          f"requests per run {min(quiet_requests)}-{max(quiet_requests)}")
+    print(f"Interpreter startup (python -c pass): {interpreter_ms(5):.1f} ms")
+
+    imports, total = top_imports(traced.stderr, args.top)
+    print(f"\nTop-level imports of a quiet run under -X importtime ({total:.1f} ms in total):")
+    for ms, name in imports:
+        print(f"  {ms:>8.1f} ms  {name}")
+
+    if max(quiet_requests) > 1:
+        print("\nA quiet run made more than one request")
+        sys.exit(1)
+    if median_first > args.target_ms:
+        print(f"\nMedian first request above the {args.target_ms:.0f} ms target")
+        sys.exit(1)
+    print(f"\nWithin the {args.target_ms:.0f} ms target")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Deterministic PTT-style index and article pages for benchmarks
+
+The markup follows what www.ptt.cc serves for board index pages and
+article pages (paging buttons, r-ent rows, deleted rows, pinned rows
+after r-list-sep, metalines, pushes). Run this module to rewrite the
+golden fixtures in benchmarks/fixtures/.
+
+Usage:
+    python benchmarks/fixtures.py
+"""
+import html
+import json
+import os
+import random
+import sys
+import time
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASE_URL = 'https://www.ptt.cc'
+BASE_TIMESTAMP = 1727740800  # 2024-10-01 00:00:00 UTC
+POSTS_PER_PAGE = 20
+SECONDS_PER_POST = 1800
+
+ARTISTS = ['BABYMONSTER', '寶怪', 'gracie', 'Gracie Abrams', 'IU', 'TWICE', '五月天', 'aespa', 'SEVENTEEN', '周杰倫']
+PREFIXES = ['[售票]', '[售票]', '[換票]', '[徵票]', '[讓票]', '[降售]', '[問題]']
+CITIES = ['台北', '高雄', '台中', '小巨蛋', '林口體育館', '大巨蛋']
+AUTHORS = ['ticketfan', 'kpoplover', 'mayday5566', 'seat007', 'owl1234', 'concertgo']
+PINNED = [
+    ('[公告] Drama-Ticket 板規', 'M.1600000000.A.001'),
+    ('[公告] 交易安全宣導 &amp; 檢舉流程', 'M.1600000100.A.002'),
+]
+
+INDEX_TEMPLATE = '''<!DOCTYPE html>
+<html>
+	<head>
+		<meta charset="utf-8">
+		<title>看板 {board} 文章列表 - 批踢踢實業坊</title>
+		<link rel="stylesheet" type="text/css" href="//images.ptt.cc/bbs/v2.27/bbs-common.css">
+	</head>
+	<body>
+<div id="topbar-container">
+	<div id="topbar" class="bbs-content">
+		<a id="logo" href="/bbs/">批踢踢實業坊</a>
+		<span>&rsaquo;</span>
+		<a class="board" href="/bbs/{board}/index.html"><span class="board-label">看板 </span>{board}</a>
+	</div>
+</div>
+<div id="action-bar-container">
+	<div class="action-bar">
+		<div class="btn-group btn-group-dir">
+			<a class="btn selected" href="/bbs/{board}/index.html">看板</a>
+			<a class="btn" href="/man/{board}/index.html">精華區</a>
+		</div>
+		<div class="btn-group btn-group-paging">
+			<a class="btn wide" href="/bbs/{board}/index1.html">最舊</a>
+			{prev_link}
+			{next_link}
+			<a class="btn wide" href="/bbs/{board}/index.html">最新</a>
+		</div>
+	</div>
+</div>
+<div id="main-container">
+	<div class="r-list-container action-bar-margin bbs-screen">
+		<div class="search-bar">
+			<form type="get" action="search" id="search-bar">
+				<input class="query" type="text" name="q" value="" placeholder="搜尋文章&#x22ef;">
+			</form>
+		</div>
+{rows}
+	</div>
+</div>
+	</body>
+</html>
+'''
+
+ROW_TEMPLATE = '''		<div class="r-ent">
+			<div class="nrec">{nrec}</div>
+			<div class="title">
+			{title}
+			</div>
+			<div class="meta">
+				<div class="author">{author}</div>
+				<div class="article-menu">
+					<div class="trigger">&#x22ef;</div>
+				</div>
+				<div class="date">{date}</div>
+				<div class="mark">{mark}</div>
+			</div>
+		</div>'''
+
+ARTICLE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+	<head>
+		<meta charset="utf-8">
+		<title>{title_text} - 看板 {board} - 批踢踢實業坊</title>
+		<meta property="og:title" content="{title_text}">
+	</head>
+	<body>
+<div id="main-container">
+	<div id="main-content" class="bbs-screen bbs-content">{metalines}{body}
+--
+<span class="f2">※ 發信站: 批踢踢實業坊(ptt.cc), 來自: 203.0.113.{ip} (臺灣)
+</span><span class="f2">※ 文章網址: <a href="{url}" target="_blank" rel="noopener noreferrer nofollow">{url}</a>
+</span>{pushes}</div>
+</div>
+	</body>
+</html>
+'''
+
+
+def article_id(page, idx):
+    timestamp = BASE_TIMESTAMP + ((page - 1) * POSTS_PER_PAGE + idx) * SECONDS_PER_POST
+    return f"M.{timestamp}.A.{(page * 131 + idx * 7) % 4096:03X}"
+
+
+def index_posts(page, board):
+    """The posts of index page number page as (title, article id, author, deleted)"""
+    rng = random.Random(f"{board}:{page}")
+    posts = []
+    for idx in range(POSTS_PER_PAGE):
+        title = f"{rng.choice(PREFIXES)} {rng.choice(ARTISTS)} {rng.choice(CITIES)} {rng.randint(1, 12)}/{rng.randint(1, 28)} {rng.randint(1, 4)}張"
+        posts.append((title, article_id(page, idx), rng.choice(AUTHORS), rng.random() < 0.05))
+    return posts
+
+
+def render_index_page(page, last_page, board='Drama-Ticket'):
+    """Render index<page>.html of a board whose newest page is last_page"""
+    rng = random.Random(f"{board}:{page}:rows")
+    rows = []
+    for title, post_id, author, deleted in index_posts(page, board):
+        if deleted:
+            title_html = f"(本文已被刪除) [{author}]"
+        else:
+            title_html = f'<a href="/bbs/{board}/{post_id}.html">{html.escape(title, quote=False)}</a>'
+        nrec = rng.choice(['', '', '<span class="hl f2">1</span>', '<span class="hl f3">12</span>', '<span class="hl f1">爆</span>'])
+        rows.append(ROW_TEMPLATE.format(nrec=nrec, title=title_html, author=author, date='10/16', mark=''))
+
+    if page == last_page:
+        rows.append('		<div class="r-list-sep"></div>')
+        for title, post_id in PINNED:
+            rows.append(ROW_TEMPLATE.format(
+                nrec='<span class="hl f1">爆</span>',
+                title=f'<a href="/bbs/{board}/{post_id}.html">{title}</a>',
+                author='SYSOP', date=' 9/13', mark='M'
+            ))
+
+    if page > 1:
+        prev_link = f'<a class="btn wide" href="/bbs/{board}/index{page - 1}.html">&lsaquo; 上頁</a>'
+    else:
+        prev_link = '<a class="btn wide disabled">&lsaquo; 上頁</a>'
+    if page < last_page:
+        next_link = f'<a class="btn wide" href="/bbs/{board}/index{page + 1}.html">下頁 &rsaquo;</a>'
+    else:
+        next_link = '<a class="btn wide disabled">下頁 &rsaquo;</a>'
+
+    return INDEX_TEMPLATE.format(board=board, prev_link=prev_link, next_link=next_link, rows='\n'.join(rows))
+
+
+def search_posts(query, last_page, board='Drama-Ticket'):
+    """Every live post whose title contains query (case-insensitive), newest first"""
+    query = query.lower()
+    hits = []
+    for page in range(last_page, 0, -1):
+        for title, post_id, author, deleted in reversed(index_posts(page, board)):
+            if not deleted and query in title.lower():
+                hits.append((title, post_id, author))
+    return hits
+
+
+def render_search_page(hits, page, query, board='Drama-Ticket'):
+    """Render page number page of board search results hits (newest first), None past the last page
+
+    Like PTT, page 1 holds the newest results and each page lists its
+    rows oldest first, with 上頁 leading to older results.
+    """
+    chunk = hits[(page - 1) * POSTS_PER_PAGE:page * POSTS_PER_PAGE]
+    if not chunk:
+        return None
+
+    rows = [
+        ROW_TEMPLATE.format(
+            nrec='', author=author, date='10/16', mark='',
+            title=f'<a href="/bbs/{board}/{post_id}.html">{html.escape(title, quote=False)}</a>'
+        ) for title, post_id, author in reversed(chunk)
+    ]
+    quoted = html.escape(query)
+    if len(hits) > page * POSTS_PER_PAGE:
+        prev_link = f'<a class="btn wide" href="/bbs/{board}/search?page={page + 1}&amp;q={quoted}">&lsaquo; 上頁</a>'
+    else:
+        prev_link = '<a class="btn wide disabled">&lsaquo; 上頁</a>'
+    if page > 1:
+        next_link = f'<a class="btn wide" href="/bbs/{board}/search?page={page - 1}&amp;q={quoted}">下頁 &rsaquo;</a>'
+    else:
+        next_link = '<a class="btn wide disabled">下頁 &rsaquo;</a>'
+
+    return INDEX_TEMPLATE.format(board=board, prev_link=prev_link, next_link=next_link, rows='\n'.join(rows))
+
+
+def render_article_page(post_id, board='Drama-Ticket', title=None, with_metalines=True):
+    """Render the article page of post_id"""
+    rng = random.Random(post_id)
+    title = title or f"{rng.choice(PREFIXES)} {rng.choice(ARTISTS)} {rng.choice(CITIES)}"
+    author = rng.choice(AUTHORS)
+    timestamp = int(post_id.split('.')[1])
+    url = f"{BASE_URL}/bbs/{board}/{post_id}.html"
+
+    metalines = ''
+    if with_metalines:
+        metalines = (
+            f'<div class="article-metaline"><span class="article-meta-tag">作者</span><span class="article-meta-value">{author} ({author.upper()})</span></div>'
+            f'<div class="article-metaline-right"><span class="article-meta-tag">看板</span><span class="article-meta-value">{board}</span></div>'
+            f'<div class="article-metaline"><span class="article-meta-tag">標題</span><span class="article-meta-value">{html.escape(title, quote=False)}</span></div>'
+            f'<div class="article-metaline"><span class="article-meta-tag">時間</span><span class="article-meta-value">{format_ptt_time(timestamp)}</span></div>'
+        )
+
+    body_lines = [
+        '',
+        '<span class="hl f3">【票券資訊】</span>',
+        f'演出名稱：{title}',
+        f'場次時間：2024/{rng.randint(10, 12)}/{rng.randint(1, 28)} 19:30',
+        f'票面價格：{rng.choice([2800, 3800, 4800, 5800])} 元',
+        f'售出價格：{rng.choice(["原價", "降價", "面交原價"])}',
+        f'座位區域：{rng.choice(["搖滾區", "看台區", "身障席"])} {rng.randint(1, 30)} 排',
+        '交易方式：面交 / 7-11 交貨便',
+    ]
+    body_lines.extend('說明文字 ' * rng.randint(3, 12) for _ in range(rng.randint(5, 20)))
+
+    pushes = []
+    for _ in range(rng.randint(0, 30)):
+        tag = rng.choice(['推 ', '→ ', '噓 '])
+        pushes.append(
+            f'<div class="push"><span class="hl push-tag">{tag}</span>'
+            f'<span class="f3 hl push-userid">{rng.choice(AUTHORS)}</span>'
+            f'<span class="f3 push-content">: 請問還有票嗎</span>'
+            f'<span class="push-ipdatetime"> 10/16 21:{rng.randint(10, 59)}\n</span></div>'
+        )
+
+    return ARTICLE_TEMPLATE.format(
+        title_text=html.escape(title), board=board, metalines=metalines,
+        body='\n'.join(body_lines), ip=rng.randint(1, 254), url=url, pushes=''.join(pushes)
+    )
+
+
+def format_ptt_time(timestamp):
+    """PTT prints post time like ctime, e.g. 'Tue Oct  1 00:00:00 2024'"""
+    return time.asctime(time.gmtime(timestamp))
+
+
+GOLDEN_PAGES = {
+    'index_latest.html': lambda: render_index_page(1200, 1200),
+    'index_middle.html': lambda: render_index_page(1199, 1200),
+    'index_first.html': lambda: render_index_page(1, 1200),
+    'article.html': lambda: render_article_page(article_id(1200, 3)),
+    'article_long.html': lambda: render_article_page(article_id(1200, 11), title='[售票] BABYMONSTER &amp; 寶怪 <高雄> 2張'),
+    'article_no_metalines.html': lambda: render_article_page(article_id(1199, 5), with_metalines=False),
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def load_golden():
+    with open(os.path.join(FIXTURE_DIR, 'golden.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ptt_parser import Bs4Parser
+
+    reference = Bs4Parser()
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    golden = {}
+    for name, render in GOLDEN_PAGES.items():
+        content = render()
+        with open(os.path.join(FIXTURE_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+        if name.startswith('index'):
+            rows, prev_page_url = reference.parse_index(content, BASE_URL)
+            golden[name] = {'rows': rows, 'prev_page_url': prev_page_url}
+        else:
+            golden[name] = reference.parse_article(content)
+
+    with open(os.path.join(FIXTURE_DIR, 'golden.json'), 'w', encoding='utf-8') as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {len(golden)} fixtures to {FIXTURE_DIR}")
+
+
+if __name__ == '__main__':
+    main()
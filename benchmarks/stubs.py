@@ -0,0 +1,323 @@
+"""Local stand-ins for the external services, for benchmarks and manual testing
+
+StubPttServer serves a Drama-Ticket board built from the deterministic
+pages in fixtures.py (index pages, article pages and the board search) on
+127.0.0.1, with configurable latency, error rate and 429 injection. With
+max_rate it throttles like a real site: requests beyond max_rate per
+second get 429 with Retry-After.
+
+StubLineServer accepts LINE push requests on 127.0.0.1. It checks the
+documented limits (5 messages per push, 5000 characters per text
+message), answers a repeated X-Line-Retry-Key with 409 like LINE does,
+and can fail a number of requests or add latency.
+
+Usage:
+    python benchmarks/stubs.py ptt [--port 8080] [--pages 1200] [--latency 0.05] [--error-rate 0.01] [--throttle-rate 0.02] [--max-rate 5] [--retry-after 2]
+    python benchmarks/stubs.py line [--port 8081] [--fail 3] [--fail-status 500] [--latency 0.2]
+"""
+import argparse
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from fixtures import render_article_page, render_index_page, render_search_page, search_posts
+
+MAX_MESSAGES_PER_PUSH = 5
+MAX_TEXT_LENGTH = 5000
+
+
+class StubPttServer:
+    """Threaded fake of www.ptt.cc for one board, counting requests by kind"""
+
+    INDEX_PATH = re.compile(r'^/bbs/([^/]+)/index(\d*)\.html$')
+    ARTICLE_PATH = re.compile(r'^/bbs/([^/]+)/(M\.\d+\.A\.[0-9A-F]+)\.html$')
+    SEARCH_PATH = re.compile(r'^/bbs/([^/]+)/search$')
+
+    def __init__(self, port=0, board='Drama-Ticket', last_page=1200, latency=0.0,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=0, seed=0, max_rate=None):
+        """
+        Parameters:
+        port (int): Port to listen on, 0 picks a free one
+        board (str): Board served, other boards answer 404
+        last_page (int): Number of the newest index page
+        latency (float): Seconds to wait before answering
+        error_rate (float): Fraction of requests answered with 500
+        throttle_rate (float): Fraction of requests answered with 429
+        retry_after (int): Retry-After seconds sent with the 429 responses
+        seed (int): Seed of the error and 429 injection
+        max_rate (float): Requests per second served before answering 429, None for no limit
+        """
+        self.board = board
+        self.last_page = last_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.max_rate = max_rate
+        self.served = collections.deque()  # Times of the requests served in the last second
+        self.counts = {}
+        self.first_request = None  # time.time() of the first request since reset_counts
+        self.search_hits = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts = {}
+            self.first_request = None
+
+    def received(self):
+        with self.lock:
+            if self.first_request is None:
+                self.first_request = time.time()
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.received()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, body, headers = stub.handle_get(self.path, self.headers.get('If-None-Match'))
+                data = body.encode('utf-8')
+                self.send_response(status)
+                if status != 304:
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(data)
+
+        return Handler
+
+    def over_rate(self):
+        """Check whether serving a request now would exceed max_rate, else count it as served"""
+        now = time.monotonic()
+        with self.lock:
+            while self.served and self.served[0] <= now - 1:
+                self.served.popleft()
+            if len(self.served) >= self.max_rate:
+                return True
+            self.served.append(now)
+            return False
+
+    def inject(self):
+        """Return the injected failure for the next request, or None"""
+        if self.max_rate and self.over_rate():
+            return 'throttled'
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 'throttled'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'errors'
+        return None
+
+    def handle_get(self, path, if_none_match=None):
+        """Return (status, body, extra headers) for a GET of path
+
+        Index pages carry an ETag of their body and are answered with 304
+        when if_none_match holds it.
+        """
+        failure = self.inject()
+        if failure:
+            self.count(failure)
+            if failure == 'throttled':
+                return 429, 'Too Many Requests', {'Retry-After': str(self.retry_after)}
+            return 500, 'Internal Server Error', {}
+
+        parts = urlsplit(path)
+        match = self.INDEX_PATH.match(parts.path)
+        if match and match.group(1) == self.board:
+            page = int(match.group(2) or self.last_page)
+            if 1 <= page <= self.last_page:
+                body = render_index_page(page, self.last_page, self.board)
+                etag = '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+                if if_none_match == etag:
+                    self.count('not_modified')
+                    return 304, '', {'ETag': etag}
+                self.count('index')
+                return 200, body, {'ETag': etag}
+
+        match = self.ARTICLE_PATH.match(parts.path)
+        if match and match.group(1) == self.board:
+            self.count('article')
+            return 200, render_article_page(match.group(2), self.board), {}
+
+        match = self.SEARCH_PATH.match(parts.path)
+        if match and match.group(1) == self.board:
+            query = parse_qs(parts.query)
+            q = query.get('q', [''])[0]
+            page = int(query.get('page', ['1'])[0])
+            self.count('search')
+            # last_page may grow between runs to simulate new posts
+            key = (q, self.last_page)
+            with self.lock:
+                hits = self.search_hits.get(key)
+            if hits is None:
+                hits = search_posts(q, self.last_page, self.board)
+                with self.lock:
+                    self.search_hits[key] = hits
+            body = render_search_page(hits, page, q, self.board)
+            if body is not None:
+                return 200, body, {}
+
+        self.count('not_found')
+        return 404, '404 - Not Found.', {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubLineServer:
+    """Threaded fake of POST /v2/bot/message/push that records accepted pushes"""
+
+    def __init__(self, port=0, fail=0, fail_status=500, latency=0.0):
+        """
+        Parameters:
+        port (int): Port to listen on, 0 picks a free one
+        fail (int): Number of upcoming pushes answered with fail_status
+        fail_status (int): Status code of the failed pushes
+        latency (float): Seconds to wait before answering
+        """
+        self.fail = fail
+        self.fail_status = fail_status
+        self.latency = latency
+        self.pushes = []  # Accepted request bodies, in arrival order
+        self.requests = 0
+        self.retry_keys = set()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v2/bot/message/push"
+
+    @property
+    def messages(self):
+        with self.lock:
+            return [message['text'] for push in self.pushes for message in push['messages']]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, reply = stub.handle_push(self.path, self.headers, body)
+                data = json.dumps(reply).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def handle_push(self, path, headers, body):
+        with self.lock:
+            self.requests += 1
+            if path != '/v2/bot/message/push':
+                return 404, {'message': 'Not found'}
+            if self.fail > 0:
+                self.fail -= 1
+                return self.fail_status, {'message': 'Injected failure'}
+
+            try:
+                push = json.loads(body)
+            except ValueError:
+                return 400, {'message': 'The request body has 1 error(s)'}
+            messages = push.get('messages') or []
+            if not push.get('to') or not 1 <= len(messages) <= MAX_MESSAGES_PER_PUSH:
+                return 400, {'message': 'The request body has 1 error(s)'}
+            if any(len(message.get('text', '')) > MAX_TEXT_LENGTH for message in messages):
+                return 400, {'message': 'The request body has 1 error(s)'}
+
+            retry_key = headers.get('X-Line-Retry-Key')
+            if retry_key:
+                if retry_key in self.retry_keys:
+                    return 409, {'message': 'The retry key is already accepted'}
+                self.retry_keys.add(retry_key)
+            self.pushes.append(push)
+            return 200, {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('service', choices=['ptt', 'line'])
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--pages', type=int, default=1200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--max-rate', type=float, default=None)
+    parser.add_argument('--retry-after', type=int, default=0)
+    parser.add_argument('--fail', type=int, default=0)
+    parser.add_argument('--fail-status', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.service == 'ptt':
+        stub = StubPttServer(args.port or 8080, last_page=args.pages, latency=args.latency,
+                             error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                             retry_after=args.retry_after, max_rate=args.max_rate)
+        print(f"Stub PTT board at {stub.url}/bbs/{stub.board}/index.html")
+    else:
+        stub = StubLineServer(args.port or 8081, args.fail, args.fail_status, args.latency)
+        print(f"Stub LINE push endpoint at {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.service == 'ptt':
+            print(json.dumps(stub.counts))
+        else:
+            for push in stub.pushes:
+                print(json.dumps(push, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
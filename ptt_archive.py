@@ -0,0 +1,289 @@
+"""Local full-text archive of crawled articles, queried without touching PTT
+
+Every article a crawler writes to its output file is also stored in
+ptt_{board}_data/archive.sqlite3 with its title, author (作者), post time
+(時間), URL and the watchlists it matched. Titles are indexed with an FTS5
+trigram index, so substring queries in Chinese and English are answered
+from disk in milliseconds. Unlike the article cache, the archive is never
+evicted.
+
+Usage:
+    python ptt_archive.py query [<keyword> ...] [--board Drama-Ticket] [--author <id>] [--group <artist>] [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--limit 50] [--json]
+    python ptt_archive.py import <file.jsonl> [...] [--board Drama-Ticket]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from ptt_cache import article_id_timestamp
+from ptt_output import read_records
+
+PTT_TIME_FORMAT = '%a %b %d %H:%M:%S %Y'  # 時間 metaline, e.g. Sun Oct  6 12:00:00 2024
+
+
+def post_timestamp(article):
+    """Unix post time of an article from its ID, or from its 時間 metaline, None if neither parses"""
+    timestamp = article_id_timestamp(article.get('url', '').split('/')[-1].strip())
+    if timestamp is None and article.get('時間'):
+        try:
+            timestamp = int(datetime.strptime(' '.join(article['時間'].split()), PTT_TIME_FORMAT).timestamp())
+        except ValueError:
+            pass
+    return timestamp
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class ArticleArchive:
+    """SQLite archive of article records with an FTS5 trigram index over titles
+
+    Falls back to LIKE scans when the SQLite build lacks FTS5 or the trigram
+    tokenizer (SQLite < 3.34).
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY,
+            article_id TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL,
+            author TEXT,
+            time TEXT,
+            posted_at INTEGER,
+            url TEXT NOT NULL,
+            groups TEXT NOT NULL DEFAULT '[]'
+        );
+        CREATE INDEX IF NOT EXISTS articles_posted_at ON articles (posted_at);
+        CREATE INDEX IF NOT EXISTS articles_author ON articles (author COLLATE NOCASE);
+    '''
+
+    FTS_SCHEMA = '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+            title, content='articles', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+            INSERT INTO articles_fts (rowid, title) VALUES (new.id, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF title ON articles BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO articles_fts (rowid, title) VALUES (new.id, new.title);
+        END;
+    '''
+
+    def __init__(self, path, readonly=False):
+        """
+        Parameters:
+        path (str): SQLite database file
+        readonly (bool): Open an existing archive for queries only
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.users = 1
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(self.SCHEMA)
+            try:
+                self.conn.executescript(self.FTS_SCHEMA)
+            except sqlite3.OperationalError:
+                pass  # No FTS5 or trigram tokenizer in this SQLite build
+        self.fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'"
+        ).fetchone() is not None
+
+    def add_many(self, articles, group=None):
+        """Insert or update article records, adding group (a list of artist keywords) to their watchlists"""
+        rows = []
+        for article in articles:
+            article_id = article['url'].split('/')[-1].strip()
+            rows.append((article_id, article, post_timestamp(article)))
+        if not rows:
+            return
+        label = '/'.join(group) if group else None
+
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                for article_id, article, posted_at in rows:
+                    existing = self.conn.execute(
+                        'SELECT groups FROM articles WHERE article_id = ?', (article_id,)
+                    ).fetchone()
+                    groups = json.loads(existing[0]) if existing else []
+                    if label and label not in groups:
+                        groups.append(label)
+                    self.conn.execute(
+                        '''INSERT INTO articles (article_id, title, author, time, posted_at, url, groups)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (article_id) DO UPDATE SET
+                               title = excluded.title, author = excluded.author, time = excluded.time,
+                               posted_at = excluded.posted_at, url = excluded.url, groups = excluded.groups''',
+                        (article_id, article.get('title', ''), article.get('作者'), article.get('時間'),
+                         posted_at, article['url'], json.dumps(groups, ensure_ascii=False))
+                    )
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def search(self, keywords=(), author=None, group=None, since=None, until=None, limit=50):
+        """Return matching articles, newest first
+
+        Parameters:
+        keywords (list): Substrings that must all appear in the title, case-insensitive
+        author (str): PTT ID of the author
+        group (str): Substring of a matched watchlist, e.g. an artist keyword
+        since (int): Oldest post time as a unix timestamp, inclusive
+        until (int): Newest post time as a unix timestamp, exclusive
+        limit (int): Maximum number of results, None for all
+        """
+        conditions, params = [], []
+        keywords = [keyword for keyword in keywords if keyword]
+        # Trigrams only index keywords of 3+ characters, shorter ones are matched with LIKE
+        indexed = [keyword for keyword in keywords if self.fts and len(keyword) >= 3]
+        if indexed:
+            conditions.append('id IN (SELECT rowid FROM articles_fts WHERE articles_fts MATCH ?)')
+            params.append(' AND '.join('"' + keyword.replace('"', '""') + '"' for keyword in indexed))
+        for keyword in keywords:
+            if keyword not in indexed:
+                conditions.append("title LIKE ? ESCAPE '\\'")
+                params.append(f"%{_like_escape(keyword)}%")
+        if author:
+            # Stored as "id (nickname)"
+            conditions.append("(author = ? COLLATE NOCASE OR author LIKE ? ESCAPE '\\')")
+            params.extend([author, f"{_like_escape(author)} (%"])
+        if group:
+            conditions.append("groups LIKE ? ESCAPE '\\'")
+            params.append(f"%{_like_escape(group)}%")
+        if since is not None:
+            conditions.append('posted_at >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('posted_at < ?')
+            params.append(until)
+
+        sql = 'SELECT title, author, time, url, groups, posted_at FROM articles'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY posted_at DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [
+            {'title': title, '作者': author, '時間': time, 'url': url,
+             'groups': json.loads(groups), 'posted_at': posted_at}
+            for title, author, time, url, groups, posted_at in rows
+        ]
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+    def close(self):
+        """Drop one user of the shared instance, closing the connection after the last"""
+        with _archives_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if _archives.get(self.path) is self:
+                del _archives[self.path]
+        with self.lock:
+            self.conn.close()
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def archive_path(output_dir):
+    return os.path.abspath(os.path.join(output_dir, 'archive.sqlite3'))
+
+
+def open_archive(output_dir):
+    """Return the process-wide archive of a board; every caller gets the same instance and should call close once"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = archive_path(output_dir)
+    with _archives_lock:
+        archive = _archives.get(path)
+        # An archive whose file was moved away or deleted since it was opened is replaced
+        if archive is not None and os.path.exists(path):
+            archive.users += 1
+            return archive
+        archive = _archives[path] = ArticleArchive(path)
+        return archive
+
+
+def parse_date(text):
+    """Unix timestamp of local midnight of a YYYY-MM-DD date"""
+    return int(datetime.strptime(text, '%Y-%m-%d').timestamp())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢本機已爬取文章的全文索引")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="依關鍵字、作者、群組與日期查詢")
+    query.add_argument('keywords', nargs='*', help="標題須包含的關鍵字（不區分大小寫）")
+    query.add_argument('--board', default='Drama-Ticket')
+    query.add_argument('--author', help="作者 ID")
+    query.add_argument('--group', help="符合的藝人群組關鍵字")
+    query.add_argument('--since', help="起始日期 YYYY-MM-DD（含）")
+    query.add_argument('--until', help="結束日期 YYYY-MM-DD（含）")
+    query.add_argument('--limit', type=int, default=50)
+    query.add_argument('--json', action='store_true', help="以 JSON Lines 輸出")
+
+    load = commands.add_parser('import', help="匯入既有的輸出檔（.jsonl 或舊版 .json）")
+    load.add_argument('files', nargs='+')
+    load.add_argument('--board', default='Drama-Ticket')
+    args = parser.parse_args()
+
+    output_dir = f"./ptt_{args.board}_data"
+    if args.command == 'import':
+        archive = open_archive(output_dir)
+        try:
+            for path in args.files:
+                records = read_records(path)
+                archive.add_many(records)
+                print(f"已匯入 {len(records)} 篇文章：{path}")
+        finally:
+            archive.close()
+        return
+
+    path = archive_path(output_dir)
+    if not os.path.exists(path):
+        print(f"找不到 {path}，請先執行爬蟲或以 import 匯入輸出檔")
+        sys.exit(1)
+    archive = ArticleArchive(path, readonly=True)
+    try:
+        since = parse_date(args.since) if args.since else None
+        until = parse_date(args.until) + 86400 if args.until else None
+        results = archive.search(args.keywords, args.author, args.group, since, until, args.limit)
+    finally:
+        archive.close()
+
+    for article in results:
+        if args.json:
+            print(json.dumps(article, ensure_ascii=False))
+            continue
+        posted = datetime.fromtimestamp(article['posted_at']).strftime('%Y-%m-%d %H:%M') if article['posted_at'] else '?'
+        print(f"{posted}  {article['title']}")
+        print(f"    {article['作者'] or ''}  {article['url']}  {'、'.join(article['groups'])}")
+    if not args.json:
+        print(f"共 {len(results)} 篇")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import functools
+
+from ptt_cache import flush_caches
+from ptt_matcher import KeywordMatcher
+from ptt_metrics import ARTICLE_DETAILS_TOTAL, MATCH_SECONDS
+from ptt_startup import mark_walk_completed
+
+
+async def fetch_index_page(crawler, url, semaphore):
+    """Await a per-host rate limit token, then fetch and parse an index page in a worker thread
+
+    Returns (rows, prev_page_url) or None, reusing the rows of an unchanged
+    page like PTTCrawler.fetch_index_page.
+    """
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        if crawler.http.limiter:
+            await crawler.http.limiter.acquire_async(url)
+        return await loop.run_in_executor(
+            None, functools.partial(crawler.fetch_index_page, url, throttle=False)
+        )
+
+
+async def fetch_article_details(crawler, article, semaphore):
+    """Await a rate limit token, then fetch and parse article through the crawler's detail LRU
+
+    Details another group already loaded are returned without a token.
+    """
+    cached = crawler.article_cache.details.peek(article.article_id)
+    if cached is not None:
+        ARTICLE_DETAILS_TOTAL.inc(board=crawler.board, watchlist=crawler.watchlist, source='shared')
+        return cached
+
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        if crawler.http.limiter:
+            await crawler.http.limiter.acquire_async(article.url)
+        return await loop.run_in_executor(
+            None, functools.partial(crawler.fetch_article_details, article, throttle=False)
+        )
+
+
+async def process_articles_async(crawler, page_count, records, semaphore):
+    """Async counterpart of PTTCrawler.process_articles, fetching the page's new articles concurrently"""
+    loop = asyncio.get_running_loop()
+    new_articles = list(crawler.iter_new_articles(page_count, records))
+    details = await asyncio.gather(*(
+        fetch_article_details(crawler, record, semaphore) for record in new_articles
+    ))
+
+    # Consume in newest-first order so batches and notifications match the sync engine
+    enriched = [
+        record.with_details(article_data)
+        for record, article_data in zip(new_articles, details) if article_data is not None
+    ]
+    crawler.details_failed += len(new_articles) - len(enriched)
+    await loop.run_in_executor(None, crawler.consume, enriched)
+
+    return not crawler.found_old_article
+
+
+async def crawl_articles_async(crawler, semaphore, save_cache=True):
+    """Async counterpart of PTTCrawler.crawl_articles"""
+    loop = asyncio.get_running_loop()
+    if crawler.strategy == 'search':
+        # Search crawls are a few requests, they run as they are in a worker thread
+        return await loop.run_in_executor(None, crawler.crawl_search, save_cache)
+
+    current_url = f"{crawler.base_url}/bbs/{crawler.board}/index.html"
+    page_count = 0
+    crawler.start_crawl()
+
+    while page_count < crawler.max_pages:
+        page_count += 1
+        print(f"正在爬取第 {page_count} 頁...")
+        result = await fetch_index_page(crawler, current_url, semaphore)
+        if result is None:
+            crawler.fetch_failed = True
+            break
+
+        rows, prev_page_url = result
+        reached_watermark = crawler.track_page(rows)
+
+        keep_going = await process_articles_async(
+            crawler, page_count, crawler.filter_articles(rows), semaphore
+        )
+        if not keep_going or not prev_page_url:
+            break
+
+        if reached_watermark:
+            print("  已到達上次爬取的位置，停止翻頁")
+            break
+
+        current_url = prev_page_url
+
+    return await loop.run_in_executor(None, crawler.finish_crawl, save_cache)
+
+
+async def crawl_shared_index_async(crawlers, semaphore):
+    """Async counterpart of crawl_shared_index, one index walk fanned out to every crawler"""
+    if not crawlers:
+        return []
+
+    loop = asyncio.get_running_loop()
+    matcher = KeywordMatcher({
+        idx: (crawler.ticket_keywords, crawler.artist_keywords)
+        for idx, crawler in enumerate(crawlers) if crawler.strategy == 'index'
+    })
+    searches = {
+        idx: loop.run_in_executor(None, crawler.crawl_search, False)
+        for idx, crawler in enumerate(crawlers) if crawler.strategy == 'search'
+    }
+    indexed = [idx for idx in range(len(crawlers)) if idx not in searches]
+    reader = crawlers[indexed[0]] if indexed else crawlers[0]
+    current_url = f"{reader.base_url}/bbs/{reader.board}/index.html"
+    page_count = 0
+    for idx in indexed:
+        crawlers[idx].start_crawl()
+
+    active = [idx for idx in indexed if crawlers[idx].max_pages > 0]
+    while active:
+        page_count += 1
+        print(f"正在爬取第 {page_count} 頁...")
+        result = await fetch_index_page(reader, current_url, semaphore)
+        if result is None:
+            reader.fetch_failed = True
+            break
+
+        rows, prev_page_url = result
+        reached_watermark = {idx: crawlers[idx].track_page(rows) for idx in active}
+        with MATCH_SECONDS.time(board=reader.board):
+            row_matches = [matcher.match(row['title']) for row in rows]
+
+        keep_going = await asyncio.gather(*(
+            process_articles_async(
+                crawlers[idx], page_count,
+                crawlers[idx].filter_articles(rows, row_matches, idx), semaphore
+            ) for idx in active
+        ))
+        active = [
+            idx for idx, keep in zip(active, keep_going)
+            if keep and not reached_watermark[idx] and page_count < crawlers[idx].max_pages
+        ]
+
+        if not active and any(reached_watermark.values()):
+            print("  已到達上次爬取的位置，停止翻頁")
+        if not active or not prev_page_url:
+            break
+
+        current_url = prev_page_url
+
+    # The reader's failed fetch also cut short the walks still waiting for pages
+    for idx in active:
+        crawlers[idx].fetch_failed = crawlers[idx].fetch_failed or reader.fetch_failed
+
+    # Finish one by one, each crawler writes its output file, then the board cache is flushed once
+    results = []
+    for idx, crawler in enumerate(crawlers):
+        if idx in searches:
+            results.append(await searches[idx])
+        else:
+            results.append(await loop.run_in_executor(None, crawler.finish_crawl, False))
+    await loop.run_in_executor(None, flush_caches, [
+        (crawler.article_cache, crawler.cache_retention_days) for crawler in crawlers
+    ])
+    mark_walk_completed(crawlers)
+    return results
+
+
+async def run_crawlers_async(crawlers, shared_index=True, concurrency=8):
+    """Crawl every crawler as coroutines, at most concurrency requests in flight
+
+    Pacing comes from the per-host token buckets of the crawlers' HTTP
+    client, so throughput follows the configured request rate.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    if shared_index:
+        return await crawl_shared_index_async(crawlers, semaphore)
+    results = list(await asyncio.gather(*(
+        crawl_articles_async(crawler, semaphore, save_cache=False) for crawler in crawlers
+    )))
+    await asyncio.get_running_loop().run_in_executor(None, flush_caches, [
+        (crawler.article_cache, crawler.cache_retention_days) for crawler in crawlers
+    ])
+    return results
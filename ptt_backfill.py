@@ -0,0 +1,290 @@
+"""Backfill a board's history over a range of index pages
+
+Pages are processed oldest first in chunks. The index and article pages
+of a chunk are fetched by a thread pool through the crawlers' shared,
+rate-limited client and parsed in a process pool, so parsing no longer
+competes with the fetches for the GIL. Matching articles are written
+straight to the monthly JSON Lines file of their post month, added to the
+board's archive (see ptt_archive) and staged in the board cache; nothing
+of a finished chunk stays in memory.
+
+After every chunk the output files and the cache are flushed and the next
+page is saved to backfill_checkpoint_<start>-<end>.json in the board's
+data directory ("newest" for an open end), along with the articles whose
+pages failed to fetch. Those are fetched again once the range is walked;
+a run that still has failures keeps the checkpoint. Running the same
+range again resumes from there, and backfills of different ranges of a
+board, like the units of ptt_cluster, each keep their own checkpoint.
+Backfills send no LINE notifications.
+"""
+import concurrent.futures
+import functools
+import json
+import os
+import re
+import signal
+import threading
+import time
+from datetime import datetime
+
+from ptt_cache import article_id_timestamp
+from ptt_matcher import KeywordMatcher
+from ptt_metrics import PARSE_SECONDS
+from ptt_output import get_sink
+from ptt_parser import PARSERS, get_parser
+from ptt_record import ArticleRecord
+
+_worker_parsers = {}
+
+
+def _init_worker():
+    # Ctrl+C reaches the whole process group, the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _worker_parser(name):
+    parser = _worker_parsers.get(name)
+    if parser is None:
+        parser = _worker_parsers[name] = get_parser(name)
+    return parser
+
+
+def parse_index_worker(parser_name, base_url, content):
+    """Process pool task: parse an index page, return (result, seconds)"""
+    start = time.perf_counter()
+    result = _worker_parser(parser_name).parse_index(content, base_url)
+    return result, time.perf_counter() - start
+
+
+def parse_article_worker(parser_name, content):
+    """Process pool task: parse an article page, return (result, seconds)"""
+    start = time.perf_counter()
+    result = _worker_parser(parser_name).parse_article(content)
+    return result, time.perf_counter() - start
+
+
+class Backfill:
+    """Walks index pages start_page..end_page for the watchlists of crawlers on one board"""
+
+    def __init__(self, crawlers, start_page=1, end_page=None, chunk_pages=20, parse_workers=None, fetch_workers=8):
+        """
+        Parameters:
+        crawlers (list): PTTCrawler per watchlist, all on the same board
+        start_page (int): Oldest index page to walk
+        end_page (int): Newest index page to walk, None for the board's newest page
+        chunk_pages (int): Index pages fetched and checkpointed together
+        parse_workers (int): Parser processes, None for one per CPU, 0 to parse in this process
+        fetch_workers (int): Threads fetching pages, still paced by the client's rate limiter
+        """
+        if not crawlers:
+            raise ValueError("Backfill needs at least one crawler")
+        self.crawlers = crawlers
+        self.reader = crawlers[0]
+        self.start_page = max(1, start_page)
+        self.end_page = end_page
+        self.chunk_pages = max(1, chunk_pages)
+        self.parse_workers = parse_workers
+        self.fetch_workers = max(1, fetch_workers)
+        self.matcher = KeywordMatcher({
+            idx: (crawler.ticket_keywords, crawler.artist_keywords) for idx, crawler in enumerate(crawlers)
+        })
+        self.checkpoint_path = os.path.join(
+            self.reader.output_dir, f"backfill_checkpoint_{self.start_page}-{end_page or 'newest'}.json"
+        )
+        self.fetch_executor = None
+        self.parse_executor = None
+        self.articles_written = 0
+        self.failed = {}  # Article ID -> (row, matches) of the articles whose page failed to fetch
+
+    def newest_page(self):
+        """Number of the board's newest index page, None when it cannot be fetched"""
+        result = self.reader.fetch_index_page(f"{self.reader.base_url}/bbs/{self.reader.board}/index.html")
+        if result is None:
+            return None
+        match = re.search(r'/index(\d+)\.html$', result[1] or '')
+        return int(match.group(1)) + 1 if match else 1
+
+    def checkpoint_state(self):
+        return {
+            'board': self.reader.board,
+            'start_page': self.start_page,
+            'end_page': self.end_page,
+            'groups': [crawler.artist_keywords for crawler in self.crawlers],
+        }
+
+    def load_checkpoint(self):
+        """Return the saved checkpoint when it belongs to this same backfill, else None"""
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except:
+            return None
+        if {key: checkpoint.get(key) for key in self.checkpoint_state()} != self.checkpoint_state():
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, next_page, last_page):
+        """Atomically record the next page to walk; last_page pins the range when end_page was None"""
+        checkpoint = dict(self.checkpoint_state(), next_page=next_page, last_page=last_page,
+                          articles_written=self.articles_written, failed=self.failed)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def parse_many(self, kind, contents):
+        """Parse index or article pages in the process pool, or in this process without one, in order"""
+        if self.parse_executor is None:
+            parse = self.reader.parse_index_page if kind == 'index' else self.reader.parse_article_content
+            return [parse(content) for content in contents]
+
+        if kind == 'index':
+            worker = functools.partial(parse_index_worker, self.reader.parser.name, self.reader.base_url)
+        else:
+            worker = functools.partial(parse_article_worker, self.reader.parser.name)
+        results = []
+        for result, seconds in self.parse_executor.map(worker, contents, chunksize=4):
+            PARSE_SECONDS.observe(seconds, board=self.reader.board, kind=kind)
+            results.append(result)
+        return results
+
+    def process_chunk(self, first_page, last_page):
+        """Fetch, parse and write the matches of index pages first_page..last_page, False if an index page failed"""
+        board = self.reader.board
+        urls = [f"{self.reader.base_url}/bbs/{board}/index{page}.html" for page in range(first_page, last_page + 1)]
+        contents = list(self.fetch_executor.map(self.reader.get_page_content, urls))
+        if any(content is None for content in contents):
+            return False
+        pages = self.parse_many('index', contents)
+
+        # One entry per new article, with every watchlist it matches
+        candidates = {}
+        for rows, _ in pages:
+            for row in rows:
+                matches = self.matcher.match(row['title'])
+                if not matches:
+                    continue
+                article_id = row['url'].split('/')[-1].strip()
+                if article_id in candidates or article_id in self.failed or article_id in self.reader.article_cache:
+                    continue
+                candidates[article_id] = (row, sorted(matches))
+
+        self.fetch_articles(list(candidates.items()))
+        return True
+
+    def fetch_articles(self, articles):
+        """Fetch, parse and write (article ID, (row, matches)) pairs, keeping the failed ones in self.failed"""
+        contents = list(self.fetch_executor.map(
+            self.reader.get_page_content, [row['url'] for _, (row, _) in articles]
+        ))
+        fetched = []
+        for article, content in zip(articles, contents):
+            if content is None:
+                self.failed[article[0]] = article[1]
+            else:
+                self.failed.pop(article[0], None)
+                fetched.append((article, content))
+        details = self.parse_many('article', [content for _, content in fetched])
+
+        sinks = set()
+        archived = [[] for _ in self.crawlers]
+        crawled_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for ((article_id, (row, matches)), _), article_data in zip(fetched, details):
+            record = ArticleRecord.from_row(row).with_details(article_data).to_dict()
+            posted_at = article_id_timestamp(article_id)
+            month = datetime.fromtimestamp(posted_at).strftime("%Y%m") if posted_at else crawled_at[:7].replace('-', '')
+            for idx in matches:
+                sink = get_sink(self.crawlers[idx].output_filename(month))
+                sink.write(record)
+                sinks.add(sink)
+                archived[idx].append(record)
+            self.reader.article_cache.stage(article_id, crawled_at)
+            self.articles_written += 1
+
+        # Output first, then the cache, then the checkpoint: a crash in between repeats work, it never skips it
+        for sink in sinks:
+            sink.flush()
+        for crawler, records in zip(self.crawlers, archived):
+            crawler.archive.add_many(records, crawler.artist_keywords)
+        self.reader.article_cache.flush()
+
+    def retry_failed(self):
+        """Fetch the articles that failed earlier again, oldest first"""
+        if not self.failed:
+            return
+        print(f"重新抓取 {len(self.failed)} 篇先前抓取失敗的文章...")
+        self.fetch_articles(sorted(self.failed.items()))
+
+    def run(self, stop_event=None):
+        """Walk the range until done or stop_event is set, return True when the range was completed"""
+        stop_event = stop_event or threading.Event()
+        checkpoint = self.load_checkpoint()
+        if checkpoint is not None:
+            next_page, last_page = checkpoint['next_page'], checkpoint['last_page']
+            self.articles_written = checkpoint.get('articles_written', 0)
+            self.failed = checkpoint.get('failed', {})
+            print(f"從上次中斷的第 {next_page} 頁繼續回補（已寫入 {self.articles_written} 篇）")
+        else:
+            next_page, last_page = self.start_page, self.end_page
+            if last_page is None:
+                last_page = self.newest_page()
+                if last_page is None:
+                    print("無法取得看板最新頁數")
+                    return False
+        print(f"回補 {self.reader.board} 第 {next_page} 至 {last_page} 頁...")
+
+        self.fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.fetch_workers)
+        if self.parse_workers != 0 and self.reader.parser.name in PARSERS:
+            self.parse_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.parse_workers, initializer=_init_worker
+            )
+        try:
+            while next_page <= last_page and not stop_event.is_set():
+                chunk_end = min(last_page, next_page + self.chunk_pages - 1)
+                started = time.monotonic()
+                if not self.process_chunk(next_page, chunk_end):
+                    print(f"第 {next_page} 至 {chunk_end} 頁抓取失敗，重新執行即可從此處繼續")
+                    self.save_checkpoint(next_page, last_page)
+                    return False
+                next_page = chunk_end + 1
+                self.save_checkpoint(next_page, last_page)
+                print(f"  已完成第 {chunk_end} 頁，共寫入 {self.articles_written} 篇（{time.monotonic() - started:.1f} 秒）")
+            if next_page > last_page and not stop_event.is_set():
+                self.retry_failed()
+        finally:
+            self.fetch_executor.shutdown()
+            if self.parse_executor is not None:
+                self.parse_executor.shutdown()
+                self.parse_executor = None
+
+        if next_page <= last_page:
+            print(f"回補已暫停於第 {next_page} 頁，重新執行即可繼續")
+            return False
+        if self.failed:
+            self.save_checkpoint(next_page, last_page)
+            print(f"有 {len(self.failed)} 篇文章內容抓取失敗，重新執行即可重試")
+            return False
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        print(f"回補完成，共寫入 {self.articles_written} 篇文章")
+        return True
+
+
+def run_backfill(crawlers, start_page=1, end_page=None, **options):
+    """Run a Backfill until it completes or SIGTERM/SIGINT stops it after the current chunk"""
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n收到 {signal.Signals(signum).name}，完成目前這批頁面後暫停...")
+        stop_event.set()
+
+    # Signal handlers can only be installed from the main thread
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, request_stop)
+    try:
+        return Backfill(crawlers, start_page, end_page, **options).run(stop_event)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
@@ -0,0 +1,236 @@
+"""Crawl several boards from one process under a shared request budget
+
+The boards and their watchlists are read from a JSON file (see
+boards.example.json):
+
+    {
+        "host_rates": {"www.ptt.cc": [0.5, 1]},
+        "max_host_rates": {"www.ptt.cc": 1.0},
+        "max_in_flight": 4,
+        "adaptive": true,
+        "boards": [
+            {"board": "Drama-Ticket", "ticket_keywords": ["售"], "max_pages": 30,
+             "artists_groups": [["gracie"], ["babymonster", "寶怪"]]},
+            {"board": "BabyMother", "artists_groups": [["推車"]]}
+        ]
+    }
+
+An optional "base_url" / "line_api_url" points the crawlers at local
+stand-ins. The file is read through ptt_config, which keeps the checked
+config and compiled matchers in a snapshot next to it.
+
+Every board is walked with crawl_shared_index, all boards at the same
+time and through one HttpClient. Its per-host token bucket and in-flight
+cap are the budget of the whole process. Requests are tagged with their
+board and boards take turns for tokens, so a board walking many pages
+cannot hold back the others. With adaptive (the default) the rate and
+in-flight cap follow PTT's answers, see AimdController in ptt_http,
+without going above host_rates unless max_host_rates allows more.
+After each round the requests, failures and fetch time of every board
+are printed, next to its share of the budget.
+
+Usage:
+    python ptt_boards.py [once|watch] [--config boards.json] [--min-interval 30] [--max-interval 600] [--metrics-port 9108] [--metrics-host 127.0.0.1] [--metrics-json metrics.json]
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+
+from ptt_config import build_limiter, load_watchlists
+from ptt_crawler_multiple import build_shared_matcher, crawl_shared_index, create_crawlers, print_results
+from ptt_http import HttpClient
+from ptt_metrics import FETCH_SECONDS, REQUESTS_TOTAL, dump_json, serve
+from ptt_notify import close_outboxes
+from ptt_output import close_sinks
+from ptt_watch import AdaptiveScheduler, run_watch
+
+
+def board_usage():
+    """Requests, failed requests and fetch seconds of every board so far, from the crawl metrics"""
+    usage = {}
+    for sample in REQUESTS_TOTAL.snapshot():
+        labels = sample['labels']
+        entry = usage.setdefault(labels['board'], {'requests': 0, 'errors': 0, 'seconds': 0.0})
+        entry['requests'] += sample['value']
+        # 404 ends a board search, it is not a failure
+        if labels['status'] == 'error' or labels['status'] == '429' or labels['status'].startswith('5'):
+            entry['errors'] += sample['value']
+    for sample in FETCH_SECONDS.snapshot():
+        entry = usage.setdefault(sample['labels']['board'], {'requests': 0, 'errors': 0, 'seconds': 0.0})
+        entry['seconds'] += sample['sum']
+    return usage
+
+
+class MultiBoardRunner:
+    """Crawlers of every configured board, sharing one HTTP client, its rate budget and one thread pool"""
+
+    def __init__(self, config, line_token, line_user_id, crawler_options=None, matchers=None):
+        """
+        Parameters:
+        config (dict): Boards file contents, see ptt_config.load_config
+        line_token (str): LINE channel access token
+        line_user_id (str): LINE user receiving the notifications
+        crawler_options (dict): Extra PTTCrawler options, e.g. base_url
+        matchers (dict): Prebuilt KeywordMatcher per board, see ptt_config.load_watchlists
+        """
+        crawler_options = dict(crawler_options or {})
+        for key in ('base_url', 'line_api_url'):
+            if key in config:
+                crawler_options.setdefault(key, config[key])
+        matchers = matchers or {}
+        self.http = crawler_options.pop('http', None) or HttpClient(
+            cookies=[('over18', '1', '.ptt.cc')],
+            limiter=build_limiter(config)
+        )
+        self.boards = {}
+        for entry in config['boards']:
+            crawlers = create_crawlers(
+                entry['artists_groups'], entry['board'], entry['ticket_keywords'], entry['max_pages'],
+                line_token, line_user_id, http=self.http, **crawler_options
+            )
+            matcher = matchers.get(entry['board']) or build_shared_matcher(crawlers)
+            self.boards[entry['board']] = (crawlers, matcher)
+        # Boards crawl side by side, their crawlers fan out on the shared pool
+        self.board_executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.boards))
+        self.executor = concurrent.futures.ThreadPoolExecutor()
+
+    def crawl_board(self, board):
+        """One shared index walk of a board, return (results, whether a watermark advanced)"""
+        crawlers, matcher = self.boards[board]
+        watermarks = [crawler.load_watermark() for crawler in crawlers]
+        results = crawl_shared_index(crawlers, self.executor, matcher)
+        active = any(
+            new is not None and (old is None or new > old)
+            for old, new in zip(watermarks, (crawler.load_watermark() for crawler in crawlers))
+        )
+        return results, active
+
+    def run_once(self, boards=None):
+        """Crawl boards (default: all) concurrently, return {board: (results, active)} and print the budget split"""
+        boards = list(self.boards) if boards is None else boards
+        before = board_usage()
+        futures = {board: self.board_executor.submit(self.crawl_board, board) for board in boards}
+        outcomes = {}
+        for board, future in futures.items():
+            try:
+                outcomes[board] = future.result()
+            except Exception as e:
+                print(f"{board} 爬取發生錯誤: {str(e)}")
+                outcomes[board] = ([], False)
+        for board in boards:
+            print(f"\n[{board}]", end='')
+            print_results(outcomes[board][0])
+        self.print_usage(boards, before)
+        return outcomes
+
+    def print_usage(self, boards, before):
+        """Print each board's requests since before, and their share of all requests"""
+        after = board_usage()
+        empty = {'requests': 0, 'errors': 0, 'seconds': 0.0}
+        usage = {
+            board: {key: after.get(board, empty)[key] - before.get(board, empty)[key] for key in empty}
+            for board in boards
+        }
+        total = sum(entry['requests'] for entry in usage.values())
+        print("\n-----各看板請求統計-----")
+        for board, entry in usage.items():
+            share = entry['requests'] * 100 / total if total else 0
+            print(f"{board}：請求 {entry['requests']} 次（{share:.0f}%），失敗 {entry['errors']} 次，抓取耗時 {entry['seconds']:.1f} 秒")
+
+    def close(self):
+        self.board_executor.shutdown()
+        self.executor.shutdown()
+        for crawlers, _ in self.boards.values():
+            for crawler in crawlers:
+                crawler.close()
+        close_sinks()
+        close_outboxes()
+        self.http.close()
+
+
+class BoardScheduler:
+    """An AdaptiveScheduler per board behind the scheduler interface of run_watch
+
+    Every board keeps its own interval; a tick crawls the boards that are
+    due, oldest due first, and update returns the time until the next one.
+    """
+
+    def __init__(self, boards, min_interval=30.0, max_interval=600.0):
+        self.schedulers = {board: AdaptiveScheduler(min_interval, max_interval) for board in boards}
+        self.due = {board: 0.0 for board in boards}
+
+    def due_boards(self):
+        now = time.monotonic()
+        return sorted((board for board, due in self.due.items() if due <= now), key=self.due.get)
+
+    def record(self, board, active):
+        self.due[board] = time.monotonic() + self.schedulers[board].update(active)
+
+    def update(self, active):
+        return max(0.0, min(self.due.values()) - time.monotonic())
+
+
+def watch_boards(runner, scheduler):
+    """Poll every board on its own interval until SIGTERM/SIGINT, see run_watch"""
+
+    def crawl_once():
+        boards = scheduler.due_boards()
+        print(f"爬取看板：{'、'.join(boards)}")
+        outcomes = runner.run_once(boards)
+        for board, (_, active) in outcomes.items():
+            scheduler.record(board, active)
+        return any(active for _, active in outcomes.values())
+
+    run_watch(crawl_once, runner.close, scheduler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PTT 多看板票券文章爬蟲")
+    parser.add_argument('mode', nargs='?', choices=['once', 'watch'], default='once',
+                        help="once：每個看板爬取一次（預設）；watch：持續監看所有看板")
+    parser.add_argument('--config', default='boards.json', help="看板與關注清單設定檔")
+    parser.add_argument('--min-interval', type=float, default=30, help="watch 模式每個看板最短爬取間隔（秒）")
+    parser.add_argument('--max-interval', type=float, default=600, help="watch 模式每個看板最長爬取間隔（秒）")
+    parser.add_argument('--metrics-port', type=int, help="在此埠提供 Prometheus 格式的 /metrics")
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help="/metrics 綁定的位址，預設只允許本機存取，0.0.0.0 表示開放所有網路介面")
+    parser.add_argument('--metrics-json', help="結束時將各階段計時與計數寫入此 JSON 檔")
+    args = parser.parse_args()
+
+    if not os.environ.get("LINE_TOKEN") or not os.environ.get("LINE_USER_ID"):
+        # Load environment variables from .env file
+        from dotenv import load_dotenv
+        load_dotenv()
+    LINE_TOKEN = os.environ.get("LINE_TOKEN")
+    LINE_USER_ID = os.environ.get("LINE_USER_ID")
+    if not LINE_TOKEN or not LINE_USER_ID:
+        print("錯誤：未設定 LINE_TOKEN 或 LINE_USER_ID 環境變數")
+        return
+
+    try:
+        config, matchers = load_watchlists(args.config)
+    except (OSError, ValueError) as e:
+        print(f"錯誤：無法讀取設定檔 {args.config}：{str(e)}")
+        return
+
+    if args.metrics_port:
+        serve(args.metrics_port, args.metrics_host)
+        print(f"Metrics 位址：http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+    runner = MultiBoardRunner(config, LINE_TOKEN, LINE_USER_ID, matchers=matchers)
+    if args.mode == 'watch':
+        watch_boards(runner, BoardScheduler(runner.boards, args.min_interval, args.max_interval))
+    else:
+        try:
+            runner.run_once()
+        finally:
+            runner.close()
+
+    if args.metrics_json:
+        dump_json(args.metrics_json)
+        print(f"效能指標已保存至 {args.metrics_json}")
+
+
+if __name__ == '__main__':
+    main()
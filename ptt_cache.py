@@ -0,0 +1,394 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+from ptt_metrics import CACHE_FLUSH_SECONDS
+
+
+def article_id_timestamp(article_id):
+    """Post time encoded in a PTT article ID (M.<unix_ts>.A.xxx), None if the ID has no timestamp"""
+    parts = article_id.split('.')
+    if len(parts) > 2 and parts[0] == 'M' and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+class ArticleDetailCache:
+    """In-memory LRU of parsed article details keyed by article ID
+
+    Concurrent lookups of the same article share a single load, so an
+    article matching several watchlists is fetched and parsed once. Failed
+    loads (None or an exception) are not kept.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, article_id):
+        """Return the loaded details of article_id, or None when missing or still loading"""
+        with self.lock:
+            entry = self.entries.get(article_id)
+        if entry is None or not entry.done() or entry.exception():
+            return None
+        return entry.result()
+
+    def get_or_load(self, article_id, loader):
+        """Return the details of article_id, calling loader() unless they are cached or being loaded"""
+        # concurrent.futures pulls in logging, runs that fetch no article never need it
+        from concurrent.futures import Future
+
+        with self.lock:
+            entry = self.entries.get(article_id)
+            if entry is not None:
+                self.entries.move_to_end(article_id)
+                self.hits += 1
+                owner = False
+            else:
+                entry = self.entries[article_id] = Future()
+                self.misses += 1
+                owner = True
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+
+        if owner:
+            try:
+                value = loader()
+            except BaseException as e:
+                self._discard(article_id, entry)
+                entry.set_exception(e)
+                raise
+            if value is None:
+                self._discard(article_id, entry)
+            entry.set_result(value)
+        return entry.result()
+
+    def _discard(self, article_id, entry):
+        with self.lock:
+            if self.entries.get(article_id) is entry:
+                del self.entries[article_id]
+
+
+class ArticleCache(ABC):
+    """Interface of the crawled-article cache, keyed by PTT article ID
+
+    Values are crawl times formatted as "%Y-%m-%d %H:%M:%S", like the old
+    article_cache.json. Besides article IDs the cache keeps small metadata
+    values such as the board watermark.
+    """
+
+    def __contains__(self, article_id):
+        return self.contains(article_id)
+
+    @abstractmethod
+    def snapshot(self):
+        """Opaque marker of the current contents, see contains"""
+
+    @abstractmethod
+    def contains(self, article_id, snapshot=None):
+        """Check membership, ignoring entries added after snapshot when given"""
+
+    @abstractmethod
+    def get(self, article_id):
+        """Return the crawl time of article_id, or None"""
+
+    @abstractmethod
+    def add_many(self, items):
+        """Insert (article_id, crawled_at) pairs, keeping existing entries"""
+
+    @abstractmethod
+    def stage(self, article_id, crawled_at):
+        """Buffer an insert until the next flush"""
+
+    @abstractmethod
+    def flush(self, retention_days=None):
+        """Insert the staged articles, then evict when retention_days is given"""
+
+    @abstractmethod
+    def evict(self, retention_days, watermark=None):
+        """Drop entries older than retention_days, return how many were removed
+
+        With a watermark the age is measured from the watermark's post time,
+        otherwise from now by crawl time.
+        """
+
+    @abstractmethod
+    def get_meta(self, key, default=None):
+        """Return the metadata value of key, or default"""
+
+    @abstractmethod
+    def set_meta(self, key, value):
+        """Store a JSON-serializable metadata value"""
+
+    @abstractmethod
+    def set_meta_max(self, key, value):
+        """Set key to value unless it already holds a value at least as large, return the stored value"""
+
+    @abstractmethod
+    def get_page(self, url):
+        """Return the last response of an index page as a dict (etag, last_modified, body_hash, parsed), or None"""
+
+    @abstractmethod
+    def set_page(self, url, etag, last_modified, body_hash, parsed):
+        """Remember the validators, body hash and parsed result of an index page response"""
+
+    def close(self):
+        pass
+
+
+class SqliteArticleCache(ArticleCache):
+    """ArticleCache in a SQLite database in WAL mode
+
+    Membership checks are primary-key lookups and new articles are inserted
+    incrementally, so a run's cache I/O no longer depends on the total
+    history. Several processes can open the same file; within a process
+    open_article_cache hands every crawler of a board the same instance,
+    whose staged inserts are written by a single flush. The instance also
+    carries the board's in-memory ArticleDetailCache as details.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS articles (
+            article_id TEXT PRIMARY KEY,
+            crawled_at TEXT NOT NULL,
+            posted_at INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS articles_posted_at ON articles (posted_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body_hash TEXT NOT NULL,
+            parsed TEXT NOT NULL,
+            fetched_at INTEGER NOT NULL
+        );
+    '''
+
+    def __init__(self, path, flush_every=500):
+        """
+        Parameters:
+        path (str): SQLite database file
+        flush_every (int): Staged inserts that trigger a flush without waiting for the end of the run
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.staged = {}
+        self.staged_lock = threading.Lock()
+        self.details = ArticleDetailCache()
+        self.users = 1
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+
+    def snapshot(self):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM articles').fetchone()[0]
+
+    def contains(self, article_id, snapshot=None):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT rowid FROM articles WHERE article_id = ?', (article_id,)
+            ).fetchone()
+        return row is not None and (snapshot is None or row[0] <= snapshot)
+
+    def get(self, article_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT crawled_at FROM articles WHERE article_id = ?', (article_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add_many(self, items):
+        rows = [
+            (article_id, crawled_at, article_id_timestamp(article_id))
+            for article_id, crawled_at in items
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO articles (article_id, crawled_at, posted_at) VALUES (?, ?, ?)',
+                    rows
+                )
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def stage(self, article_id, crawled_at):
+        with self.staged_lock:
+            self.staged[article_id] = crawled_at
+            full = len(self.staged) >= self.flush_every
+        if full:
+            # Long runs write in chunks; the rows land after every crawler's snapshot so they still count as new
+            self.flush()
+
+    def flush(self, retention_days=None):
+        with self.staged_lock:
+            staged, self.staged = self.staged, {}
+        # Labelled with the board's data directory, e.g. ptt_Drama-Ticket_data
+        with CACHE_FLUSH_SECONDS.time(cache=os.path.basename(os.path.dirname(self.path))):
+            self.add_many(staged.items())
+            if retention_days is not None:
+                self.evict(retention_days, self.get_meta('watermark'))
+        return len(staged)
+
+    def evict(self, retention_days, watermark=None):
+        retention = int(retention_days * 86400)
+        crawled_cutoff = datetime.fromtimestamp(time.time() - retention).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            if watermark is not None:
+                cursor = self.conn.execute(
+                    'DELETE FROM articles WHERE posted_at < ? OR (posted_at IS NULL AND crawled_at < ?)',
+                    (watermark - retention, crawled_cutoff)
+                )
+            else:
+                cursor = self.conn.execute(
+                    'DELETE FROM articles WHERE crawled_at < ?', (crawled_cutoff,)
+                )
+            removed = cursor.rowcount
+            # Index pages not polled within the retention period are not worth a conditional request
+            self.conn.execute('DELETE FROM pages WHERE fetched_at < ?', (int(time.time()) - retention,))
+        return removed
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+
+    def set_meta_max(self, key, value):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            current = json.loads(row[0]) if row else None
+            if current is not None and current >= value:
+                return current
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+            return value
+
+    def get_page(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT etag, last_modified, body_hash, parsed FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, parsed = row
+        return {'etag': etag, 'last_modified': last_modified, 'body_hash': body_hash, 'parsed': json.loads(parsed)}
+
+    def set_page(self, url, etag, last_modified, body_hash, parsed):
+        with self.lock:
+            self.conn.execute(
+                '''INSERT OR REPLACE INTO pages (url, etag, last_modified, body_hash, parsed, fetched_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (url, etag, last_modified, body_hash, json.dumps(parsed, ensure_ascii=False), int(time.time()))
+            )
+
+    def migrate_json(self, cache_file, watermark_file=None):
+        """One-time import of article_cache.json (and watermark.json)
+
+        Imported files are renamed with a .migrated suffix so the import is
+        not repeated and the old data stays on disk as a backup.
+        """
+        if not os.path.exists(cache_file) and not (watermark_file and os.path.exists(watermark_file)):
+            return 0
+
+        imported = 0
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    legacy_cache = json.load(f)
+            except:
+                legacy_cache = {}
+            self.add_many(legacy_cache.items())
+            imported = len(legacy_cache)
+            self._retire(cache_file)
+
+        if watermark_file and os.path.exists(watermark_file):
+            try:
+                with open(watermark_file, 'r', encoding='utf-8') as f:
+                    watermark = json.load(f).get('watermark')
+            except:
+                watermark = None
+            if watermark is not None and (self.get_meta('watermark') or 0) < watermark:
+                self.set_meta('watermark', watermark)
+            self._retire(watermark_file)
+
+        return imported
+
+    def _retire(self, path):
+        try:
+            os.replace(path, path + '.migrated')
+        except OSError:
+            pass  # Another crawler migrated it first
+
+    def close(self):
+        """Drop one user of the shared instance, flushing and closing the connection after the last"""
+        with _caches_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if _caches.get(self.path) is self:
+                del _caches[self.path]
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def flush_caches(caches):
+    """Flush each distinct cache of (cache, retention_days) pairs once"""
+    flushed = set()
+    for cache, retention_days in caches:
+        if id(cache) not in flushed:
+            flushed.add(id(cache))
+            cache.flush(retention_days)
+
+
+def open_article_cache(output_dir):
+    """Return the process-wide cache of a board, importing the legacy JSON files on first use
+
+    Every caller gets the same instance and should call close once.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(output_dir, 'article_cache.sqlite3'))
+    with _caches_lock:
+        cache = _caches.get(path)
+        # A cache whose file was moved away or deleted since it was opened is replaced
+        if cache is not None and os.path.exists(path):
+            cache.users += 1
+            return cache
+        cache = _caches[path] = SqliteArticleCache(path)
+        cache.migrate_json(
+            os.path.join(output_dir, 'article_cache.json'),
+            os.path.join(output_dir, 'watermark.json')
+        )
+        return cache
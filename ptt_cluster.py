@@ -0,0 +1,481 @@
+"""Split crawl work between workers on several machines through leases in a shared store
+
+Every worker reads the same boards file (see ptt_boards) and opens the
+same LeaseStore, a SQLite file on storage all machines can reach. Work
+is cut into units:
+
+    board     one shared index walk of a board with all its watchlists,
+              one unit per board and round (--interval seconds)
+    backfill  a page range of a board, see ptt_backfill; added with the
+              backfill command and split into --unit-pages pages each
+
+A worker takes the oldest open unit, board units before backfills, with
+a lease of --lease seconds and renews it from a background thread while the unit runs. A worker that
+crashes stops renewing, so its unit is taken again by another worker
+once the lease has expired; after max_attempts leases the unit is given
+up. A new round supersedes the open board units of older rounds, its
+walk covers them.
+
+Articles are notified once across the cluster, and at least once when a
+worker dies: before queueing a notification the crawler claims (board,
+article, watchlist) in the store and only the worker whose claim wins
+notifies. Once the article is in the node's LINE outbox, whose pending
+file keeps it until LINE accepted it, the claim is marked notified. A
+claim never marked notified, because its worker crashed in between,
+expires after --lease seconds and is won again by the next worker
+walking the article. A push LINE rejects outright (a 4xx other than
+429) is dropped by the outbox, as it would be rejected on any worker.
+The watchlists' watermarks are shared through the
+store as well, so a worker crawling a board for the first time stops
+where the cluster's last walk stopped. Article caches, output files and
+archives stay local to each worker.
+
+Usage:
+    python ptt_cluster.py worker --store /mnt/shared/ptt_cluster.sqlite3 [--config boards.json] [--interval 300] [--lease 120] [--worker-id NAME]
+    python ptt_cluster.py backfill --store /mnt/shared/ptt_cluster.sqlite3 --board Drama-Ticket --start-page 1 --end-page 5000 [--unit-pages 500]
+    python ptt_cluster.py status --store /mnt/shared/ptt_cluster.sqlite3
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from ptt_metrics import CLUSTER_UNITS_TOTAL, NOTIFY_CLAIMS_TOTAL, dump_json, serve
+
+
+class LeaseStore:
+    """Work units, their leases, notification claims and shared watermarks in one SQLite file
+
+    The file keeps SQLite's rollback journal: WAL needs shared memory,
+    which workers on different machines do not have. Every change is a
+    short BEGIN IMMEDIATE transaction, so taking a lease is a single
+    compare-and-set under SQLite's file lock.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS units (
+            unit_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            board TEXT NOT NULL,
+            spec TEXT NOT NULL,
+            owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            done_at REAL,
+            result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS units_open ON units (done_at, created_at);
+        CREATE TABLE IF NOT EXISTS claims (
+            board TEXT NOT NULL,
+            article_id TEXT NOT NULL,
+            watchlist TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            claimed_at REAL NOT NULL,
+            notified_at REAL,
+            PRIMARY KEY (board, article_id, watchlist)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    '''
+
+    def __init__(self, path, owner=None, lease_seconds=120.0, max_attempts=5, claim_seconds=None):
+        """
+        Parameters:
+        path (str): SQLite file shared by the workers
+        owner (str): Name of this worker, defaults to host:pid
+        lease_seconds (float): Lease length; a unit is renewed every third of it
+        max_attempts (int): Leases taken on a unit before it is given up
+        claim_seconds (float): Age at which a claim not yet marked notified may be won again, defaults to lease_seconds
+        """
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.claim_seconds = lease_seconds if claim_seconds is None else claim_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def add_units(self, units):
+        """Add (unit_id, kind, board, spec) units, ignoring IDs already present; return the number added"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.executemany(
+                'INSERT OR IGNORE INTO units (unit_id, kind, board, spec, created_at) VALUES (?, ?, ?, ?, ?)',
+                [(unit_id, kind, board, json.dumps(spec), now) for unit_id, kind, board, spec in units]
+            )
+            return cursor.rowcount
+
+    def add_round(self, boards, round_id):
+        """Add the board units of a round and supersede the unleased open ones of older rounds"""
+        now = time.time()
+        unit_ids = {board: f"board:{board}:{round_id}" for board in boards}
+        added = self.add_units((unit_id, 'board', board, {}) for board, unit_id in unit_ids.items())
+        with self.transaction() as conn:
+            for board, unit_id in unit_ids.items():
+                conn.execute(
+                    '''UPDATE units SET done_at = ?, result = 'superseded'
+                       WHERE kind = 'board' AND board = ? AND unit_id != ? AND done_at IS NULL AND lease_until < ?''',
+                    (now, board, unit_id, now)
+                )
+        return added
+
+    def acquire(self, boards=None):
+        """Lease the next open unit (of boards, default any) and return it as a dict, None when there is none"""
+        now = time.time()
+        query = 'SELECT unit_id, kind, board, spec, attempts FROM units WHERE done_at IS NULL AND lease_until < ?'
+        params = [now]
+        if boards:
+            query += f" AND board IN ({', '.join('?' for _ in boards)})"
+            params.extend(boards)
+        # Board walks first, so notifications do not wait behind long backfills
+        query += " ORDER BY kind != 'board', created_at, unit_id"
+        with self.transaction() as conn:
+            for unit_id, kind, board, spec, attempts in conn.execute(query, params).fetchall():
+                if attempts >= self.max_attempts:
+                    # Every lease on it ended without the unit finishing, stop handing it out
+                    conn.execute(
+                        "UPDATE units SET done_at = ?, result = 'abandoned' WHERE unit_id = ?", (now, unit_id)
+                    )
+                    continue
+                conn.execute(
+                    'UPDATE units SET owner = ?, lease_until = ?, attempts = attempts + 1 WHERE unit_id = ?',
+                    (self.owner, now + self.lease_seconds, unit_id)
+                )
+                return {'unit_id': unit_id, 'kind': kind, 'board': board, 'spec': json.loads(spec),
+                        'attempt': attempts + 1}
+        return None
+
+    def renew(self, unit_id):
+        """Extend this worker's lease on unit_id, False when the lease was lost to another worker"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE units SET lease_until = ? WHERE unit_id = ? AND owner = ? AND done_at IS NULL',
+                (time.time() + self.lease_seconds, unit_id, self.owner)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id, result='done'):
+        """Close unit_id if this worker still holds it"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE units SET done_at = ?, result = ?, lease_until = 0 WHERE unit_id = ? AND owner = ? AND done_at IS NULL',
+                (time.time(), result, unit_id, self.owner)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, unit_id):
+        """Give unit_id back without finishing it, any worker may take it again right away"""
+        with self.transaction() as conn:
+            conn.execute(
+                'UPDATE units SET lease_until = 0 WHERE unit_id = ? AND owner = ? AND done_at IS NULL',
+                (unit_id, self.owner)
+            )
+
+    def claim(self, board, article_id, watchlist):
+        """Claim the notification of an article for a watchlist, True when this worker should notify
+
+        The first worker asking wins, unless its claim was never marked
+        notified and is older than claim_seconds: then the next worker
+        asking takes it over.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO claims (board, article_id, watchlist, owner, claimed_at) VALUES (?, ?, ?, ?, ?)',
+                (board, article_id, watchlist, self.owner, now)
+            )
+            result = 'won' if cursor.rowcount == 1 else 'taken'
+            if result == 'taken':
+                cursor = conn.execute(
+                    '''UPDATE claims SET owner = ?, claimed_at = ?
+                       WHERE board = ? AND article_id = ? AND watchlist = ? AND notified_at IS NULL AND claimed_at < ?''',
+                    (self.owner, now, board, article_id, watchlist, now - self.claim_seconds)
+                )
+                if cursor.rowcount == 1:
+                    result = 'expired'
+        NOTIFY_CLAIMS_TOTAL.inc(board=board, result=result)
+        return result != 'taken'
+
+    def mark_notified(self, board, article_id, watchlist):
+        """Record that this worker's claim reached its LINE outbox, so it never expires; False when the claim was lost"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                '''UPDATE claims SET notified_at = ?
+                   WHERE board = ? AND article_id = ? AND watchlist = ? AND owner = ?''',
+                (time.time(), board, article_id, watchlist, self.owner)
+            )
+            return cursor.rowcount == 1
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta_max(self, key, value):
+        """Raise meta key to value unless it is already at least value, return the stored value"""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            current = json.loads(row[0]) if row else None
+            if current is not None and current >= value:
+                return current
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+            return value
+
+    def evict(self, retention_days):
+        """Drop finished units and claims older than the retention period"""
+        cutoff = time.time() - retention_days * 86400
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM units WHERE done_at < ?', (cutoff,))
+            conn.execute('DELETE FROM claims WHERE claimed_at < ?', (cutoff,))
+
+    def status(self):
+        """Units by kind and state (open, leased or their result)"""
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                '''SELECT kind, CASE WHEN done_at IS NOT NULL THEN result
+                                     WHEN lease_until >= ? THEN 'leased' ELSE 'open' END, COUNT(*)
+                   FROM units GROUP BY 1, 2 ORDER BY 1, 2''',
+                (now,)
+            ).fetchall()
+        return rows
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class LeaseKeeper:
+    """Renews the lease of a unit from a daemon thread while the unit runs
+
+    is_set() turns True once the lease was lost or stop_event is set, so a
+    keeper can be passed to Backfill.run as its stop event.
+    """
+
+    def __init__(self, store, unit_id, stop_event=None):
+        self.store = store
+        self.unit_id = unit_id
+        self.stop_event = stop_event or threading.Event()
+        self.lost = threading.Event()
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self._renew, name=f"lease-{unit_id}", daemon=True)
+
+    def _renew(self):
+        interval = self.store.lease_seconds / 3
+        while not self.finished.wait(interval):
+            try:
+                renewed = self.store.renew(self.unit_id)
+            except sqlite3.Error as e:
+                # The lease runs on until it expires, try again at the next beat
+                print(f"無法續約工作 {self.unit_id}：{str(e)}")
+                continue
+            if not renewed:
+                print(f"工作 {self.unit_id} 的租約已被其他節點取得")
+                self.lost.set()
+                return
+
+    def is_set(self):
+        return self.lost.is_set() or self.stop_event.is_set()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finished.set()
+        self.thread.join()
+
+
+class ClusterWorker:
+    """Runs the units of a LeaseStore with the crawlers of a MultiBoardRunner"""
+
+    def __init__(self, store, runner, interval=300.0, parse_workers=None):
+        """
+        Parameters:
+        store (LeaseStore): Shared store of units and claims
+        runner (MultiBoardRunner): Crawlers of every board, with the store as their notify_claims
+        interval (float): Seconds per round of board units
+        parse_workers (int): Parser processes of backfill units, see ptt_backfill
+        """
+        self.store = store
+        self.runner = runner
+        self.interval = interval
+        self.parse_workers = parse_workers
+        self.stop_event = threading.Event()
+
+    def current_round(self):
+        return int(time.time() // self.interval)
+
+    def sync_watermarks(self, board, publish=False):
+        """Raise the board's local watermarks to the cluster's, or with publish the cluster's to the local ones"""
+        crawlers, _ = self.runner.boards[board]
+        for crawler in crawlers:
+            key = f"{board}:{crawler.watermark_key}"
+            if publish:
+                local = crawler.load_watermark()
+                if local is not None:
+                    self.store.set_meta_max(key, local)
+            else:
+                shared = self.store.get_meta(key)
+                if shared is not None:
+                    crawler.article_cache.set_meta_max(crawler.watermark_key, shared)
+
+    def run_unit(self, unit, keeper):
+        """Run one leased unit, return True when a board walk saw new posts"""
+        board = unit['board']
+        if unit['kind'] == 'board':
+            self.sync_watermarks(board)
+            _, active = self.runner.crawl_board(board)
+            self.sync_watermarks(board, publish=True)
+            return active
+
+        from ptt_backfill import Backfill
+
+        crawlers, _ = self.runner.boards[board]
+        spec = unit['spec']
+        backfill = Backfill(crawlers, spec['start_page'], spec['end_page'], parse_workers=self.parse_workers)
+        if not backfill.run(keeper):
+            raise RuntimeError(f"backfill {spec['start_page']}-{spec['end_page']} stopped early")
+        return False
+
+    def run_available(self):
+        """Add this round's board units, then run units until none is left open; return whether a walk saw new posts"""
+        self.store.add_round(self.runner.boards, self.current_round())
+        active = False
+        while not self.stop_event.is_set():
+            # Units of boards missing from this worker's boards file are left to the workers that have them
+            unit = self.store.acquire(list(self.runner.boards))
+            if unit is None:
+                break
+            print(f"取得工作 {unit['unit_id']}（第 {unit['attempt']} 次）")
+            with LeaseKeeper(self.store, unit['unit_id'], self.stop_event) as keeper:
+                try:
+                    active = self.run_unit(unit, keeper) or active
+                except Exception as e:
+                    print(f"工作 {unit['unit_id']} 發生錯誤: {str(e)}")
+                    self.store.release(unit['unit_id'])
+                    CLUSTER_UNITS_TOTAL.inc(kind=unit['kind'], result='failed')
+                    continue
+            if self.store.complete(unit['unit_id']):
+                CLUSTER_UNITS_TOTAL.inc(kind=unit['kind'], result='done')
+            else:
+                CLUSTER_UNITS_TOTAL.inc(kind=unit['kind'], result='lost')
+        return active
+
+    def update(self, active):
+        """Scheduler interface of run_watch: wait for the next round, or an expiring lease, whichever is first"""
+        next_round = (self.current_round() + 1) * self.interval - time.time()
+        return max(1.0, min(next_round, self.store.lease_seconds))
+
+    def close(self):
+        self.runner.close()
+        self.store.close()
+
+    def run(self):
+        """Work until SIGTERM/SIGINT, see run_watch"""
+        from ptt_watch import run_watch
+
+        run_watch(self.run_available, self.close, self, self.stop_event)
+
+
+def backfill_units(board, start_page, end_page, unit_pages):
+    """(unit_id, kind, board, spec) backfill units covering start_page..end_page"""
+    units = []
+    for first in range(start_page, end_page + 1, unit_pages):
+        last = min(end_page, first + unit_pages - 1)
+        units.append((f"backfill:{board}:{first}-{last}", 'backfill', board, {'start_page': first, 'end_page': last}))
+    return units
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PTT 多節點分散爬蟲")
+    parser.add_argument('mode', choices=['worker', 'backfill', 'status'],
+                        help="worker：領取並執行工作；backfill：新增回補頁數範圍的工作；status：顯示工作狀態")
+    parser.add_argument('--store', required=True, help="所有節點共用的協調資料庫（SQLite 檔案）")
+    parser.add_argument('--config', default='boards.json', help="看板與關注清單設定檔")
+    parser.add_argument('--worker-id', help="節點名稱，預設為 主機名稱:行程編號")
+    parser.add_argument('--interval', type=float, default=300, help="worker 模式每輪爬取所有看板的間隔（秒）")
+    parser.add_argument('--lease', type=float, default=120, help="工作租約長度（秒），節點當機後工作於租約到期後由其他節點接手")
+    parser.add_argument('--board', help="backfill 模式的看板")
+    parser.add_argument('--start-page', type=int, default=1, help="backfill 模式的起始（最舊）頁數")
+    parser.add_argument('--end-page', type=int, help="backfill 模式的結束（最新）頁數")
+    parser.add_argument('--unit-pages', type=int, default=500, help="backfill 模式每個工作的頁數")
+    parser.add_argument('--parse-workers', type=int, help="回補工作的解析行程數，預設為 CPU 數，0 表示不使用行程池")
+    parser.add_argument('--retention-days', type=float, default=90, help="已完成的工作與通知紀錄保留天數")
+    parser.add_argument('--metrics-port', type=int, help="在此埠提供 Prometheus 格式的 /metrics")
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help="/metrics 綁定的位址，預設只允許本機存取，0.0.0.0 表示開放所有網路介面")
+    parser.add_argument('--metrics-json', help="結束時將各階段計時與計數寫入此 JSON 檔")
+    args = parser.parse_args()
+
+    store = LeaseStore(args.store, args.worker_id, args.lease)
+
+    if args.mode == 'status':
+        for kind, state, count in store.status():
+            print(f"{kind:>8} {state:>10} {count}")
+        store.close()
+        return
+
+    if args.mode == 'backfill':
+        if not args.board or not args.end_page or args.end_page < args.start_page:
+            print("錯誤：backfill 模式需要 --board 與不小於 --start-page 的 --end-page")
+            return
+        added = store.add_units(backfill_units(args.board, args.start_page, args.end_page, max(1, args.unit_pages)))
+        print(f"已新增 {added} 個回補工作")
+        store.close()
+        return
+
+    if not os.environ.get("LINE_TOKEN") or not os.environ.get("LINE_USER_ID"):
+        # Load environment variables from .env file
+        from dotenv import load_dotenv
+        load_dotenv()
+    LINE_TOKEN = os.environ.get("LINE_TOKEN")
+    LINE_USER_ID = os.environ.get("LINE_USER_ID")
+    if not LINE_TOKEN or not LINE_USER_ID:
+        print("錯誤：未設定 LINE_TOKEN 或 LINE_USER_ID 環境變數")
+        return
+
+    from ptt_boards import MultiBoardRunner
+    from ptt_config import load_watchlists
+
+    try:
+        config, matchers = load_watchlists(args.config)
+    except (OSError, ValueError) as e:
+        print(f"錯誤：無法讀取設定檔 {args.config}：{str(e)}")
+        return
+
+    if args.metrics_port:
+        serve(args.metrics_port, args.metrics_host)
+        print(f"Metrics 位址：http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+    store.evict(args.retention_days)
+    runner = MultiBoardRunner(config, LINE_TOKEN, LINE_USER_ID, {'notify_claims': store}, matchers)
+    print(f"節點 {store.owner} 開始領取工作")
+    ClusterWorker(store, runner, args.interval, args.parse_workers).run()
+
+    if args.metrics_json:
+        dump_json(args.metrics_json)
+        print(f"效能指標已保存至 {args.metrics_json}")
+
+
+if __name__ == '__main__':
+    main()
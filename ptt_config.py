@@ -0,0 +1,132 @@
+"""Boards and watchlists read from a JSON file, with a precompiled snapshot
+
+The file format is the one of ptt_boards (see boards.example.json), plus
+two optional top-level keys for local stand-ins of PTT and LINE:
+"base_url" and "line_api_url".
+
+load_watchlists also returns a KeywordMatcher per board, built from the
+board's index-strategy groups like build_shared_matcher does. Building the
+automata and checking the file are done once: the result is stored next
+to the config as .<name>.snapshot and reused while the config's mtime and
+size are unchanged. The snapshot is plain JSON, so a stale or damaged one
+is rebuilt, never executed.
+"""
+import json
+import os
+
+from ptt_http import DEFAULT_HOST_RATES, HostRateLimiter
+from ptt_matcher import KeywordMatcher
+
+# Bump when the snapshot layout or KeywordMatcher.to_state changes
+SNAPSHOT_VERSION = 2
+
+
+def load_config(path):
+    """Read and check a boards file, return it with defaults filled in"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    boards = config.get('boards')
+    if not boards:
+        raise ValueError(f"{path} lists no boards")
+    seen = set()
+    for entry in boards:
+        if not entry.get('board'):
+            raise ValueError(f"{path}: every board needs a name")
+        if entry['board'] in seen:
+            raise ValueError(f"{path}: board {entry['board']} is listed twice")
+        if not entry.get('artists_groups'):
+            raise ValueError(f"{path}: board {entry['board']} has no artists_groups")
+        seen.add(entry['board'])
+        entry.setdefault('ticket_keywords', [])
+        entry.setdefault('max_pages', 30)
+
+    rates = {host: tuple(rate) for host, rate in config.get('host_rates', {}).items()}
+    config['host_rates'] = dict(DEFAULT_HOST_RATES, **rates)
+    config['max_host_rates'] = {host: float(rate) for host, rate in config.get('max_host_rates', {}).items()}
+    config.setdefault('max_in_flight', 4)
+    config.setdefault('adaptive', True)
+    return config
+
+
+def build_limiter(config):
+    """HostRateLimiter with the rates, in-flight cap and adaptation of a config"""
+    return HostRateLimiter(config['host_rates'], max_in_flight=config['max_in_flight'],
+                           adaptive=config['adaptive'], max_rates=config['max_host_rates'])
+
+
+def group_watchlist(group):
+    """(artist keywords, strategy) of an artists_groups entry, a list or {'artists': [...], 'strategy': ...}"""
+    if isinstance(group, dict):
+        return group['artists'], group.get('strategy', 'index')
+    return group, 'index'
+
+
+def build_board_matcher(entry):
+    """KeywordMatcher over a board's index-strategy groups, keyed by group index"""
+    groups = {}
+    for idx, group in enumerate(entry['artists_groups']):
+        artists, strategy = group_watchlist(group)
+        # PTTCrawler walks the index for groups without artists whatever their strategy
+        if strategy == 'index' or not artists:
+            groups[idx] = (entry['ticket_keywords'], artists)
+    return KeywordMatcher(groups)
+
+
+def snapshot_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.snapshot")
+
+
+def config_stamp(path):
+    stat = os.stat(path)
+    return {'version': SNAPSHOT_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def load_snapshot(path, stamp):
+    """Config and matcher states of a snapshot matching stamp, None when missing or stale"""
+    try:
+        with open(snapshot_path(path), 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except:
+        return None
+    if snapshot.get('stamp') != stamp:
+        return None
+    return snapshot
+
+
+def save_snapshot(path, stamp, config, matchers):
+    """Write the snapshot atomically; a directory we cannot write to only costs the rebuild next time"""
+    target = snapshot_path(path)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    snapshot = {
+        'stamp': stamp,
+        'config': config,
+        'matchers': {board: matcher.to_state() for board, matcher in matchers.items()},
+    }
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, target)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_watchlists(path):
+    """Return (config, {board: KeywordMatcher}) of a boards file, through its snapshot when still valid
+
+    Raises OSError or ValueError like load_config.
+    """
+    stamp = config_stamp(path)
+    snapshot = load_snapshot(path, stamp)
+    if snapshot is not None:
+        config = snapshot['config']
+        config['host_rates'] = {host: tuple(rate) for host, rate in config['host_rates'].items()}
+        matchers = {board: KeywordMatcher.from_state(state) for board, state in snapshot['matchers'].items()}
+        return config, matchers
+
+    config = load_config(path)
+    matchers = {entry['board']: build_board_matcher(entry) for entry in config['boards']}
+    save_snapshot(path, stamp, config, matchers)
+    return config, matchers
@@ -1,95 +1,153 @@
 import os
-from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
-import time
-import json
+import argparse
+import re
 from datetime import datetime
-import concurrent.futures
-import threading
+from urllib.parse import quote
+import time
+import hashlib
+from ptt_archive import open_archive
+from ptt_cache import article_id_timestamp, flush_caches, open_article_cache
+from ptt_config import build_limiter, group_watchlist, load_watchlists
+from ptt_http import HttpClient, get_default_client
+from ptt_output import close_sinks, get_sink
+from ptt_parser import get_parser
+from ptt_matcher import KeywordMatcher
+from ptt_metrics import (
+    ARTICLES_CHECKED_TOTAL, ARTICLE_DETAILS_TOTAL, FETCH_SECONDS, INDEX_PAGES_TOTAL, MATCH_SECONDS,
+    NEW_ARTICLES_TOTAL, OUTPUT_WRITE_SECONDS, PARSE_SECONDS, REQUESTS_TOTAL, dump_json, page_kind, serve
+)
+from ptt_notify import LINE_PUSH_URL, close_outboxes, get_outbox
+from ptt_record import ArticleRecord
+from ptt_startup import board_unchanged, mark_walk_completed
+from ptt_watch import AdaptiveScheduler, run_watch
 
 class PTTCrawler:
-    def __init__(self, board=None, ticket_keywords=None, artist_keywords =None, max_pages=None, line_token=None, line_user_id=None):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        self.base_url = 'https://www.ptt.cc'
+    def __init__(self, board=None, ticket_keywords=None, artist_keywords =None, max_pages=None, line_token=None, line_user_id=None, http=None, detail_workers=4, parser=None, index_window=4, cache_retention_days=90, strategy='index', base_url='https://www.ptt.cc', line_api_url=LINE_PUSH_URL, page_retries=2, notify_claims=None):
+        # Pooled keep-alive client shared by all crawlers, carries headers and the over18 cookie
+        self.http = http or get_default_client()
+        # HTML parser backend, see ptt_parser; defaults to the fastest installed one
+        self.parser = parser or get_parser()
+        self.base_url = base_url
         self.board = board
         self.ticket_keywords = ticket_keywords or []
         self.artist_keywords  = artist_keywords  or []
+        self.watchlist = '/'.join(self.artist_keywords)  # Metrics label of this crawler
+        self.matcher = KeywordMatcher({0: (self.ticket_keywords, self.artist_keywords)})
         self.max_pages = max_pages
         self.output_dir = f"./ptt_{self.board}_data"
-        self.cache_file = f"{self.output_dir}/article_cache.json"
         self.line_token = line_token
         self.line_user_id = line_user_id
+        self.line_api_url = line_api_url
+        self.page_retries = page_retries  # Retries of an index page the client gave up on, before the crawl stops
+        self.outbox = None  # Background LINE queue, opened on the first notification
+        # Claims shared by the workers of a cluster (see ptt_cluster), only the winner of an article's claim notifies it
+        self.notify_claims = notify_claims
+        # Board cache shared with every crawler of the board in this process, see ptt_cache
         self.article_cache = self.load_article_cache()
-        self.new_article_cache = {}
-        self.cache_lock = threading.Lock()
+        self.archive = open_archive(self.output_dir)  # Full-text history of the board's crawled articles, see ptt_archive
+        self.cache_snapshot = None
+        self.cache_retention_days = cache_retention_days
+        self.detail_workers = detail_workers  # Parallel article page fetches per index page
+        self.detail_executor = None
+        self.index_window = index_window  # Index pages fetched ahead by page number when there is no watermark
+        # 'index' walks the board index, 'search' queries the board search per artist keyword
+        if strategy not in ('index', 'search'):
+            raise ValueError(f"Unknown crawl strategy: {strategy}")
+        self.strategy = strategy if self.artist_keywords else 'index'
 
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         
     def load_article_cache(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        """Open the board's SQLite article cache, see ptt_cache"""
+        return open_article_cache(self.output_dir)
 
     def is_new_article(self, article_url):
         article_id = article_url.split('/')[-1].strip()
-        return article_id not in self.article_cache
+        # Articles other groups' crawlers saved during this run still count as new
+        return not self.article_cache.contains(article_id, self.cache_snapshot)
 
-    def mark_article_as_crawled(self, article_url):
-        article_id = article_url.split('/')[-1].strip()
-        self.new_article_cache[article_id] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def article_timestamp(self, article_url):
+        """Post time encoded in a PTT article ID (M.<unix_ts>.A.xxx), None if the ID has no timestamp"""
+        return article_id_timestamp(article_url.split('/')[-1].strip())
 
-    def save_article_cache(self):
-        with self.cache_lock:
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                latest_cache = json.load(f)
-            latest_cache.update(self.new_article_cache)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(latest_cache, f, ensure_ascii=False, indent=2)
-    
-    # LINE Messaging API 相關函數
-    def send_line_notification(self, access_token, user_id, message):
-        """
-        Send notification using LINE Messaging API
+    @property
+    def watermark_key(self):
+        """Meta key of this crawler's watermark
 
-        Parameters:
-        access_token (str): Your Channel Access Token
-        user_id (str): LINE user ID of the recipient
-        message (str): Text message to be sent
-        
-        Returns:
-        bool: Returns True if sending is successful, otherwise False
+        Every watchlist keeps its own watermark, keyed by its keywords, so a
+        walk run for some watchlists of the board never stops another's
+        walk at pages it did not check.
+        """
+        artists = '/'.join(sorted(k.lower() for k in self.artist_keywords))
+        if self.strategy == 'search':
+            return 'watermark:search:' + artists
+        return f"watermark:index:{artists}:" + '/'.join(sorted(k.lower() for k in self.ticket_keywords))
+
+    def load_watermark(self):
+        """Post time of the newest article seen by this watchlist's last complete run"""
+        return self.article_cache.get_meta(self.watermark_key)
+
+    def save_watermark(self):
+        """Advance this watchlist's high-water mark to the newest article seen in this run
+
+        A run with a failed index fetch or failed article fetches keeps the
+        old mark, so the next run walks back over the articles it missed.
+        The board's 'watermark', the newest post seen by any run, only
+        dates cache eviction.
         """
-        url = 'https://api.line.me/v2/bot/message/push'
+        if self.newest_timestamp is None:
+            return
+        self.article_cache.set_meta_max('watermark', self.newest_timestamp)
+        if self.fetch_failed or self.details_failed:
+            return
+        self.article_cache.set_meta_max(self.watermark_key, self.newest_timestamp)
+
+    def track_page(self, rows):
+        """Record post times of an index page, return True once the page reaches the watermark
+
+        Everything on older pages was already seen by the previous run, so
+        paging can stop whether or not the page had matching articles.
+        """
+        timestamps = [self.article_timestamp(row['url']) for row in rows]
+        timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+        if not timestamps:
+            return False
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
+        newest = max(timestamps)
+        if self.newest_timestamp is None or newest > self.newest_timestamp:
+            self.newest_timestamp = newest
 
-        data = {
-            'to': user_id,
-            'messages': [
-                {
-                    'type': 'text',
-                    'text': message
-                }
-            ]
-        }
+        # Rows run oldest to newest and pinned posts at the bottom are older
+        # still, so the first row is the oldest regular post of the page
+        return self.watermark is not None and timestamps[0] < self.watermark
 
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+    def mark_article_as_crawled(self, article_url):
+        article_id = article_url.split('/')[-1].strip()
+        # Staged on the shared board cache, written for all crawlers by one flush
+        self.article_cache.stage(article_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
-        if response.status_code == 200:
-            print("  LINE 通知發送成功！")
-        else:
-            print(f"  LINE 通知發送失敗。狀態碼: {response.status_code}\n  回應: {response.text}")
+    def save_article_cache(self):
+        """Flush the board's staged articles and evict entries past the retention window"""
+        self.article_cache.flush(self.cache_retention_days)
+
+    def close(self):
+        """Release the detail pool and this crawler's use of the board cache and archive, for long-running callers"""
+        if self.detail_executor is not None:
+            self.detail_executor.shutdown()
+            self.detail_executor = None
+        self.article_cache.close()
+        self.archive.close()
+    
+    def notify(self, articles):
+        """Queue articles on the shared LINE outbox, delivery happens in the background"""
+        if self.outbox is None:
+            self.outbox = get_outbox(
+                self.http, self.line_token, self.line_user_id,
+                os.path.join(self.output_dir, 'line_outbox.json'),
+                self.format_batch_message, self.line_api_url
+            )
+        self.outbox.enqueue(articles)
 
     # Format message for LINE notification
     def format_message(self, article):
@@ -109,6 +167,9 @@ class PTTCrawler:
         for article in articles:
             message += f"\U0001F4DD 標題：{article['title']}\n"
             message += f"\U0001F517 連結：{article['url']}\n"
+
+            if article.get('groups'):
+                message += f"\U0001F3A4 符合：{'、'.join('/'.join(group) for group in article['groups'])}\n"
             
             if '時間' in article:
                 message += f"\U0001F552 發布時間：{article['時間']}\n"
@@ -119,10 +180,22 @@ class PTTCrawler:
         
         return message
     
-    def get_page_content(self, url):
-        """Get page content"""
+    def fetch(self, url, throttle=True, **kwargs):
+        """GET url through the client, recording its time and outcome per board and page kind"""
+        kind = page_kind(url)
+        try:
+            with FETCH_SECONDS.time(board=self.board, kind=kind):
+                response = self.http.get(url, throttle=throttle, key=self.board, **kwargs)
+        except Exception:
+            REQUESTS_TOTAL.inc(board=self.board, kind=kind, status='error')
+            raise
+        REQUESTS_TOTAL.inc(board=self.board, kind=kind, status=response.status_code)
+        return response
+
+    def get_page_content(self, url, throttle=True):
+        """Get page content, pacing requests through the client's per-host rate limiter"""
         try:
-            response = requests.get(url, headers=self.headers, cookies={'over18': '1'})
+            response = self.fetch(url, throttle=throttle)
             if response.status_code == 200:
                 return response.text
             else:
@@ -132,214 +205,687 @@ class PTTCrawler:
             print(f"發生錯誤: {str(e)}")
             return None
     
+    def parse_index_page(self, content):
+        """Parse index page, return every article row and link to previous page"""
+        with PARSE_SECONDS.time(board=self.board, kind='index'):
+            return self.parser.parse_index(content, self.base_url)
+
+    def match_title(self, title):
+        """Check whether title contains both ticket and artist keywords"""
+        return bool(self.matcher.match(title))
+
+    def filter_articles(self, rows, row_matches=None, group_key=0):
+        """Filter parsed rows by keywords, return an ArticleRecord per match in page order
+
+        row_matches holds the precomputed group keys of each row from a
+        shared KeywordMatcher, in which this crawler is group_key.
+        """
+        if row_matches is None:
+            with MATCH_SECONDS.time(board=self.board):
+                row_matches = [self.matcher.match(row['title']) for row in rows]
+        return [
+            ArticleRecord.from_row(row)
+            for row, matches in zip(rows, row_matches) if group_key in matches
+        ]
+
     def parse_article_list(self, content):
         """Parse article list, return article links and link to previous page"""
-        soup = BeautifulSoup(content, 'html.parser')
-        articles = []
-
-        # Get all article links
-        for div in soup.find_all('div', class_='r-ent'):
-            title_div = div.find('div', class_='title')
-            if title_div:
-                link = title_div.find('a')
-                if link:
-                    title = link.text.strip()
-                    url = self.base_url + link['href']
-
-                    # Check for both ticket and artist keywords
-                    ticket_keyword_match = not self.ticket_keywords or any(
-                        keyword.lower() in title.lower() 
-                        for keyword in self.ticket_keywords
-                    )
-                    artist_keyword_match = not self.artist_keywords or any(
-                        keyword.lower() in title.lower() 
-                        for keyword in self.artist_keywords 
-                    )
-
-                    if ticket_keyword_match and artist_keyword_match:
-                        articles.append({
-                            'title': title,
-                            'url': url
-                        })
-
-        # Get link to previous page
-        prev_page_link = soup.find('a', string='‹ 上頁')
-        prev_page_url = self.base_url + prev_page_link['href'] if prev_page_link else None
-
-        return articles, prev_page_url
+        rows, prev_page_url = self.parse_index_page(content)
+        return self.filter_articles(rows), prev_page_url
 
     def parse_article_content(self, content):
         """Parse article content"""
-        soup = BeautifulSoup(content, 'html.parser')
-        article_data = {}
-
-        # Get main content
-        main_content = soup.find('div', id='main-content')
-        if main_content:
-            # Extract data like author, time
-            metalines = main_content.find_all('div', class_='article-metaline')
-            for meta in metalines:
-                meta_name = meta.find('span', class_='article-meta-tag')
-                meta_value = meta.find('span', class_='article-meta-value')
-                if meta_name and meta_value:
-                    key = meta_name.text.strip()
-                    value = meta_value.text.strip()
-                    if key != '標題': # Skip title field as we already have it
-                        article_data[key] = value
+        with PARSE_SECONDS.time(board=self.board, kind='article'):
+            return self.parser.parse_article(content)
+
+    def start_crawl(self):
+        """Reset per-run state before walking the index"""
+        # Monthly output file of the run, records are appended page by page
+        self.output_file = self.output_filename(datetime.now().strftime("%Y%m"))
+        self.new_articles_count = 0
+        self.total_articles_checked = 0
+        self.found_old_article = False
+        self.fetch_failed = False
+        self.details_failed = 0
+        self.newest_timestamp = None
+        self.watermark = self.load_watermark()
+        self.cache_snapshot = self.article_cache.snapshot()
+
+    def iter_new_articles(self, page_count, records):
+        """Yield the new records of one index page, newest first, up to the first already crawled one"""
+        self.total_articles_checked += len(records)
+        ARTICLES_CHECKED_TOTAL.inc(len(records), board=self.board, watchlist=self.watchlist)
+
+        # Walk the page backwards to process the most recent articles first
+        for idx, record in enumerate(reversed(records)):
+            # Check if this is a new article
+            if self.is_new_article(record.url):
+                print(f"  發現新文章 ({page_count}-{idx+1}): {record.title}")
+                yield record
+            else:
+                print(f"  跳過已爬取的文章: {record.title}")
+                self.found_old_article = True
+                return
 
-        return article_data
+    def iter_enriched(self, records):
+        """Yield records with their article details set, in order, dropping failed fetches
 
-    def crawl_articles(self):
-        """Crawl articles until finding already pushed articles or reaching max pages, and filter titles containing keywords"""
-        current_url = f"{self.base_url}/bbs/{self.board}/index.html"
-        keyword_articles = []  # Store articles matching keywords
-        new_articles = []
-        new_articles_count = 0
-        total_articles_checked = 0
-        page_count = 0
-        found_old_article = False
-        batch_size = 5  # Send notification for every 5 articles
+        Up to detail_workers article pages are fetched ahead through the
+        detail pool while earlier records are already being consumed.
+        """
+        def enrich(record):
+            return record, self.fetch_article_details(record)
 
-        while page_count < self.max_pages and not found_old_article:
-            page_count += 1
-            print(f"正在爬取第 {page_count} 頁...")
-            content = self.get_page_content(current_url)
-            if not content:
-                break
+        if self.detail_workers <= 1:
+            results = map(enrich, records)
+        else:
+            if self.detail_executor is None:
+                import concurrent.futures  # Pulls in logging, quiet runs never get here
+                self.detail_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.detail_workers)
+            results = self.detail_executor.map(enrich, records)
+
+        for record, article_data in results:
+            if article_data is None:
+                self.details_failed += 1
+            else:
+                yield record.with_details(article_data)
+
+    def add_article(self, record):
+        """Mark an enriched record crawled and queue its notification"""
+        self.mark_article_as_crawled(record.url)
+        self.new_articles_count += 1
+        NEW_ARTICLES_TOTAL.inc(board=self.board, watchlist=self.watchlist)
+
+        if self.notify_claims is not None and not self.notify_claims.claim(self.board, record.article_id, self.watchlist):
+            return
+
+        # The outbox packs queued articles 5 per message, up to 5 messages per push,
+        # and merges this article with the same one queued by other groups
+        self.notify([record.to_dict(groups=[self.artist_keywords])])
+        # Now in the outbox's journal; a claim left unmarked by a crash expires and is won again
+        if self.notify_claims is not None:
+            self.notify_claims.mark_notified(self.board, record.article_id, self.watchlist)
+
+    def write_articles(self, records):
+        """Append records to this run's output file and the board archive"""
+        if not records:
+            return
+        articles = [record.to_dict() for record in records]
+        # Append to the monthly JSON Lines file, see ptt_output for the old JSON format
+        with OUTPUT_WRITE_SECONDS.time(board=self.board):
+            get_sink(self.output_file).write_many(articles)
+            self.archive.add_many(articles, self.artist_keywords)
+
+    def consume(self, records):
+        """Sink stage: each record is staged and notified as it arrives, then the page is written out"""
+        page = []
+        for record in records:
+            self.add_article(record)
+            page.append(record)
+        self.write_articles(page)
+
+    def fetch_article_details(self, article, throttle=True):
+        """Fetch and parse one article page through the board's detail LRU, None on failure
+
+        Groups matching the same article share one fetch and parse.
+        """
+        loaded = []
 
-            filtered_articles, prev_page_url = self.parse_article_list(content)
+        def load():
+            loaded.append(True)
+            content = self.get_page_content(article.url, throttle=throttle)
+            return self.parse_article_content(content) if content else None
 
-            # Reverse the order of filtered_articles to process the most recent articles first
-            filtered_articles.reverse()
-            
-            # If no articles matching keywords on this page, continue to next page
-            if not filtered_articles:
-                if prev_page_url:
-                    current_url = prev_page_url
-                    time.sleep(2)
-                    continue
-                else:
-                    break
+        article_data = self.article_cache.details.get_or_load(article.article_id, load)
+        source = 'failed' if article_data is None else 'fetched' if loaded else 'shared'
+        ARTICLE_DETAILS_TOTAL.inc(board=self.board, watchlist=self.watchlist, source=source)
+        return article_data
 
-            total_articles_checked += len(filtered_articles)
-
-            for idx, article in enumerate(filtered_articles):
-                # Check if this is a new article
-                if self.is_new_article(article['url']):
-                    print(f"  發現新文章 ({page_count}-{idx+1}): {article['title']}")
-                    article_content = self.get_page_content(article['url'])
-
-                    if article_content:
-                        article_data = self.parse_article_content(article_content)
-                        article.update(article_data)
-                        keyword_articles.append(article)
-                        new_articles.append(article)
-
-                        self.mark_article_as_crawled(article['url'])
-                        new_articles_count += 1
-                        
-                        # Send batched notification when reaching the batch size
-                        if len(new_articles) >= batch_size:
-                            batch_message = self.format_batch_message(new_articles)
-                            self.send_line_notification(self.line_token, self.line_user_id, batch_message)
-                            new_articles = []
-                        
-                    time.sleep(2)
-                else:
-                    print(f"  跳過已爬取的文章: {article['title']}")
-                    found_old_article = True
-                    break
+    def process_articles(self, page_count, records):
+        """Run one index page's matches through the pipeline, return False once an already crawled article is found
 
-            if found_old_article or not prev_page_url:
-                break
+        new articles -> details -> cache, LINE outbox and output file, newest
+        first so notifications keep the order of the index page.
+        """
+        self.consume(self.iter_enriched(self.iter_new_articles(page_count, records)))
+        return not self.found_old_article
 
-            current_url = prev_page_url
-            time.sleep(2)
+    def finish_crawl(self, save_cache=True):
+        """Save cache and results, return crawl summary; queued notifications keep sending in the background
 
-        # Send remaining articles if less than batch_size
-        if new_articles:
-            batch_message = self.format_batch_message(new_articles)
-            self.send_line_notification(self.line_token, self.line_user_id, batch_message)
+        Callers finishing several crawlers of a board pass save_cache=False
+        and flush the shared cache once with ptt_cache.flush_caches.
+        """
+        if self.detail_executor is not None:
+            self.detail_executor.shutdown()
+            self.detail_executor = None
 
-        self.save_article_cache()
+        self.save_watermark()
+        if save_cache:
+            self.save_article_cache()
         
-        if keyword_articles:
-            # Combine keywords for filename
-            sorted_ticket_keywords = sorted([k.lower() for k in self.ticket_keywords])
-            sorted_artist_keywords = sorted([k.lower() for k in self.artist_keywords])
-            if not sorted_ticket_keywords or sorted_ticket_keywords == ['']:
-                keywords_filename = f"{''.join(sorted_artist_keywords)}"
-            else:
-                keywords_filename = f"[{'/'.join(sorted_ticket_keywords)}]_{''.join(sorted_artist_keywords)}"
-            timestamp = datetime.now().strftime("%Y%m")
-            filename = f"{self.output_dir}/ptt_{self.board}_{keywords_filename}_{timestamp}.json"
-            
-            # Save results as JSON file
-            data = []
-            if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            data.extend(keyword_articles)
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"  結果已保存至 {filename}")
+        if self.new_articles_count:
+            # Records were appended page by page, make them durable
+            with OUTPUT_WRITE_SECONDS.time(board=self.board):
+                get_sink(self.output_file).flush()
+            print(f"  結果已保存至 {self.output_file}")
 
         return {
             'artist_keywords': self.artist_keywords,
-            'total_articles_checked': total_articles_checked,
-            'new_articles_count': new_articles_count
+            'total_articles_checked': self.total_articles_checked,
+            'new_articles_count': self.new_articles_count
         }
 
+    def output_filename(self, month):
+        """Monthly JSON Lines file of this watchlist, month as YYYYMM"""
+        # Combine keywords for filename
+        sorted_ticket_keywords = sorted([k.lower() for k in self.ticket_keywords])
+        sorted_artist_keywords = sorted([k.lower() for k in self.artist_keywords])
+        if not sorted_ticket_keywords or sorted_ticket_keywords == ['']:
+            keywords_filename = f"{''.join(sorted_artist_keywords)}"
+        else:
+            keywords_filename = f"[{'/'.join(sorted_ticket_keywords)}]_{''.join(sorted_artist_keywords)}"
+        return f"{self.output_dir}/ptt_{self.board}_{keywords_filename}_{month}.jsonl"
+
+    def fetch_index_page(self, url, throttle=True):
+        """Fetch and parse one index page, return (rows, prev_page_url) or None on failure
 
-def run_crawlers_concurrently(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id):
-    """Run multiple PTT crawlers concurrently for different artist groups"""
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Create a crawler for each artist group
-        crawlers = [
-            PTTCrawler(
-                board=board, 
-                ticket_keywords=ticket_keywords, 
-                artist_keywords=artist_group, 
-                max_pages=max_pages, 
-                line_token=line_token, 
-                line_user_id=line_user_id
-            ) for artist_group in artists_groups
+        The ETag / Last-Modified of the previous poll are sent along, and the
+        rows parsed then are reused when PTT answers 304 or returns a body with
+        the same hash, so quiet pages are not parsed again.
+        """
+        cached = self.article_cache.get_page(url)
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        for attempt in range(self.page_retries + 1):
+            if attempt:
+                # The client already backed off and retried, give the host a longer break
+                delay = self.http.backoff_delay(self.http.max_retries + attempt)
+                print(f"  {delay:.0f} 秒後重新抓取 {url}")
+                time.sleep(delay)
+            try:
+                response = self.fetch(url, throttle=throttle or attempt > 0, headers=headers)
+            except Exception as e:
+                print(f"發生錯誤: {str(e)}")
+                continue
+            if response.status_code not in self.http.RETRY_STATUS:
+                break
+            print(f"請求失敗。狀態碼: {response.status_code}")
+        else:
+            return None
+
+        if response.status_code == 304 and cached:
+            INDEX_PAGES_TOTAL.inc(board=self.board, result='not_modified')
+            rows, prev_page_url = cached['parsed']
+            return rows, prev_page_url
+        if response.status_code != 200:
+            print(f"請求失敗。狀態碼: {response.status_code}\n回應: {response.text}")
+            return None
+
+        body_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        if cached and cached['body_hash'] == body_hash:
+            INDEX_PAGES_TOTAL.inc(board=self.board, result='unchanged')
+            rows, prev_page_url = cached['parsed']
+        else:
+            INDEX_PAGES_TOTAL.inc(board=self.board, result='parsed')
+            rows, prev_page_url = self.parse_index_page(response.text)
+        self.article_cache.set_page(
+            url, response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash, [rows, prev_page_url]
+        )
+        return rows, prev_page_url
+
+    def iter_index_pages(self, max_pages, window=None):
+        """Yield (page_count, rows, prev_page_url) for index pages, newest first
+
+        The first page reveals its predecessor's number (index<N>.html), after
+        which up to window pages are requested ahead by number under the
+        rate limit. By default prefetching is only used without a watermark,
+        i.e. on first runs and backfills, since a steady-state run stops after
+        a page or two; a shared walk passes the window its watchlists need.
+        Pages are still yielded in order. When the caller stops, queued fetches
+        are cancelled and running ones are waited for, so no pool thread
+        outlives the walk.
+        """
+        result = self.fetch_index_page(f"{self.base_url}/bbs/{self.board}/index.html")
+        if result is None:
+            self.fetch_failed = True
+            return
+        yield 1, result[0], result[1]
+
+        page_count = 1
+        prev_page_url = result[1]
+        match = re.search(r'/index(\d+)\.html$', prev_page_url or '')
+        if window is None:
+            window = self.index_window if self.watermark is None else 1
+
+        if not match or window <= 1:
+            # Follow prev links one page at a time
+            while prev_page_url and page_count < max_pages:
+                result = self.fetch_index_page(prev_page_url)
+                if result is None:
+                    self.fetch_failed = True
+                    return
+                page_count += 1
+                yield page_count, result[0], result[1]
+                prev_page_url = result[1]
+            return
+
+        import concurrent.futures
+
+        next_number = int(match.group(1))
+        pending = []
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=window)
+        try:
+            while page_count < max_pages:
+                while len(pending) < window and next_number >= 1 and page_count + len(pending) < max_pages:
+                    url = f"{self.base_url}/bbs/{self.board}/index{next_number}.html"
+                    pending.append(executor.submit(self.fetch_index_page, url))
+                    next_number -= 1
+                if not pending:
+                    return
+
+                result = pending.pop(0).result()
+                if result is None:
+                    self.fetch_failed = True
+                    return
+                page_count += 1
+                yield page_count, result[0], result[1]
+                if not result[1]:
+                    return
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def iter_search_pages(self, query):
+        """Yield (page_count, rows, prev_page_url) of the board search for query, newest first"""
+        url = f"{self.base_url}/bbs/{self.board}/search?q={quote(query)}"
+        page_count = 0
+        while url and page_count < self.max_pages:
+            try:
+                response = self.fetch(url)
+            except Exception as e:
+                print(f"發生錯誤: {str(e)}")
+                self.fetch_failed = True
+                return
+            # PTT answers a search without (further) results with 404
+            if response.status_code == 404:
+                return
+            if response.status_code != 200:
+                print(f"請求失敗。狀態碼: {response.status_code}\n回應: {response.text}")
+                self.fetch_failed = True
+                return
+
+            rows, prev_page_url = self.parse_index_page(response.text)
+            page_count += 1
+            yield page_count, rows, prev_page_url
+            url = prev_page_url
+
+    def search_articles(self):
+        """Query the board search for every artist keyword, return the merged rows oldest first
+
+        Each query pages back until it reaches the watermark or a page holds
+        an already crawled match. Rows found by several queries are kept once.
+        """
+        rows_by_url = {}
+        for query in self.artist_keywords:
+            for page_count, rows, prev_page_url in self.iter_search_pages(query):
+                print(f"正在搜尋 {query} 第 {page_count} 頁...")
+                for row in rows:
+                    rows_by_url.setdefault(row['url'], row)
+                reached_watermark = self.track_page(rows)
+                if reached_watermark or any(
+                    not self.is_new_article(record.url) for record in self.filter_articles(rows)
+                ):
+                    break
+
+        # Results of different queries interleave, order them by post time like the index
+        return sorted(
+            rows_by_url.values(),
+            key=lambda row: self.article_timestamp(row['url']) or 0
+        )
+
+    def crawl_search(self, save_cache=True):
+        """Crawl through the board search instead of the index, with the same title filter and notifications"""
+        self.start_crawl()
+        rows = self.search_articles()
+        self.process_articles(1, self.filter_articles(rows))
+        return self.finish_crawl(save_cache)
+
+    def crawl_articles(self, save_cache=True):
+        """Crawl articles until finding already pushed articles or reaching max pages, and filter titles containing keywords"""
+        if self.strategy == 'search':
+            return self.crawl_search(save_cache)
+
+        self.start_crawl()
+
+        for page_count, rows, prev_page_url in self.iter_index_pages(self.max_pages):
+            print(f"正在爬取第 {page_count} 頁...")
+            reached_watermark = self.track_page(rows)
+
+            if not self.process_articles(page_count, self.filter_articles(rows)) or not prev_page_url:
+                break
+
+            if reached_watermark:
+                print("  已到達上次爬取的位置，停止翻頁")
+                break
+
+        return self.finish_crawl(save_cache)
+
+
+def build_shared_matcher(crawlers):
+    """One KeywordMatcher over the watchlists of the index-strategy crawlers, keyed by crawler index"""
+    return KeywordMatcher({
+        idx: (crawler.ticket_keywords, crawler.artist_keywords)
+        for idx, crawler in enumerate(crawlers) if crawler.strategy == 'index'
+    })
+
+
+def crawl_shared_index(crawlers, executor, matcher=None):
+    """Walk the board index once and fan out every parsed page to all crawlers
+
+    Each index page is fetched and parsed a single time and every title is
+    matched once against all watchlists; the rows are then processed by
+    every crawler that has not reached its own stop condition or its own
+    watermark yet, and the walk ends when none is left. Pass
+    the matcher from build_shared_matcher to reuse it across runs.
+    Crawlers using the search strategy run their own queries alongside.
+    A walk without failed fetches is recorded for ptt_startup's quick exit.
+    """
+    if not crawlers:
+        return []
+
+    matcher = matcher or build_shared_matcher(crawlers)
+    searches = {
+        idx: executor.submit(crawler.crawl_search, False)
+        for idx, crawler in enumerate(crawlers) if crawler.strategy == 'search'
+    }
+    indexed = [idx for idx in range(len(crawlers)) if idx not in searches]
+
+    reader = crawlers[indexed[0]] if indexed else None
+    for idx in indexed:
+        crawlers[idx].start_crawl()
+
+    active = [idx for idx in indexed if crawlers[idx].max_pages > 0]
+    max_pages = max([crawlers[idx].max_pages for idx in active] or [0])
+    # Prefetch while any watchlist has no watermark to stop at
+    window = reader.index_window if any(crawlers[idx].watermark is None for idx in active) else 1
+    pages = reader.iter_index_pages(max_pages, window) if active else []
+    for page_count, rows, prev_page_url in pages:
+        print(f"正在爬取第 {page_count} 頁...")
+        reached_watermark = {idx: crawlers[idx].track_page(rows) for idx in active}
+        with MATCH_SECONDS.time(board=reader.board):
+            row_matches = [matcher.match(row['title']) for row in rows]
+
+        # Let every active crawler process its share of the rows
+        keep_going = list(executor.map(
+            lambda idx: crawlers[idx].process_articles(
+                page_count, crawlers[idx].filter_articles(rows, row_matches, idx)
+            ),
+            active
+        ))
+        active = [
+            idx for idx, keep in zip(active, keep_going)
+            if keep and not reached_watermark[idx] and page_count < crawlers[idx].max_pages
         ]
 
-        # Submit crawlers to thread pool
-        futures = {executor.submit(crawler.crawl_articles): idx for idx, crawler in enumerate(crawlers)}
+        if not active and any(reached_watermark.values()):
+            print("  已到達上次爬取的位置，停止翻頁")
+        if not active or not prev_page_url:
+            break
 
-        # Collect results
-        results = [None] * len(artists_groups)
-        for future in concurrent.futures.as_completed(futures):
-            idx = futures[future]
-            result = future.result()
-            results[idx] = result
-        
-        return results
+    # The reader's failed fetch also cut short the walks still waiting for pages
+    for idx in active:
+        crawlers[idx].fetch_failed = crawlers[idx].fetch_failed or reader.fetch_failed
+
+    # Finish one by one, each crawler writes its output file, then the board cache is flushed once
+    results = [
+        searches[idx].result() if idx in searches else crawler.finish_crawl(save_cache=False)
+        for idx, crawler in enumerate(crawlers)
+    ]
+    flush_caches((crawler.article_cache, crawler.cache_retention_days) for crawler in crawlers)
+    mark_walk_completed(crawlers)
+    return results
+
+
+def create_crawlers(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id, **crawler_options):
+    """Create a crawler for each artist group
+
+    A group is a list of artist keywords, or a dict {'artists': [...],
+    'strategy': 'search'} to crawl that watchlist through the board search.
+    crawler_options are passed on to every PTTCrawler.
+    """
+    crawlers = []
+    for artist_group in artists_groups:
+        artist_keywords, strategy = group_watchlist(artist_group)
+        crawlers.append(PTTCrawler(
+            board=board, 
+            ticket_keywords=ticket_keywords, 
+            artist_keywords=artist_keywords, 
+            max_pages=max_pages, 
+            line_token=line_token, 
+            line_user_id=line_user_id,
+            strategy=strategy,
+            **crawler_options
+        ))
+    return crawlers
+
+
+def run_crawlers_concurrently(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id, shared_index=True, use_async=False, crawler_options=None, matcher=None):
+    """Run multiple PTT crawlers concurrently for different artist groups
+
+    With shared_index the board index is fetched and parsed once and fanned
+    out to every artist group, otherwise each group walks the index itself.
+    use_async runs the crawl on the asyncio engine in ptt_async.
+    crawler_options (e.g. base_url, parser) are passed on to every crawler.
+    matcher is a prebuilt shared-index matcher, e.g. from ptt_config.load_watchlists.
+    """
+    import concurrent.futures
+
+    crawlers = create_crawlers(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id, **(crawler_options or {}))
+
+    try:
+        if use_async:
+            # asyncio is among the slowest imports, threaded runs never load it
+            import asyncio
+            from ptt_async import run_crawlers_async
+            return asyncio.run(run_crawlers_async(crawlers, shared_index=shared_index))
+
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            if shared_index:
+                return crawl_shared_index(crawlers, executor, matcher)
+
+            # Submit crawlers to thread pool
+            futures = {executor.submit(crawler.crawl_articles, False): idx for idx, crawler in enumerate(crawlers)}
+
+            # Collect results
+            results = [None] * len(artists_groups)
+            for future in concurrent.futures.as_completed(futures):
+                idx = futures[future]
+                result = future.result()
+                results[idx] = result
+
+            flush_caches((crawler.article_cache, crawler.cache_retention_days) for crawler in crawlers)
+            return results
+    finally:
+        # The last crawler of a board flushes anything still staged and closes the shared cache
+        for crawler in crawlers:
+            crawler.close()
+
+
+def watch_crawlers(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id, scheduler=None, crawler_options=None, matcher=None):
+    """Poll the board until SIGTERM/SIGINT, keeping crawlers, cache connections and sessions between polls
+
+    Each poll is one shared index walk plus the search-strategy queries.
+    The scheduler polls sooner while a watermark keeps advancing and backs
+    off while none does.
+    """
+    import concurrent.futures
+
+    crawlers = create_crawlers(artists_groups, board, ticket_keywords, max_pages, line_token, line_user_id, **(crawler_options or {}))
+    matcher = matcher or build_shared_matcher(crawlers)
+    executor = concurrent.futures.ThreadPoolExecutor()
+    scheduler = scheduler or AdaptiveScheduler()
+
+    def crawl_once():
+        watermarks = [crawler.load_watermark() for crawler in crawlers]
+        results = crawl_shared_index(crawlers, executor, matcher)
+        print_results(results)
+        return any(
+            new is not None and (old is None or new > old)
+            for old, new in zip(watermarks, (crawler.load_watermark() for crawler in crawlers))
+        )
+
+    def close():
+        executor.shutdown()
+        for crawler in crawlers:
+            crawler.close()
+        close_sinks()
+        close_outboxes()
+
+    run_watch(crawl_once, close, scheduler)
+
+
+def backfill_crawlers(artists_groups, board, ticket_keywords, start_page=1, end_page=None, parse_workers=None, crawler_options=None):
+    """Backfill index pages start_page..end_page for every artist group, see ptt_backfill
+
+    The page range replaces max_pages; an interrupted backfill resumes from
+    its checkpoint when run again with the same range and groups.
+    """
+    from ptt_backfill import run_backfill
+
+    crawlers = create_crawlers(artists_groups, board, ticket_keywords, 0, None, None, **(crawler_options or {}))
+    try:
+        return run_backfill(crawlers, start_page, end_page, parse_workers=parse_workers)
+    finally:
+        for crawler in crawlers:
+            crawler.close()
+        close_sinks()
+
+
+def print_results(results):
+    print("\n-----爬蟲完成-----")
+    for result in results:
+        artist_group = result['artist_keywords']
+        total_articles_checked = result['total_articles_checked']
+        new_articles_count = result['new_articles_count']
+        print(f"{artist_group} 找到了 {total_articles_checked} 篇文章，其中有 {new_articles_count} 篇新文章。")
 
 def main():
-    # Load environment variables from .env file
-    load_dotenv()
+    parser = argparse.ArgumentParser(description="PTT 多藝人票券文章爬蟲")
+    parser.add_argument('mode', nargs='?', choices=['once', 'watch', 'backfill'], default='once',
+                        help="once：爬取一次（預設）；watch：持續監看看板；backfill：回補一段頁數範圍的歷史文章")
+    parser.add_argument('--min-interval', type=float, default=30, help="watch 模式最短爬取間隔（秒）")
+    parser.add_argument('--max-interval', type=float, default=600, help="watch 模式最長爬取間隔（秒）")
+    parser.add_argument('--start-page', type=int, default=1, help="backfill 模式的起始（最舊）頁數")
+    parser.add_argument('--end-page', type=int, help="backfill 模式的結束（最新）頁數，預設為看板最新頁")
+    parser.add_argument('--parse-workers', type=int, help="backfill 模式的解析行程數，預設為 CPU 數，0 表示不使用行程池")
+    parser.add_argument('--metrics-port', type=int, help="在此埠提供 Prometheus 格式的 /metrics")
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help="/metrics 綁定的位址，預設只允許本機存取，0.0.0.0 表示開放所有網路介面")
+    parser.add_argument('--metrics-json', help="結束時將各階段計時與計數寫入此 JSON 檔")
+    parser.add_argument('--config', help="看板與關注清單設定檔（格式同 boards.example.json），預設讀取 boards.json，不存在時使用程式內的設定")
+    parser.add_argument('--board', help="要爬取的看板，預設為設定檔中的第一個看板")
+    parser.add_argument('--full', action='store_true', help="即使看板最新列表頁沒有變動也完整爬取一次")
+    args = parser.parse_args()
+
+    # Set parameters, from the config file when there is one
+    config_path = args.config or ('boards.json' if os.path.exists('boards.json') else None)
+    matcher = None
+    crawler_options = {}
+    if config_path:
+        try:
+            config, matchers = load_watchlists(config_path)
+        except (OSError, ValueError) as e:
+            print(f"錯誤：無法讀取設定檔 {config_path}：{str(e)}")
+            return
+        entries = {entry['board']: entry for entry in config['boards']}
+        board = args.board or config['boards'][0]['board']
+        if board not in entries:
+            print(f"錯誤：設定檔 {config_path} 中沒有看板 {board}")
+            return
+        ticket_keywords = entries[board]['ticket_keywords']
+        max_pages = entries[board]['max_pages']
+        artists_groups = entries[board]['artists_groups']
+        matcher = matchers[board]
+        crawler_options = {key: config[key] for key in ('base_url', 'line_api_url') if key in config}
+    else:
+        board = args.board or 'Drama-Ticket'
+        ticket_keywords = ['售']  # '售票' / '換票' / '降售' / '售' /
+        max_pages = 30
+
+        # Set multiple artists to search
+        # The same artist keyword put in the same list
+        artists_groups = [
+            ['gracie'],               # First artist group
+            ['babymonster', '寶怪']   # Second artist group
+            # {'artists': ['gracie'], 'strategy': 'search'}  # Rare artists: query the board search instead of walking the index
+        ]
+
+    # A scheduled run of a quiet board stops after one conditional request, see ptt_startup
+    watchlists = [group_watchlist(group) for group in artists_groups]
+    if args.mode == 'once' and not args.full and all(strategy == 'index' for _, strategy in watchlists):
+        base_url = crawler_options.get('base_url', 'https://www.ptt.cc')
+        if board_unchanged(f"./ptt_{board}_data", f"{base_url}/bbs/{board}/index.html",
+                           [(ticket_keywords, artists) for artists, _ in watchlists]):
+            print(f"{board} 沒有新文章，略過本次爬取")
+            if args.metrics_json:
+                dump_json(args.metrics_json)
+                print(f"效能指標已保存至 {args.metrics_json}")
+            return
+
+    if not os.environ.get("LINE_TOKEN") or not os.environ.get("LINE_USER_ID"):
+        # Load environment variables from .env file
+        from dotenv import load_dotenv
+        load_dotenv()
     LINE_TOKEN = os.environ.get("LINE_TOKEN")
     LINE_USER_ID = os.environ.get("LINE_USER_ID")
     
-    # Check if environment variables are set
-    if not LINE_TOKEN or not LINE_USER_ID:
+    # Check if environment variables are set, backfills send no notifications
+    if args.mode != 'backfill' and (not LINE_TOKEN or not LINE_USER_ID):
         print("錯誤：未設定 LINE_TOKEN 或 LINE_USER_ID 環境變數")
         return 
-    
-    # Set parameters
-    board = 'Drama-Ticket'
-    ticket_keywords = ['售']  # '售票' / '換票' / '降售' / '售' /
-    max_pages = 30
-    
-    # Set multiple artists to search
-    # The same artist keyword put in the same list
-    artists_groups = [
-        ['gracie'],               # First artist group
-        ['babymonster', '寶怪']   # Second artist group
-    ]
+
+    # The config's host_rates replace the defaults of the shared client
+    if config_path:
+        crawler_options['http'] = HttpClient(cookies=[('over18', '1', '.ptt.cc')], limiter=build_limiter(config))
+
+    if args.metrics_port:
+        serve(args.metrics_port, args.metrics_host)
+        print(f"Metrics 位址：http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+    if args.mode == 'backfill':
+        backfill_crawlers(
+            artists_groups=artists_groups,
+            board=board,
+            ticket_keywords=ticket_keywords,
+            start_page=args.start_page,
+            end_page=args.end_page,
+            parse_workers=args.parse_workers,
+            crawler_options=crawler_options
+        )
+        if args.metrics_json:
+            dump_json(args.metrics_json)
+            print(f"效能指標已保存至 {args.metrics_json}")
+        return
+
+    if args.mode == 'watch':
+        watch_crawlers(
+            artists_groups=artists_groups,
+            board=board,
+            ticket_keywords=ticket_keywords,
+            max_pages=max_pages,
+            line_token=LINE_TOKEN,
+            line_user_id=LINE_USER_ID,
+            scheduler=AdaptiveScheduler(args.min_interval, args.max_interval),
+            crawler_options=crawler_options,
+            matcher=matcher
+        )
+        if args.metrics_json:
+            dump_json(args.metrics_json)
+            print(f"效能指標已保存至 {args.metrics_json}")
+        return
 
     # Run crawlers concurrently
     results = run_crawlers_concurrently(
@@ -348,15 +894,17 @@ def main():
         ticket_keywords=ticket_keywords,
         max_pages=max_pages,
         line_token=LINE_TOKEN,
-        line_user_id=LINE_USER_ID
+        line_user_id=LINE_USER_ID,
+        crawler_options=crawler_options,
+        matcher=matcher
     )
-    
-    print("\n-----爬蟲完成-----")
-    for result in results:
-        artist_group = result['artist_keywords']
-        total_articles_checked = result['total_articles_checked']
-        new_articles_count = result['new_articles_count']
-        print(f"{artist_group} 找到了 {total_articles_checked} 篇文章，其中有 {new_articles_count} 篇新文章。")
+    print_results(results)
+
+    # Wait for the queued LINE notifications, undelivered ones are saved for the next run
+    close_outboxes()
+    if args.metrics_json:
+        dump_json(args.metrics_json)
+        print(f"效能指標已保存至 {args.metrics_json}")
 
 if __name__ == "__main__":
     main()
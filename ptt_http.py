@@ -0,0 +1,532 @@
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from ptt_metrics import (
+    HTTP_BACKOFF_SECONDS, HTTP_IN_FLIGHT_LIMIT, HTTP_RATE, HTTP_RATE_DECREASES_TOTAL, HTTP_RETRIES_TOTAL,
+    RATE_LIMIT_WAIT_SECONDS
+)
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Requests per second and burst size for each host, shared by every crawler in the process.
+# PTT is a volunteer-run site: one request every two seconds unless the config asks for more
+DEFAULT_HOST_RATES = {
+    'www.ptt.cc': (0.5, 1),
+    'api.line.me': (10.0, 10),
+}
+
+
+def retry_after_seconds(value):
+    """Seconds asked for by a Retry-After header (delta-seconds or HTTP date), None when missing or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket, usable from threads and coroutines
+
+    A caller reserves a token and then waits until it is due, so waiters are
+    served in arrival order and the long-run rate never exceeds rate.
+    acquire_fair instead serves callers of different keys (e.g. boards) in
+    turns.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.turns = threading.Condition(self.lock)
+        self.waiting = {}  # Key -> tickets of its waiting callers, in arrival order
+        self.order = deque()  # Keys with waiting callers, served round-robin
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take one token, return seconds to wait before using it"""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def pause(self, seconds):
+        """Hand out no token for the next seconds, e.g. after a Retry-After"""
+        with self.turns:
+            self._refill()
+            # Overlapping pauses do not add up
+            self.tokens = min(self.tokens, -seconds * self.rate)
+            self.turns.notify_all()
+
+    def acquire_fair(self, key):
+        """Wait for a token, taking turns with the callers of other keys
+
+        Tokens are only handed out once they are available, one per key in
+        round-robin order, so a key with many waiting threads gets no more
+        of the rate than a key with a single waiter while both wait.
+        """
+        ticket = object()
+        with self.turns:
+            queue = self.waiting.get(key)
+            if queue is None:
+                queue = self.waiting[key] = deque()
+                self.order.append(key)
+            queue.append(ticket)
+            while True:
+                if self.order[0] != key or queue[0] is not ticket:
+                    self.turns.wait()
+                    continue
+                self._refill()
+                if self.tokens < 1:
+                    self.turns.wait((1 - self.tokens) / self.rate)
+                    continue
+                self.tokens -= 1
+                queue.popleft()
+                self.order.popleft()
+                if queue:
+                    self.order.append(key)
+                else:
+                    del self.waiting[key]
+                self.turns.notify_all()
+                return
+
+    async def acquire_async(self):
+        import asyncio  # Only the async engine needs it, and it is slow to import
+
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class InFlightLimit:
+    """Counting semaphore whose limit can be changed while it is held
+
+    The limit may be fractional so it can grow in small steps; the whole
+    part of it is enforced.
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1.0, float(limit))
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def set_limit(self, limit):
+        with self.cond:
+            self.limit = max(1.0, float(limit))
+            self.cond.notify_all()
+
+    @contextmanager
+    def hold(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                self.cond.notify()
+
+
+class AimdController:
+    """Adapts a host's request rate and in-flight limit to how the host answers
+
+    Additive increase while responses are 200 and fast: the rate grows by
+    increase requests/sec for every second's worth of successes and the
+    in-flight limit by one for every limit successes. Multiplicative
+    decrease on 429 / 502 / 503 / 504, timeouts and connection errors, or
+    when the average latency reaches latency_factor times the fastest
+    average seen: both are multiplied by decrease, at most once per
+    cooldown seconds so one burst of failures counts once. A Retry-After
+    pauses the whole host, not only the request that got it.
+    """
+
+    CONGESTION_STATUS = {429, 502, 503, 504}
+
+    def __init__(self, host, bucket, slots=None, min_rate=0.25, max_rate=None, increase=0.1, decrease=0.5,
+                 latency_factor=3.0, min_latency=0.2, cooldown=1.0, max_pause=600.0):
+        """
+        Parameters:
+        host (str): Host name, for the metrics
+        bucket (TokenBucket): Bucket whose rate is adapted
+        slots (InFlightLimit): In-flight limit to adapt, None to leave concurrency alone
+        min_rate (float): Lowest requests per second
+        max_rate (float): Highest requests per second, default the starting rate
+        increase (float): Requests per second added per second of successes
+        decrease (float): Factor applied to rate and in-flight limit on congestion
+        latency_factor (float): Average latency over the fastest average that counts as congestion
+        min_latency (float): Average latency in seconds below which latency never counts as congestion
+        cooldown (float): Shortest time in seconds between two decreases
+        max_pause (float): Longest Retry-After honored, in seconds
+        """
+        self.host = host
+        self.bucket = bucket
+        self.slots = slots
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate or bucket.rate, bucket.rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_latency = min_latency
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.max_in_flight = slots.limit if slots else None
+        if slots:
+            # Start at half the cap and earn the rest
+            slots.set_limit(max(1, self.max_in_flight // 2))
+        self.latency = None
+        self.fastest = None
+        self.samples = 0
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        HTTP_RATE.set(self.bucket.rate, host=self.host)
+        if self.slots:
+            HTTP_IN_FLIGHT_LIMIT.set(self.slots.limit, host=self.host)
+
+    def on_response(self, status, latency, retry_after=None):
+        """Adapt to a response, return the seconds the host was paused for (0 when it was not)"""
+        if status in self.CONGESTION_STATUS:
+            self._cut(str(status))
+            pause = retry_after_seconds(retry_after)
+            if pause:
+                pause = min(pause, self.max_pause)
+                self.bucket.pause(pause)
+                return pause
+            return 0.0
+
+        with self.lock:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.samples += 1
+            if self.samples >= 5:
+                self.fastest = self.latency if self.fastest is None else min(self.fastest, self.latency)
+            slow = (self.fastest is not None and self.latency >= self.min_latency
+                    and self.latency >= self.latency_factor * self.fastest)
+        if slow:
+            self._cut('latency')
+        elif status == 200:
+            with self.lock:
+                rate = self.bucket.rate
+                self.bucket.set_rate(min(self.max_rate, rate + self.increase / rate))
+                if self.slots and self.slots.limit < self.max_in_flight:
+                    self.slots.set_limit(min(self.max_in_flight, self.slots.limit + 1 / self.slots.limit))
+            self._publish()
+        return 0.0
+
+    def on_error(self):
+        """Adapt to a timeout or connection error"""
+        self._cut('error')
+
+    def _cut(self, reason):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+            if self.slots:
+                self.slots.set_limit(self.slots.limit * self.decrease)
+        HTTP_RATE_DECREASES_TOTAL.inc(host=self.host, reason=reason)
+        self._publish()
+
+
+class HostRateLimiter:
+    """One TokenBucket per host, created on first use, and an optional cap on requests in flight per host
+
+    With adaptive=True each host also gets an AimdController that moves its
+    rate between an eighth of the configured rate and the configured rate,
+    and its in-flight cap up to max_in_flight, following the responses
+    reported to record. The rate only climbs above the configured one for
+    hosts given a higher ceiling in max_rates.
+    """
+
+    def __init__(self, rates=None, default_rate=(2.0, 4), max_in_flight=None, adaptive=False, max_rates=None):
+        """
+        Parameters:
+        rates (dict): Host -> (requests per second, burst)
+        default_rate (tuple): Rate for hosts missing from rates, None disables limiting
+        max_in_flight (int): Concurrent requests per host, None for no cap
+        adaptive (bool): Adapt rate and in-flight cap to the responses, see AimdController
+        max_rates (dict): Host -> highest requests per second the adaptation may reach, default the configured rate
+        """
+        self.rates = dict(DEFAULT_HOST_RATES if rates is None else rates)
+        self.default_rate = default_rate
+        self.max_in_flight = max_in_flight
+        self.adaptive = adaptive
+        self.max_rates = dict(max_rates or {})
+        self.buckets = {}
+        self.slots = {}
+        self.controllers = {}
+        self.lock = threading.Lock()
+
+    def _host_state(self, host):
+        # Called with self.lock held
+        if host not in self.buckets:
+            rate = self.rates.get(host, self.default_rate)
+            bucket = self.buckets[host] = TokenBucket(*rate) if rate else None
+            slots = self.slots[host] = InFlightLimit(self.max_in_flight) if self.max_in_flight else None
+            if self.adaptive and bucket:
+                self.controllers[host] = AimdController(host, bucket, slots, min_rate=bucket.rate / 8,
+                                                        max_rate=self.max_rates.get(host))
+
+    def bucket(self, url):
+        host = urlsplit(url).hostname or ''
+        with self.lock:
+            self._host_state(host)
+            return self.buckets[host]
+
+    def record(self, url, status=None, latency=None, retry_after=None):
+        """Report the outcome of a request, status None for a timeout or connection error
+
+        Returns the seconds the host was paused for by a Retry-After, 0 when
+        it was not or the limiter is not adaptive.
+        """
+        host = urlsplit(url).hostname or ''
+        with self.lock:
+            self._host_state(host)
+            controller = self.controllers.get(host)
+        if controller is None:
+            return 0.0
+        if status is None:
+            controller.on_error()
+            return 0.0
+        return controller.on_response(status, latency, retry_after)
+
+    def acquire(self, url, key=None):
+        """Wait for a token of url's host; callers passing a key take turns with other keys"""
+        bucket = self.bucket(url)
+        if bucket:
+            with RATE_LIMIT_WAIT_SECONDS.time(host=urlsplit(url).hostname or ''):
+                if key is None:
+                    bucket.acquire()
+                else:
+                    bucket.acquire_fair(key)
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of the host's in-flight slots for the duration of the with block"""
+        host = urlsplit(url).hostname or ''
+        with self.lock:
+            self._host_state(host)
+            slots = self.slots[host]
+        if slots is None:
+            yield
+            return
+        with slots.hold():
+            yield
+
+    async def acquire_async(self, url):
+        bucket = self.bucket(url)
+        if bucket:
+            with RATE_LIMIT_WAIT_SECONDS.time(host=urlsplit(url).hostname or ''):
+                await bucket.acquire_async()
+
+
+class HttpClient:
+    """Thread-safe pooled HTTP client with timeouts and capped exponential backoff
+
+    Every thread gets its own keep-alive requests.Session (requests does not
+    promise that one Session is safe to share), all configured once with the
+    same headers, cookies and connection pool size. The crawlers' thread
+    pools come and go with each crawl, so the sessions of threads that have
+    exited are closed whenever a new one is opened. Connection errors,
+    timeouts and transient status codes are retried, and every attempt
+    first takes a token from the per-host rate limiter.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, headers=None, cookies=None, timeout=(5, 20), max_retries=3,
+                 backoff_base=1.0, backoff_max=30.0, pool_maxsize=10, limiter=None):
+        """
+        Parameters:
+        headers (dict): Headers sent with every request
+        cookies (list): (name, value, domain) tuples set on every session
+        timeout (tuple): (connect, read) timeout in seconds
+        max_retries (int): Retries after the first attempt
+        backoff_base (float): Delay before the first retry, doubled after each retry
+        backoff_max (float): Upper bound of a single retry delay
+        pool_maxsize (int): Keep-alive connections kept per host
+        limiter (HostRateLimiter): Per-host rate limit, None for no limit
+        """
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.cookies = list(cookies or [])
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_maxsize = pool_maxsize
+        self.limiter = limiter
+        self._local = threading.local()
+        self._sessions = {}  # Thread -> its session
+        self._sessions_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            # requests is imported on first use, a run that ends after probe() never loads it
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(self.headers)
+            for name, value, domain in self.cookies:
+                session.cookies.set(name, value, domain=domain)
+            self._local.session = session
+            with self._sessions_lock:
+                dead = [thread for thread in self._sessions if not thread.is_alive()]
+                for thread in dead:
+                    # Their keep-alive sockets would stay open until close() otherwise
+                    self._sessions.pop(thread).close()
+                self._sessions[threading.current_thread()] = session
+        return session
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Delay before retry number attempt + 1, honoring Retry-After"""
+        seconds = retry_after_seconds(retry_after)
+        if seconds is not None:
+            return min(self.backoff_max, seconds)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def request(self, method, url, throttle=True, key=None, **kwargs):
+        """Send a request, retrying connection errors, timeouts and transient status codes
+
+        throttle=False skips the limiter for the first attempt, for callers
+        that already awaited a token. key (e.g. the board) makes the request
+        take turns for tokens with requests of other keys. Returns the last
+        response; raises the last requests exception when every attempt
+        failed without a response.
+        """
+        import requests
+
+        kwargs.setdefault('timeout', self.timeout)
+        session = self._session()
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter and (throttle or attempt):
+                self.limiter.acquire(url, key)
+            paused = 0.0
+            try:
+                if self.limiter:
+                    with self.limiter.slot(url):
+                        start = time.monotonic()
+                        response = session.request(method, url, **kwargs)
+                    paused = self.limiter.record(
+                        url, response.status_code, time.monotonic() - start, response.headers.get('Retry-After')
+                    )
+                else:
+                    response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.limiter:
+                    self.limiter.record(url)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                reason = type(e).__name__
+            else:
+                if response.status_code not in self.RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+                delay = self.backoff_delay(attempt, response.headers.get('Retry-After'))
+                reason = response.status_code
+                response.close()
+            host = urlsplit(url).hostname or ''
+            HTTP_RETRIES_TOTAL.inc(host=host, reason=reason)
+            # A host paused by Retry-After already holds back the next attempt's token
+            if paused and self.limiter.bucket(url):
+                continue
+            HTTP_BACKOFF_SECONDS.inc(delay, host=host)
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Return the process-wide client shared by every crawler"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient(
+                cookies=[('over18', '1', '.ptt.cc')],
+                limiter=HostRateLimiter(max_in_flight=4, adaptive=True)
+            )
+        return _default_client
+
+
+def probe(url, headers=None, cookies=None, timeout=10):
+    """Single GET through http.client, without loading requests, return (status, headers, body) or None on error
+
+    For the quick "did anything change" request of a scheduled run; the
+    body is not decompressed, so no Accept-Encoding is sent.
+    """
+    import http.client
+
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    request_headers = dict(DEFAULT_HEADERS)
+    request_headers.update(headers or {})
+    if cookies:
+        request_headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in cookies)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    connection = connection_class(parts.netloc, timeout=timeout)
+    try:
+        connection.request('GET', path, headers=request_headers)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
@@ -0,0 +1,141 @@
+class KeywordMatcher:
+    """Aho-Corasick automaton over the ticket and artist keywords of many watchlists
+
+    Built once from every group's keywords, a single scan of the lowercased
+    title returns all groups whose ticket and artist keywords both match.
+    Matching follows PTTCrawler.match_title: case-insensitive substring
+    search, and an empty keyword list matches any title.
+    """
+
+    TICKET = 0
+    ARTIST = 1
+
+    def __init__(self, groups):
+        """
+        Parameters:
+        groups (dict): Group key -> (ticket_keywords, artist_keywords)
+        """
+        self.groups = dict(groups)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._owners = []           # Keyword id -> [(group key, kind), ...]
+        self._keyword_ids = {}
+        self._needs = {}            # Group key -> (needs ticket hit, needs artist hit)
+        self._base_hits = ([], [])  # Hits from empty keywords, present in every title
+        self._always = []           # Groups without any keyword match everything
+
+        for key, (ticket_keywords, artist_keywords) in self.groups.items():
+            ticket_keywords = ticket_keywords or []
+            artist_keywords = artist_keywords or []
+            self._needs[key] = (bool(ticket_keywords), bool(artist_keywords))
+            if not ticket_keywords and not artist_keywords:
+                self._always.append(key)
+            for kind, keywords in ((self.TICKET, ticket_keywords), (self.ARTIST, artist_keywords)):
+                for keyword in keywords:
+                    self._add_keyword(keyword.lower(), key, kind)
+
+        self._build_failure_links()
+
+    def _add_keyword(self, keyword, key, kind):
+        if not keyword:
+            self._base_hits[kind].append(key)
+            return
+
+        keyword_id = self._keyword_ids.get(keyword)
+        if keyword_id is None:
+            keyword_id = len(self._owners)
+            self._keyword_ids[keyword] = keyword_id
+            self._owners.append([])
+
+            node = 0
+            for ch in keyword:
+                next_node = self._goto[node].get(ch)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][ch] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = next_node
+            self._out[node].append(keyword_id)
+
+        self._owners[keyword_id].append((key, kind))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(ch, 0)
+                self._fail[next_node] = fallback if fallback != next_node else 0
+                # Merge outputs along the failure chain so scan needs no extra walk
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+
+    def to_state(self):
+        """JSON-serializable form of the built automaton, see from_state"""
+        return {
+            'groups': [[key, list(keywords[0] or []), list(keywords[1] or [])] for key, keywords in self.groups.items()],
+            'goto': self._goto,
+            'fail': self._fail,
+            'out': self._out,
+            'owners': self._owners,
+            'keyword_ids': self._keyword_ids,
+            'needs': [[key, needs[0], needs[1]] for key, needs in self._needs.items()],
+            'base_hits': [self._base_hits[0], self._base_hits[1]],
+            'always': self._always,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Matcher from to_state output, without rebuilding the automaton"""
+        matcher = cls.__new__(cls)
+        matcher.groups = {key: (ticket, artist) for key, ticket, artist in state['groups']}
+        matcher._goto = state['goto']
+        matcher._fail = state['fail']
+        matcher._out = state['out']
+        matcher._owners = [[tuple(owner) for owner in owners] for owners in state['owners']]
+        matcher._keyword_ids = state['keyword_ids']
+        matcher._needs = {key: (ticket, artist) for key, ticket, artist in state['needs']}
+        matcher._base_hits = (state['base_hits'][0], state['base_hits'][1])
+        matcher._always = state['always']
+        return matcher
+
+    def scan(self, text):
+        """Return ids of every keyword found in the already lowercased text"""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        node = 0
+
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+
+        return found
+
+    def match(self, title):
+        """Return the set of group keys whose keywords match title"""
+        ticket_hits = set(self._base_hits[self.TICKET])
+        artist_hits = set(self._base_hits[self.ARTIST])
+        for keyword_id in self.scan(title.lower()):
+            for key, kind in self._owners[keyword_id]:
+                if kind == self.TICKET:
+                    ticket_hits.add(key)
+                else:
+                    artist_hits.add(key)
+
+        matched = set(self._always)
+        for key in ticket_hits | artist_hits:
+            needs_ticket, needs_artist = self._needs[key]
+            if (not needs_ticket or key in ticket_hits) and (not needs_artist or key in artist_hits):
+                matched.add(key)
+
+        return matched
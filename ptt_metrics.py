@@ -0,0 +1,301 @@
+"""Counters and histograms for crawl stages, in Prometheus text format or JSON
+
+Metrics live in a process-wide registry. Instrumented code records into
+the metrics defined at the bottom of this module, e.g.
+
+    with FETCH_SECONDS.time(board='Drama-Ticket', kind='index'):
+        ...
+
+render_prometheus() returns the text exposition format, serve() exposes
+it on /metrics for watch mode, and dump_json() writes a snapshot at the
+end of a one-shot run.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(self.name, self._labels(key), value) for key, value in items]
+
+    def snapshot(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [{'labels': dict(self._labels(key)), 'value': value} for key, value in items]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][idx] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _items(self):
+        with self.lock:
+            return sorted(
+                (key, {'counts': list(state['counts']), 'sum': state['sum'], 'count': state['count']})
+                for key, state in self.values.items()
+            )
+
+    def samples(self):
+        samples = []
+        for key, state in self._items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels + [('le', _format_value(bound))], cumulative))
+            samples.append((self.name + '_sum', labels, state['sum']))
+            samples.append((self.name + '_count', labels, state['count']))
+        return samples
+
+    def snapshot(self):
+        return [
+            {'labels': dict(self._labels(key)), 'count': state['count'], 'sum': state['sum'],
+             'buckets': dict(zip((_format_value(bound) for bound in self.buckets), state['counts']))}
+            for key, state in self._items()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered differently")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {
+            metric.name: {'type': metric.type, 'help': metric.help, 'samples': metric.snapshot()}
+            for metric in metrics
+        }
+
+    def clear(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+
+def render_prometheus(registry=REGISTRY):
+    return registry.render_prometheus()
+
+
+def dump_json(path, registry=REGISTRY):
+    """Write a JSON snapshot of every metric to path"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(registry.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def serve(port, host='127.0.0.1', registry=REGISTRY):
+    """Serve the registry in Prometheus text format on /metrics from a daemon thread, return the server
+
+    Only local scrapers can reach it by default; pass host='0.0.0.0' to
+    expose it on every interface.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+def page_kind(url):
+    """Kind of a PTT URL for labels: index, search, article or other"""
+    path = url.split('?')[0].rsplit('/', 1)[-1]
+    if path.startswith('index'):
+        return 'index'
+    if path == 'search':
+        return 'search'
+    if path.startswith('M.'):
+        return 'article'
+    return 'other'
+
+
+# Crawl stages
+FETCH_SECONDS = REGISTRY.histogram(
+    'ptt_fetch_seconds', 'Time to fetch a PTT page, including retries and rate limit waits', ['board', 'kind'])
+REQUESTS_TOTAL = REGISTRY.counter(
+    'ptt_requests_total', 'PTT page requests by final outcome (status code or error)', ['board', 'kind', 'status'])
+PARSE_SECONDS = REGISTRY.histogram(
+    'ptt_parse_seconds', 'Time to parse a PTT page', ['board', 'kind'])
+MATCH_SECONDS = REGISTRY.histogram(
+    'ptt_match_seconds', 'Time to match the titles of one index page against the watchlists', ['board'])
+CACHE_FLUSH_SECONDS = REGISTRY.histogram(
+    'ptt_cache_flush_seconds', 'Time to write staged articles to an article cache and evict old ones', ['cache'])
+OUTPUT_WRITE_SECONDS = REGISTRY.histogram(
+    'ptt_output_write_seconds', 'Time to append a run\'s results to the output file', ['board'])
+INDEX_PAGES_TOTAL = REGISTRY.counter(
+    'ptt_index_pages_total', 'Index pages by outcome (not_modified, unchanged or parsed)', ['board', 'result'])
+
+# Per watchlist
+ARTICLES_CHECKED_TOTAL = REGISTRY.counter(
+    'ptt_articles_checked_total', 'Matching articles checked against the cache', ['board', 'watchlist'])
+NEW_ARTICLES_TOTAL = REGISTRY.counter(
+    'ptt_new_articles_total', 'New articles found and queued for notification', ['board', 'watchlist'])
+ARTICLE_DETAILS_TOTAL = REGISTRY.counter(
+    'ptt_article_details_total', 'Article detail lookups by source (fetched, shared or failed)', ['board', 'watchlist', 'source'])
+
+# LINE
+LINE_PUSH_SECONDS = REGISTRY.histogram(
+    'line_push_seconds', 'Time of one LINE push request, including client retries', [])
+LINE_PUSHES_TOTAL = REGISTRY.counter(
+    'line_pushes_total', 'LINE push requests by final outcome (status code or error)', ['status'])
+LINE_MESSAGES_TOTAL = REGISTRY.counter(
+    'line_messages_total', 'Text messages delivered to LINE', [])
+
+# HTTP client
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    'http_rate_limit_wait_seconds', 'Time a request waited for a rate limit token', ['host'])
+HTTP_RETRIES_TOTAL = REGISTRY.counter(
+    'http_retries_total', 'Retried HTTP attempts by reason (status code or error)', ['host', 'reason'])
+HTTP_BACKOFF_SECONDS = REGISTRY.counter(
+    'http_backoff_seconds_total', 'Time slept between HTTP retries', ['host'])
+HTTP_RATE = REGISTRY.gauge(
+    'http_rate', 'Current requests per second allowed to a host by the adaptive limiter', ['host'])
+HTTP_IN_FLIGHT_LIMIT = REGISTRY.gauge(
+    'http_in_flight_limit', 'Current concurrent requests allowed to a host by the adaptive limiter', ['host'])
+HTTP_RATE_DECREASES_TOTAL = REGISTRY.counter(
+    'http_rate_decreases_total', 'Rate and concurrency cuts by the adaptive limiter by reason', ['host', 'reason'])
+
+# Cluster workers
+CLUSTER_UNITS_TOTAL = REGISTRY.counter(
+    'cluster_units_total', 'Work units run by this worker by outcome (done, failed or lost)', ['kind', 'result'])
+NOTIFY_CLAIMS_TOTAL = REGISTRY.counter(
+    'notify_claims_total', 'Notification claims by outcome (won, expired claim won again, or taken by another worker)', ['board', 'result'])
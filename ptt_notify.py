@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+
+from ptt_metrics import LINE_MESSAGES_TOTAL, LINE_PUSHES_TOTAL, LINE_PUSH_SECONDS
+from ptt_output import read_jsonl
+
+LINE_PUSH_URL = 'https://api.line.me/v2/bot/message/push'
+MAX_MESSAGES_PER_PUSH = 5  # LINE accepts at most 5 message objects per push
+MAX_TEXT_LENGTH = 5000  # LINE limit for one text message
+
+
+def split_text(text, max_length=MAX_TEXT_LENGTH):
+    """Split text into chunks of at most max_length, preferring line breaks"""
+    chunks = []
+    while len(text) > max_length:
+        cut = text.rfind('\n', 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class LineOutbox:
+    """Background LINE push queue with multi-message packing, retries and a pending file
+
+    enqueue only appends to the queue and returns. A dispatcher thread
+    formats the queued articles articles_per_message at a time into text
+    messages, splits messages longer than the text limit, and packs up to
+    5 messages into each push. Transient failures are retried with capped
+    exponential backoff, reusing the push's X-Line-Retry-Key so LINE drops
+    duplicates. Undelivered articles are kept in a JSON file and resent by
+    the next outbox opened on the same file. enqueue only appends its
+    articles to a journal next to that file; the dispatcher rewrites the
+    file after each push and on close, and a new outbox replays the
+    journal left by a crash.
+
+    Articles carrying a 'groups' list are merged with a queued, not yet
+    sending copy of the same URL, so an article matching several
+    watchlists is pushed once listing every group.
+    """
+
+    def __init__(self, http, access_token, user_id, path, formatter, api_url=LINE_PUSH_URL,
+                 articles_per_message=5, linger=0.5, backoff_base=2.0, backoff_max=300.0):
+        """
+        Parameters:
+        http (HttpClient): Client used for the pushes
+        access_token (str): Your Channel Access Token
+        user_id (str): LINE user ID of the recipient
+        path (str): JSON file holding undelivered articles, journaled to path + '.journal'
+        formatter (callable): Turns a list of articles into one message text
+        api_url (str): Push endpoint, overridable for a local stub server
+        articles_per_message (int): Articles formatted into one text message
+        linger (float): Seconds to wait for more articles before pushing
+        backoff_base (float): Delay before the first retry, doubled after each failure
+        backoff_max (float): Upper bound of a retry delay
+        """
+        self.http = http
+        self.access_token = access_token
+        self.user_id = user_id
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.formatter = formatter
+        self.api_url = api_url
+        self.articles_per_message = articles_per_message
+        self.linger = linger
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.condition = threading.Condition()
+        self.sending = 0  # Articles at the head of pending carried by the push in progress
+        self.pending = self.load_pending()
+        if os.path.exists(self.journal_path):
+            self.save_pending()
+        self.closed = False
+        self.thread = threading.Thread(target=self._dispatch, name='line-outbox', daemon=True)
+        self.thread.start()
+        if self.pending:
+            print(f"  LINE 通知佇列中有 {len(self.pending)} 篇上次未送出的文章，將重新發送")
+
+    def load_pending(self):
+        """Return the pending file's articles with the journaled enqueues replayed on top"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.pending = json.load(f)
+        except:
+            self.pending = []
+        if os.path.exists(self.journal_path):
+            self.merge(read_jsonl(self.journal_path))
+        return self.pending
+
+    def save_pending(self):
+        """Atomically rewrite the pending file and clear the journal, caller holds the condition"""
+        if not self.pending:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.pending, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def merge(self, articles):
+        """Append articles to pending, merging groups into a queued copy of the same URL"""
+        queued = {
+            article.get('url'): article for article in self.pending[self.sending:]
+            if article.get('groups') is not None
+        }
+        for article in articles:
+            match = queued.get(article.get('url')) if article.get('groups') is not None else None
+            if match is None:
+                self.pending.append(article)
+                queued[article.get('url')] = article
+                continue
+            for group in article['groups']:
+                if group not in match['groups']:
+                    match['groups'].append(group)
+
+    def enqueue(self, articles):
+        """Queue articles for delivery and return without waiting for LINE
+
+        The articles are on disk when enqueue returns: they are appended to
+        the journal, the pending file itself is rewritten by the dispatcher.
+        """
+        if not articles:
+            return
+        data = ''.join(json.dumps(article, ensure_ascii=False) + '\n' for article in articles)
+        with self.condition:
+            self.merge(articles)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            self.condition.notify_all()
+
+    def build_push(self, articles):
+        """Return (messages, article count) of the next push from the head of articles"""
+        messages = []
+        count = 0
+        while count < len(articles) and len(messages) < MAX_MESSAGES_PER_PUSH:
+            group = articles[count:count + self.articles_per_message]
+            chunks = split_text(self.formatter(group))
+            if messages and len(messages) + len(chunks) > MAX_MESSAGES_PER_PUSH:
+                break
+            # A single group longer than 5 messages is cut, it would never fit otherwise
+            messages.extend(chunks[:MAX_MESSAGES_PER_PUSH - len(messages)])
+            count += len(group)
+        return messages, count
+
+    def push(self, messages, retry_key):
+        """Send one push, return 'sent', 'retry' or 'drop'"""
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.access_token}',
+            'X-Line-Retry-Key': retry_key
+        }
+        data = {
+            'to': self.user_id,
+            'messages': [{'type': 'text', 'text': text} for text in messages]
+        }
+
+        try:
+            with LINE_PUSH_SECONDS.time():
+                response = self.http.post(self.api_url, headers=headers, data=json.dumps(data))
+        except Exception as e:
+            LINE_PUSHES_TOTAL.inc(status='error')
+            print(f"  LINE 通知發送失敗: {str(e)}")
+            return 'retry'
+
+        LINE_PUSHES_TOTAL.inc(status=response.status_code)
+        # 409 means an earlier attempt with this retry key was already accepted
+        if response.status_code in (200, 409):
+            LINE_MESSAGES_TOTAL.inc(len(messages))
+            print(f"  LINE 通知發送成功！({len(messages)} 則訊息)")
+            return 'sent'
+        print(f"  LINE 通知發送失敗。狀態碼: {response.status_code}\n  回應: {response.text}")
+        if response.status_code == 429 or response.status_code >= 500:
+            return 'retry'
+        # Other 4xx responses will not succeed on retry
+        return 'drop'
+
+    def _dispatch(self):
+        import uuid  # Slow to import, runs without notifications never start this thread
+
+        failures = 0
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                if not failures:
+                    # Give the crawl a moment to queue the rest of the page
+                    linger_until = time.monotonic() + self.linger
+                    while not self.closed and time.monotonic() < linger_until:
+                        self.condition.wait(linger_until - time.monotonic())
+                    # A retry resends the same messages, LINE dedupes by retry key and payload
+                    messages, count = self.build_push(list(self.pending))
+                    retry_key = str(uuid.uuid4())
+                self.sending = count
+
+            result = self.push(messages, retry_key)
+
+            with self.condition:
+                if result == 'retry':
+                    failures += 1
+                    retry_at = time.monotonic() + min(self.backoff_max, self.backoff_base * (2 ** (failures - 1)))
+                    while not self.closed and time.monotonic() < retry_at:
+                        self.condition.wait(retry_at - time.monotonic())
+                    if self.closed:
+                        return
+                    continue
+                if result == 'drop':
+                    print(f"  已捨棄 {count} 篇無法發送的文章通知")
+                del self.pending[:count]
+                self.sending = 0
+                self.save_pending()
+                failures = 0
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the queue is delivered, return False on timeout or when delivery keeps failing"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending and self.thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return not self.pending
+
+    def close(self, timeout=30.0):
+        """Try to deliver the queue within timeout, then stop; the rest stays in the pending file"""
+        delivered = self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.save_pending()
+            self.condition.notify_all()
+        if not delivered:
+            print(f"  尚有 {len(self.pending)} 篇文章通知未送出，已保存至 {self.path}")
+        return delivered
+
+
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(http, access_token, user_id, path, formatter, api_url=LINE_PUSH_URL):
+    """Return the process-wide outbox for a recipient and pending file, so crawlers share pushes"""
+    key = (api_url, access_token, user_id, os.path.abspath(path))
+    with _outboxes_lock:
+        outbox = _outboxes.get(key)
+        if outbox is None or outbox.closed:
+            outbox = _outboxes[key] = LineOutbox(http, access_token, user_id, path, formatter, api_url)
+        return outbox
+
+
+def close_outboxes(timeout=30.0):
+    """Deliver what every outbox still holds, waiting at most timeout seconds in total"""
+    with _outboxes_lock:
+        outboxes = list(_outboxes.values())
+        _outboxes.clear()
+    deadline = time.monotonic() + timeout
+    for outbox in outboxes:
+        outbox.close(max(0.0, deadline - time.monotonic()))
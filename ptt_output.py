@@ -0,0 +1,157 @@
+"""Append-only JSON Lines output for crawled articles
+
+Usage:
+    python ptt_output.py to-json <file.jsonl> [<file.json>]
+    python ptt_output.py to-jsonl <file.json> [<file.jsonl>]
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, fall back to the in-process lock only
+    fcntl = None
+
+
+class JsonlSink:
+    """Appends one JSON record per line, safe across threads and processes
+
+    Each batch is written with a single O_APPEND write under an exclusive
+    file lock, so concurrent writers never interleave or lose records.
+    fsync runs after every fsync_every records or fsync_interval seconds,
+    and on flush/close.
+    """
+
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def write(self, record):
+        self.write_many([record])
+
+    def write_many(self, records):
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        if not data:
+            return
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(self.fd, view)
+                    view = view[written:]
+            finally:
+                if fcntl:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.unsynced += len(records)
+            if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.fd)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+
+    def close(self):
+        with self.lock:
+            if self.fd is None:
+                return
+            if self.unsynced:
+                self._sync()
+            os.close(self.fd)
+            self.fd = None
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path):
+    """Return the process-wide sink for path, so crawlers writing the same file share it"""
+    path = os.path.abspath(path)
+    with _sinks_lock:
+        sink = _sinks.get(path)
+        # Reopen when the file was closed, or moved away or deleted since it was opened
+        if sink is None or sink.fd is None or not os.path.exists(path):
+            if sink is not None:
+                sink.close()
+            sink = _sinks[path] = JsonlSink(path)
+        return sink
+
+
+def close_sinks():
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+
+def read_jsonl(path):
+    """Yield the records of a JSON Lines file, skipping a torn final line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def read_records(path):
+    """Return the records of an output file in either the JSONL or the old JSON array format"""
+    if path.endswith('.jsonl'):
+        return list(read_jsonl(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def convert_jsonl_to_json(src, dst=None):
+    """Write a JSONL output file as the old indented JSON array, return the output path"""
+    dst = dst or os.path.splitext(src)[0] + '.json'
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(list(read_jsonl(src)), f, ensure_ascii=False, indent=2)
+    return dst
+
+
+def convert_json_to_jsonl(src, dst=None):
+    """Append the records of an old JSON array output file to a JSONL file, return the output path"""
+    dst = dst or os.path.splitext(src)[0] + '.jsonl'
+    sink = JsonlSink(dst)
+    try:
+        sink.write_many(read_records(src))
+    finally:
+        sink.close()
+    return dst
+
+
+def main():
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in ('to-json', 'to-jsonl'):
+        print(__doc__.strip())
+        sys.exit(1)
+
+    dst = sys.argv[3] if len(sys.argv) == 4 else None
+    if sys.argv[1] == 'to-json':
+        print(f"已轉換至 {convert_jsonl_to_json(sys.argv[2], dst)}")
+    else:
+        print(f"已轉換至 {convert_json_to_jsonl(sys.argv[2], dst)}")
+
+
+if __name__ == '__main__':
+    main()
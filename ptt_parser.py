@@ -0,0 +1,230 @@
+import re
+
+
+PREV_PAGE_TEXT = '‹ 上頁'
+
+
+class Bs4Parser:
+    """Reference parser, builds a full html.parser soup of the page"""
+
+    name = 'bs4'
+
+    def __init__(self):
+        # Imported with the first parser rather than the module, it is the slowest import of a run
+        from bs4 import BeautifulSoup
+        self.soup = BeautifulSoup
+
+    def parse_index(self, content, base_url):
+        """Return (rows, prev_page_url) where rows are {'title', 'url'} dicts in page order"""
+        soup = self.soup(content, 'html.parser')
+        return self._index_from_soup(soup, base_url)
+
+    def parse_article(self, content):
+        """Return the article metalines except 標題 as a dict"""
+        soup = self.soup(content, 'html.parser')
+        return self._article_from_soup(soup.find('div', id='main-content'))
+
+    def _index_from_soup(self, soup, base_url):
+        rows = []
+
+        # Get all article links
+        for div in soup.find_all('div', class_='r-ent'):
+            title_div = div.find('div', class_='title')
+            if title_div:
+                link = title_div.find('a')
+                if link:
+                    rows.append({
+                        'title': link.text.strip(),
+                        'url': base_url + link['href']
+                    })
+
+        # Get link to previous page, disabled on the oldest page
+        prev_page_link = soup.find('a', string=PREV_PAGE_TEXT)
+        prev_page_url = base_url + prev_page_link['href'] if prev_page_link and prev_page_link.get('href') else None
+
+        return rows, prev_page_url
+
+    def _article_from_soup(self, main_content):
+        article_data = {}
+
+        if main_content:
+            # Extract data like author, time
+            metalines = main_content.find_all('div', class_='article-metaline')
+            for meta in metalines:
+                meta_name = meta.find('span', class_='article-meta-tag')
+                meta_value = meta.find('span', class_='article-meta-value')
+                if meta_name and meta_value:
+                    key = meta_name.text.strip()
+                    value = meta_value.text.strip()
+                    if key != '標題': # Skip title field as we already have it
+                        article_data[key] = value
+
+        return article_data
+
+
+class StrainerParser(Bs4Parser):
+    """bs4 parser that only builds the nodes we read, via SoupStrainer
+
+    Index pages keep only the board links: an r-ent row's title link points
+    at an article page, 上頁 at an index or search page. Keeping the r-ent
+    divs instead would build every row's whole subtree and save nothing.
+    Article pages keep the metaline divs and skip the article body and
+    pushes.
+    """
+
+    name = 'strainer'
+
+    # Article pages of a board, not its index1234.html pages or search results
+    ARTICLE_HREF = re.compile(r'^/bbs/[^/?]+/(?!index\d*\.html)[^/?]+\.html$')
+
+    def __init__(self):
+        super().__init__()
+        from bs4 import SoupStrainer
+        self.index_strainer = SoupStrainer('a', href=re.compile(r'^/bbs/'))
+        self.article_strainer = SoupStrainer('div', class_='article-metaline')
+
+    def parse_index(self, content, base_url):
+        soup = self.soup(content, 'html.parser', parse_only=self.index_strainer)
+        rows = []
+        prev_page_url = None
+        for link in soup.find_all('a'):
+            href = link['href']
+            if self.ARTICLE_HREF.match(href):
+                rows.append({'title': link.text.strip(), 'url': base_url + href})
+            elif prev_page_url is None and link.text == PREV_PAGE_TEXT:
+                prev_page_url = base_url + href
+        # A disabled 上頁 has no href and is strained out, like Bs4Parser leaves it None
+        return rows, prev_page_url
+
+    def parse_article(self, content):
+        soup = self.soup(content, 'html.parser', parse_only=self.article_strainer)
+        return self._article_from_soup(soup)
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class LxmlParser:
+    """lxml.html backend, needs the optional lxml package"""
+
+    name = 'lxml'
+
+    ROW_XPATH = f"//div[{_has_class('r-ent')}]"
+    LINK_XPATH = f"./div[{_has_class('title')}]//a"
+    PREV_XPATH = f"//a[text()='{PREV_PAGE_TEXT}']/@href"
+    METALINE_XPATH = f"//div[@id='main-content']//div[{_has_class('article-metaline')}]"
+    TAG_XPATH = f".//span[{_has_class('article-meta-tag')}]"
+    VALUE_XPATH = f".//span[{_has_class('article-meta-value')}]"
+
+    def __init__(self):
+        import lxml.html
+        self.lxml_html = lxml.html
+
+    def _document(self, content):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return self.lxml_html.document_fromstring(
+            content, parser=self.lxml_html.HTMLParser(encoding='utf-8')
+        )
+
+    def parse_index(self, content, base_url):
+        doc = self._document(content)
+        rows = []
+        for div in doc.xpath(self.ROW_XPATH):
+            links = div.xpath(self.LINK_XPATH)
+            if links and links[0].get('href') is not None:
+                rows.append({
+                    'title': links[0].text_content().strip(),
+                    'url': base_url + links[0].get('href')
+                })
+
+        prev_hrefs = doc.xpath(self.PREV_XPATH)
+        prev_page_url = base_url + prev_hrefs[0] if prev_hrefs and prev_hrefs[0] else None
+        return rows, prev_page_url
+
+    def parse_article(self, content):
+        article_data = {}
+        for meta in self._document(content).xpath(self.METALINE_XPATH):
+            meta_names = meta.xpath(self.TAG_XPATH)
+            meta_values = meta.xpath(self.VALUE_XPATH)
+            if meta_names and meta_values:
+                key = meta_names[0].text_content().strip()
+                if key != '標題':
+                    article_data[key] = meta_values[0].text_content().strip()
+        return article_data
+
+
+class SelectolaxParser:
+    """selectolax (lexbor) backend, needs the optional selectolax package"""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self.html_parser = LexborHTMLParser
+
+    def parse_index(self, content, base_url):
+        tree = self.html_parser(content)
+        rows = []
+        for link in tree.css('div.r-ent div.title a'):
+            href = link.attributes.get('href')
+            if href is not None:
+                rows.append({'title': link.text().strip(), 'url': base_url + href})
+
+        prev_page_url = None
+        for link in tree.css('a'):
+            if link.text() == PREV_PAGE_TEXT:
+                href = link.attributes.get('href')
+                prev_page_url = base_url + href if href else None
+                break
+        return rows, prev_page_url
+
+    def parse_article(self, content):
+        article_data = {}
+        for meta in self.html_parser(content).css('div#main-content div.article-metaline'):
+            meta_name = meta.css_first('span.article-meta-tag')
+            meta_value = meta.css_first('span.article-meta-value')
+            if meta_name and meta_value:
+                key = meta_name.text().strip()
+                if key != '標題':
+                    article_data[key] = meta_value.text().strip()
+        return article_data
+
+
+PARSERS = {
+    'bs4': Bs4Parser,
+    'strainer': StrainerParser,
+    'lxml': LxmlParser,
+    'selectolax': SelectolaxParser,
+}
+
+# Fastest first; the optional backends are skipped when their package is missing
+PREFERRED_PARSERS = ['selectolax', 'lxml', 'strainer']
+
+
+def get_parser(name=None):
+    """Return a parser backend by name, or the fastest installed one
+
+    Raises ImportError if the named backend's package is missing.
+    """
+    if name:
+        return PARSERS[name]()
+    for preferred in PREFERRED_PARSERS:
+        try:
+            return PARSERS[preferred]()
+        except ImportError:
+            continue
+    return Bs4Parser()
+
+
+def available_parsers():
+    """Names of the backends whose optional packages are installed"""
+    names = []
+    for name in PARSERS:
+        try:
+            get_parser(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
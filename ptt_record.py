@@ -0,0 +1,61 @@
+"""Compact article records passed through the crawl pipeline"""
+
+# Article metalines kept as attributes, in the order PTT shows them (標題 is the title)
+META_FIELDS = (('作者', 'author'), ('看板', 'board'), ('時間', 'time'))
+META_ATTRS = dict(META_FIELDS)
+
+
+class ArticleRecord:
+    """One matching article, from its index row to its output record
+
+    __slots__ keeps a record to a few pointers instead of a dict per
+    article. to_dict() builds the JSON record written to the output file
+    and the notification queue, with the same keys as before: title, url,
+    then the metalines by their Chinese names.
+    """
+
+    __slots__ = ('title', 'url', 'author', 'board', 'time', 'extra')
+
+    def __init__(self, title, url, author=None, board=None, time=None, extra=None):
+        self.title = title
+        self.url = url
+        self.author = author
+        self.board = board
+        self.time = time
+        self.extra = extra  # Other metalines, None when there are none
+
+    @classmethod
+    def from_row(cls, row):
+        """Record of a parsed index row"""
+        return cls(row['title'], row['url'])
+
+    @property
+    def article_id(self):
+        return self.url.split('/')[-1].strip()
+
+    def with_details(self, details):
+        """Set the metalines parsed from the article page, return the record"""
+        for key, value in details.items():
+            attr = META_ATTRS.get(key)
+            if attr:
+                setattr(self, attr, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+        return self
+
+    def to_dict(self, **fields):
+        """JSON record of the article, with fields (e.g. groups) added at the end"""
+        article = {'title': self.title, 'url': self.url}
+        for key, attr in META_FIELDS:
+            value = getattr(self, attr)
+            if value is not None:
+                article[key] = value
+        if self.extra:
+            article.update(self.extra)
+        article.update(fields)
+        return article
+
+    def __repr__(self):
+        return f"ArticleRecord({self.title!r}, {self.url!r})"
@@ -0,0 +1,83 @@
+"""Quick exit for scheduled runs of a board with nothing new
+
+A cron run of a quiet board used to import the HTTP client and the HTML
+parser, open every crawler and walk the newest index page only to find
+nothing to do. board_unchanged answers that question first, with a
+single conditional GET of the newest index page through ptt_http.probe:
+
+- the last complete crawl of the same watchlists stored the hash of that
+  page (mark_completed, called by crawl_shared_index);
+- the board cache still holds the page with that hash, together with the
+  ETag / Last-Modified PTT sent for it;
+- PTT answers 304, or 200 with a body of the same hash.
+
+Anything else, including undelivered LINE notifications or a probe
+error, means a full run. Only the board cache and the standard library
+are loaded on this path.
+"""
+import hashlib
+import json
+import os
+
+from ptt_cache import open_article_cache
+from ptt_http import probe
+
+
+def completed_key(groups):
+    """Meta key of the last complete crawl of a set of (ticket_keywords, artist_keywords) watchlists"""
+    signature = sorted([sorted(ticket), sorted(artists)] for ticket, artists in groups)
+    return 'completed_index:' + json.dumps(signature, ensure_ascii=False)
+
+
+def mark_completed(cache, index_url, groups):
+    """Record that the page cached for index_url was fully processed for these watchlists"""
+    entry = cache.get_page(index_url)
+    if entry is not None:
+        cache.set_meta(completed_key(groups), entry['body_hash'])
+
+
+def board_unchanged(output_dir, index_url, groups, cookies=(('over18', '1'),)):
+    """True when index_url is the page the last complete crawl of groups processed, and no notifications are pending"""
+    outbox_path = os.path.join(output_dir, 'line_outbox.json')
+    if os.path.exists(outbox_path) or os.path.exists(outbox_path + '.journal'):
+        return False
+    if not os.path.exists(os.path.join(output_dir, 'article_cache.sqlite3')):
+        return False
+
+    cache = open_article_cache(output_dir)
+    try:
+        completed = cache.get_meta(completed_key(groups))
+        entry = cache.get_page(index_url)
+    finally:
+        cache.close()
+    if completed is None or entry is None or entry['body_hash'] != completed:
+        return False
+
+    headers = {}
+    if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    result = probe(index_url, headers, cookies)
+    if result is None:
+        return False
+    status, _, body = result
+    if status == 304:
+        return True
+    return status == 200 and hashlib.blake2b(body, digest_size=16).hexdigest() == completed
+
+
+def mark_walk_completed(crawlers):
+    """mark_completed for the shared index walk of crawlers, unless a fetch of the run failed
+
+    An article that could not be fetched is retried by the next full run
+    only, so a run with failures must not let the following ones exit early.
+    """
+    indexed = [crawler for crawler in crawlers if crawler.strategy == 'index' and crawler.max_pages > 0]
+    if not indexed or any(crawler.fetch_failed or crawler.details_failed for crawler in crawlers):
+        return
+    reader = indexed[0]
+    mark_completed(
+        reader.article_cache, f"{reader.base_url}/bbs/{reader.board}/index.html",
+        [(crawler.ticket_keywords, crawler.artist_keywords) for crawler in crawlers]
+    )
@@ -0,0 +1,83 @@
+import random
+import signal
+import threading
+import time
+
+
+class AdaptiveScheduler:
+    """Polling interval that shrinks while the board is active and grows while it is quiet
+
+    Every tick that saw new posts multiplies the interval by shrink, every
+    quiet or failed tick by grow, always staying within [min_interval,
+    max_interval]. Delays get a little jitter so several watchers started
+    together drift apart.
+    """
+
+    def __init__(self, min_interval=30.0, max_interval=600.0, shrink=0.5, grow=1.5, jitter=0.1):
+        """
+        Parameters:
+        min_interval (float): Shortest delay between polls in seconds
+        max_interval (float): Longest delay between polls in seconds
+        shrink (float): Factor applied after a tick with new posts
+        grow (float): Factor applied after a quiet or failed tick
+        jitter (float): Random +/- fraction added to each delay
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("min_interval must be positive and at most max_interval")
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.shrink = shrink
+        self.grow = grow
+        self.jitter = jitter
+        self.interval = self.min_interval
+
+    def update(self, active):
+        """Adjust the interval after a tick, return the delay before the next one"""
+        factor = self.shrink if active else self.grow
+        self.interval = min(self.max_interval, max(self.min_interval, self.interval * factor))
+        delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(self.max_interval, max(self.min_interval, delay))
+
+
+def run_watch(crawl_once, close, scheduler, stop_event=None):
+    """Call crawl_once on the scheduler's intervals until SIGTERM or SIGINT, then call close
+
+    crawl_once returns True when the tick saw new posts on the board. A
+    signal only sets the stop event: a crawl in progress finishes, so its
+    cache inserts, watermark and output are saved, before close flushes
+    the remaining state.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n收到 {signal.Signals(signum).name}，完成本輪後結束...")
+        stop_event.set()
+
+    # Signal handlers can only be installed from the main thread
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, request_stop)
+
+    tick = 0
+    try:
+        while not stop_event.is_set():
+            tick += 1
+            started = time.monotonic()
+            print(f"\n-----第 {tick} 輪爬取 ({time.strftime('%Y-%m-%d %H:%M:%S')})-----")
+            try:
+                active = crawl_once()
+            except Exception as e:
+                print(f"本輪爬取發生錯誤: {str(e)}")
+                active = False
+
+            if stop_event.is_set():
+                break
+            delay = scheduler.update(active)
+            print(f"本輪耗時 {time.monotonic() - started:.1f} 秒，{delay:.0f} 秒後再次爬取")
+            stop_event.wait(delay)
+    finally:
+        close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        print("已儲存狀態並結束監看")
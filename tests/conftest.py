@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+# Tests import the top-level modules, and the stub servers and page fixtures of benchmarks/
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+# The modules call time.monotonic() / time.time() through the time module, patching it reaches them all
+
+@pytest.fixture
+def monotonic_clock(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def wall_clock(monkeypatch):
+    clock = FakeClock(1700000000.0)
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
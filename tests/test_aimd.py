@@ -0,0 +1,97 @@
+import pytest
+
+from ptt_http import AimdController, InFlightLimit, TokenBucket
+
+
+@pytest.fixture
+def controller(monotonic_clock):
+    bucket = TokenBucket(1.0, 1)
+    slots = InFlightLimit(4)
+    return AimdController('www.ptt.cc', bucket, slots, min_rate=0.125, max_rate=2.0)
+
+
+def test_additive_increase_stops_at_max_rate(controller, monotonic_clock):
+    assert controller.bucket.rate == 1.0
+    assert controller.slots.limit == 2
+
+    controller.on_response(200, 0.05)
+    assert controller.bucket.rate == pytest.approx(1.1)
+
+    rates = []
+    for _ in range(100):
+        monotonic_clock.advance(0.5)
+        controller.on_response(200, 0.05)
+        rates.append(controller.bucket.rate)
+    assert rates == sorted(rates)
+    assert max(rates) == controller.bucket.rate == 2.0
+    assert controller.slots.limit == 4
+
+
+def test_max_rate_defaults_to_the_starting_rate(monotonic_clock):
+    controller = AimdController('www.ptt.cc', TokenBucket(0.5, 1))
+    for _ in range(50):
+        controller.on_response(200, 0.05)
+    assert controller.bucket.rate == 0.5
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_congestion_status_halves_rate_and_in_flight(controller, status):
+    controller.slots.set_limit(4)
+    assert controller.on_response(status, 0.05) == 0.0
+    assert controller.bucket.rate == 0.5
+    assert controller.slots.limit == 2
+
+
+def test_rate_never_drops_below_min_rate(controller, monotonic_clock):
+    for _ in range(10):
+        monotonic_clock.advance(controller.cooldown)
+        controller.on_error()
+    assert controller.bucket.rate == controller.min_rate
+    assert controller.slots.limit == 1
+
+
+def test_latency_rise_cuts_the_rate(controller, monotonic_clock):
+    for _ in range(5):
+        monotonic_clock.advance(0.5)
+        controller.on_response(200, 0.1)
+    rate = controller.bucket.rate
+    assert controller.fastest == pytest.approx(0.1)
+
+    monotonic_clock.advance(controller.cooldown)
+    controller.on_response(200, 2.0)
+    assert controller.latency >= controller.latency_factor * controller.fastest
+    assert controller.bucket.rate == pytest.approx(rate * controller.decrease)
+
+
+def test_fast_responses_below_min_latency_never_cut(controller, monotonic_clock):
+    for _ in range(5):
+        controller.on_response(200, 0.01)
+    monotonic_clock.advance(controller.cooldown)
+    # Ten times slower than the fastest average, still under min_latency
+    controller.on_response(200, 0.1)
+    assert controller.bucket.rate > 1.0
+
+
+def test_cooldown_merges_a_burst_of_failures_into_one_cut(controller, monotonic_clock):
+    for status in (503, 503, 429, 502):
+        controller.on_response(status, 0.05)
+        monotonic_clock.advance(0.1)
+    controller.on_error()
+    assert controller.bucket.rate == 0.5
+
+    monotonic_clock.advance(controller.cooldown)
+    controller.on_response(503, 0.05)
+    assert controller.bucket.rate == 0.25
+
+
+def test_retry_after_pauses_the_bucket(controller, monotonic_clock):
+    assert controller.on_response(429, 0.05, retry_after='30') == 30.0
+    rate = controller.bucket.rate
+    assert controller.bucket.reserve() == pytest.approx(30 + 1 / rate)
+
+    monotonic_clock.advance(30 + 2 / rate)
+    assert controller.bucket.reserve() == 0.0
+
+
+def test_retry_after_is_capped_at_max_pause(controller):
+    assert controller.on_response(503, 0.05, retry_after='86400') == controller.max_pause
@@ -0,0 +1,78 @@
+import pytest
+
+from ptt_archive import ArticleArchive
+
+DAY = 86400
+BASE = 1727740800  # 2024-10-01 00:00:00 UTC
+
+
+def article(day, title, author='ticketfan (票券粉)'):
+    return {
+        'title': title,
+        'url': f"https://www.ptt.cc/bbs/Drama-Ticket/M.{BASE + day * DAY}.A.{day:03X}.html",
+        '作者': author,
+    }
+
+
+ARTICLES = [
+    article(0, '[售票] Gracie Abrams 台北 10/16 2張'),
+    article(1, '[換票] IU 高雄 11/2 1張', 'kpoplover'),
+    article(2, '[售票] GRACIE ABRAMS 小巨蛋 50%off'),
+    article(3, '[售票] 五月天 大巨蛋 12/31 2張', 'mayday5566 (五迷)'),
+    article(4, '[徵票] gracie 台北 100_200 區'),
+]
+
+
+@pytest.fixture(params=['fts', 'like'])
+def archive(request, tmp_path):
+    archive = ArticleArchive(str(tmp_path / 'archive.sqlite3'))
+    if request.param == 'fts':
+        if not archive.fts:
+            pytest.skip("SQLite build without FTS5 trigram tokenizer")
+    else:
+        # Same queries answered by the LIKE scans of SQLite builds without trigrams
+        archive.fts = False
+    archive.add_many(ARTICLES[:4], ['gracie'])
+    archive.add_many([ARTICLES[1], ARTICLES[4]], ['IU'])
+    archive.add_many([ARTICLES[4]], ['gracie'])
+    yield archive
+    archive.close()
+
+
+def titles(results):
+    return [result['title'] for result in results]
+
+
+def test_keywords_match_substrings_case_insensitively_newest_first(archive):
+    assert titles(archive.search(['gracie'])) == [ARTICLES[4]['title'], ARTICLES[2]['title'], ARTICLES[0]['title']]
+    assert titles(archive.search(['gracie', '台北'])) == [ARTICLES[4]['title'], ARTICLES[0]['title']]
+    # Too short for a trigram
+    assert titles(archive.search(['IU'])) == [ARTICLES[1]['title']]
+    assert titles(archive.search(['大巨蛋'])) == [ARTICLES[3]['title']]
+    assert archive.search(['gracie', '高雄']) == []
+
+
+def test_like_wildcards_are_matched_literally(archive):
+    assert titles(archive.search(['50%'])) == [ARTICLES[2]['title']]
+    assert titles(archive.search(['0_2'])) == [ARTICLES[4]['title']]
+    assert archive.search(['%']) == [archive.search(['50%'])[0]]
+
+
+def test_author_group_and_date_filters(archive):
+    # Authors are stored as "id (nickname)" and matched by id
+    assert titles(archive.search(author='MAYDAY5566')) == [ARTICLES[3]['title']]
+    assert titles(archive.search(author='kpoplover')) == [ARTICLES[1]['title']]
+    assert archive.search(author='mayday') == []
+
+    results = archive.search(group='IU')
+    assert titles(results) == [ARTICLES[4]['title'], ARTICLES[1]['title']]
+    assert results[0]['groups'] == ['IU', 'gracie']
+
+    since, until = BASE + DAY, BASE + 3 * DAY
+    assert titles(archive.search(since=since, until=until)) == [ARTICLES[2]['title'], ARTICLES[1]['title']]
+    assert titles(archive.search(['gracie'], group='gracie', since=since)) == [ARTICLES[4]['title'], ARTICLES[2]['title']]
+
+
+def test_limit(archive):
+    assert len(archive.search(limit=2)) == 2
+    assert len(archive.search(limit=None)) == archive.count() == 5
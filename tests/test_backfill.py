@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from ptt_backfill import Backfill
+from ptt_crawler_multiple import create_crawlers
+from ptt_http import HttpClient
+from stubs import StubPttServer
+
+
+@pytest.fixture
+def crawlers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ptt = StubPttServer(last_page=20).start()
+    client = HttpClient(cookies=[('over18', '1', '127.0.0.1')])
+    crawlers = create_crawlers(
+        [['gracie'], ['IU']], ptt.board, ['售'], 5, 'token', 'user', http=client, base_url=ptt.url
+    )
+    yield ptt, crawlers
+    for crawler in crawlers:
+        crawler.close()
+    client.close()
+    ptt.stop()
+
+
+def fail_articles(monkeypatch, crawler, should_fail):
+    get_page_content = crawler.get_page_content
+
+    def flaky(url, throttle=True):
+        if '/index' not in url and should_fail(url):
+            return None
+        return get_page_content(url, throttle)
+
+    monkeypatch.setattr(crawler, 'get_page_content', flaky)
+
+
+def test_failed_articles_are_retried_after_the_range(crawlers, monkeypatch):
+    ptt, crawlers = crawlers
+    attempted = set()
+
+    def first_attempt(url):
+        if url in attempted:
+            return False
+        attempted.add(url)
+        return True
+
+    fail_articles(monkeypatch, crawlers[0], first_attempt)
+    backfill = Backfill(crawlers, 1, 6, chunk_pages=2, parse_workers=0)
+    assert backfill.run()
+
+    assert backfill.failed == {}
+    assert backfill.articles_written == len(attempted) == ptt.counts['article'] > 0
+    assert not os.path.exists(backfill.checkpoint_path)
+
+
+def test_checkpoint_keeps_failed_articles_for_the_next_run(crawlers, monkeypatch):
+    ptt, crawlers = crawlers
+    down = [True]
+    fail_articles(monkeypatch, crawlers[0], lambda url: down[0])
+    backfill = Backfill(crawlers, 1, 6, chunk_pages=2, parse_workers=0)
+    assert not backfill.run()
+
+    with open(backfill.checkpoint_path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    assert checkpoint['next_page'] == 7
+    assert checkpoint['articles_written'] == 0
+    failed = set(checkpoint['failed'])
+    assert failed
+
+    # The next run only fetches the failed articles, the index pages are done
+    down[0] = False
+    ptt.reset_counts()
+    backfill = Backfill(crawlers, 1, 6, chunk_pages=2, parse_workers=0)
+    assert backfill.run()
+    assert ptt.counts == {'article': len(failed)}
+    assert backfill.articles_written == len(failed)
+    assert all(article_id in crawlers[0].article_cache for article_id in failed)
+    assert not os.path.exists(backfill.checkpoint_path)
+
+
+def test_ranges_of_a_board_keep_separate_checkpoints(crawlers, monkeypatch):
+    _, crawlers = crawlers
+    fail_articles(monkeypatch, crawlers[0], lambda url: True)
+    first = Backfill(crawlers, 1, 3, parse_workers=0)
+    second = Backfill(crawlers, 4, 6, parse_workers=0)
+    assert first.checkpoint_path != second.checkpoint_path
+    assert not first.run()
+    assert not second.run()
+
+    assert first.load_checkpoint()['next_page'] == 4
+    assert second.load_checkpoint()['next_page'] == 7
+    assert Backfill(crawlers, 1, None).checkpoint_path.endswith('backfill_checkpoint_1-newest.json')
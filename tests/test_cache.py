@@ -0,0 +1,84 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from ptt_cache import ArticleCache, SqliteArticleCache
+
+DAY = 86400
+NOW = "2024-10-16 12:00:00"
+
+
+def article(timestamp, suffix='A.001'):
+    return f"M.{timestamp}.{suffix}"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SqliteArticleCache(str(tmp_path / 'article_cache.sqlite3'))
+    yield cache
+    cache.conn.close()
+
+
+def test_article_cache_is_abstract():
+    with pytest.raises(TypeError):
+        ArticleCache()
+
+
+def test_snapshot_ignores_articles_added_after_it(cache):
+    assert cache.snapshot() == 0
+    cache.add_many([(article(1700000000), NOW)])
+    before = cache.snapshot()
+
+    cache.stage(article(1700000100), NOW)
+    cache.flush()
+    # Re-adding a known article keeps its rowid, so it still counts as seen
+    cache.add_many([(article(1700000000), NOW)])
+
+    assert cache.contains(article(1700000000), before)
+    assert not cache.contains(article(1700000100), before)
+    assert cache.contains(article(1700000100))
+    assert article(1700000100) in cache
+    assert cache.snapshot() > before
+    assert not cache.contains(article(1700000200), cache.snapshot())
+
+
+def test_evict_measures_age_from_the_watermark(cache):
+    watermark = 1700000000
+    old_crawl = datetime.fromtimestamp(time.time() - 60 * DAY).strftime("%Y-%m-%d %H:%M:%S")
+    recent_crawl = datetime.fromtimestamp(time.time() - DAY).strftime("%Y-%m-%d %H:%M:%S")
+    cache.add_many([
+        (article(watermark - 40 * DAY), recent_crawl),   # Posted long before the watermark: evicted
+        (article(watermark - 10 * DAY), old_crawl),      # Crawled long ago, posted recently: kept
+        (article(watermark), recent_crawl),
+        ('legacy-old', old_crawl),                       # No post time: age by crawl time
+        ('legacy-recent', recent_crawl),
+    ])
+
+    assert cache.evict(30, watermark) == 2
+    assert not cache.contains(article(watermark - 40 * DAY))
+    assert cache.contains(article(watermark - 10 * DAY))
+    assert cache.contains(article(watermark))
+    assert not cache.contains('legacy-old')
+    assert cache.contains('legacy-recent')
+
+
+def test_evict_without_watermark_uses_crawl_time(cache):
+    old_crawl = datetime.fromtimestamp(time.time() - 60 * DAY).strftime("%Y-%m-%d %H:%M:%S")
+    recent_crawl = datetime.fromtimestamp(time.time() - DAY).strftime("%Y-%m-%d %H:%M:%S")
+    cache.add_many([(article(1), recent_crawl), (article(2), old_crawl)])
+
+    assert cache.evict(30) == 1
+    assert cache.contains(article(1))
+    assert not cache.contains(article(2))
+
+
+def test_flush_evicts_against_the_stored_watermark(cache):
+    watermark = 1700000000
+    cache.set_meta('watermark', watermark)
+    cache.add_many([(article(watermark - 40 * DAY), NOW)])
+    cache.stage(article(watermark), NOW)
+
+    assert cache.flush(retention_days=30) == 1
+    assert not cache.contains(article(watermark - 40 * DAY))
+    assert cache.contains(article(watermark))
@@ -0,0 +1,131 @@
+import concurrent.futures
+
+import pytest
+
+from ptt_cluster import LeaseStore
+from ptt_crawler_multiple import build_shared_matcher, crawl_shared_index, create_crawlers
+from ptt_http import HttpClient
+from ptt_notify import close_outboxes
+from stubs import StubLineServer, StubPttServer
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / 'cluster.sqlite3')
+    opened = []
+
+    def open_store(owner, **options):
+        store = LeaseStore(path, owner, **options)
+        opened.append(store)
+        return store
+
+    yield open_store
+    for store in opened:
+        store.close()
+
+
+def test_expired_lease_is_taken_over(stores, wall_clock):
+    first = stores('node-a', lease_seconds=60)
+    second = stores('node-b', lease_seconds=60)
+    first.add_units([('board:Drama-Ticket:1', 'board', 'Drama-Ticket', {})])
+
+    unit = first.acquire()
+    assert unit['attempt'] == 1
+    assert second.acquire() is None
+
+    wall_clock.advance(30)
+    assert first.renew(unit['unit_id'])
+    # Renewed until 90 s, past the first lease's 60 s
+    wall_clock.advance(50)
+    assert second.acquire() is None
+
+    wall_clock.advance(11)
+    taken = second.acquire()
+    assert taken['unit_id'] == unit['unit_id']
+    assert taken['attempt'] == 2
+    assert not first.renew(unit['unit_id'])
+    assert not first.complete(unit['unit_id'])
+    assert second.complete(unit['unit_id'])
+    assert second.status() == [('board', 'done', 1)]
+
+
+def test_unit_is_abandoned_after_max_attempts(stores, wall_clock):
+    store = stores('node-a', lease_seconds=60, max_attempts=2)
+    store.add_units([('backfill:Drama-Ticket:1-500', 'backfill', 'Drama-Ticket', {'start_page': 1, 'end_page': 500})])
+
+    for attempt in (1, 2):
+        assert store.acquire()['attempt'] == attempt
+        wall_clock.advance(61)
+    assert store.acquire() is None
+    assert store.status() == [('backfill', 'abandoned', 1)]
+
+
+def test_board_units_come_before_backfills(stores, wall_clock):
+    store = stores('node-a')
+    store.add_units([('backfill:Drama-Ticket:1-500', 'backfill', 'Drama-Ticket', {})])
+    wall_clock.advance(1)
+    store.add_round(['Drama-Ticket'], 1)
+    assert store.acquire()['kind'] == 'board'
+    assert store.acquire()['kind'] == 'backfill'
+
+
+def test_claim_is_won_once_across_stores(stores):
+    first = stores('node-a')
+    second = stores('node-b')
+    keys = [('Drama-Ticket', f"M.{1700000000 + idx}.A.001", 'gracie') for idx in range(20)]
+
+    def claim_all(store):
+        return [key for key in keys if store.claim(*key)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        won = list(executor.map(claim_all, [first, second, first, second]))
+    assert sorted(key for keys_won in won for key in keys_won) == sorted(keys)
+    # Other watchlists of the same article are claimed separately
+    assert first.claim('Drama-Ticket', keys[0][1], 'babymonster/寶怪')
+
+
+def test_unnotified_claim_expires(stores, wall_clock):
+    first = stores('node-a', lease_seconds=60)
+    second = stores('node-b', lease_seconds=60)
+    key = ('Drama-Ticket', 'M.1700000000.A.001', 'gracie')
+
+    assert first.claim(*key)
+    wall_clock.advance(59)
+    assert not second.claim(*key)
+    # node-a died before its outbox took the article
+    wall_clock.advance(2)
+    assert second.claim(*key)
+    assert not first.mark_notified(*key)
+    assert second.mark_notified(*key)
+
+    wall_clock.advance(3600)
+    assert not first.claim(*key)
+
+
+def test_crawl_marks_its_claims_notified(stores, tmp_path, monkeypatch):
+    ptt = StubPttServer(last_page=50).start()
+    line = StubLineServer().start()
+    monkeypatch.chdir(tmp_path)
+    store = stores('node-a', lease_seconds=0)
+    client = HttpClient(cookies=[('over18', '1', '127.0.0.1')])
+    try:
+        crawlers = create_crawlers(
+            [['gracie'], ['babymonster', '寶怪']], ptt.board, ['售'], 3, 'token', 'user',
+            http=client, base_url=ptt.url, line_api_url=line.url, notify_claims=store
+        )
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            crawl_shared_index(crawlers, executor, build_shared_matcher(crawlers))
+        for crawler in crawlers:
+            crawler.close()
+        close_outboxes()
+    finally:
+        client.close()
+        ptt.stop()
+        line.stop()
+
+    claims = store.conn.execute('SELECT board, article_id, watchlist, notified_at FROM claims').fetchall()
+    assert claims and all(notified_at is not None for _, _, _, notified_at in claims)
+    # Even with claims expiring at once, a notified claim is never won again
+    other = stores('node-b', lease_seconds=0)
+    assert not any(other.claim(board, article_id, watchlist) for board, article_id, watchlist, _ in claims)
+    assert len(line.messages) >= 1
@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+import ptt_config
+from ptt_config import load_watchlists, snapshot_path
+
+
+def write_config(path, artists, mtime_ns=None):
+    config = {'boards': [{'board': 'Drama-Ticket', 'ticket_keywords': ['售'], 'artists_groups': [artists]}]}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = str(tmp_path / 'boards.json')
+    write_config(path, ['gracie'], mtime_ns=1700000000 * 10**9)
+    return path
+
+
+def group_artists(path):
+    config, matchers = load_watchlists(path)
+    return config['boards'][0]['artists_groups'][0], matchers['Drama-Ticket'].match('[售票] IU 台北')
+
+
+def test_snapshot_is_reused_while_the_config_is_unchanged(config_path, monkeypatch):
+    assert group_artists(config_path) == (['gracie'], set())
+    assert os.path.exists(snapshot_path(config_path))
+    assert os.path.basename(snapshot_path(config_path)) == '.boards.json.snapshot'
+
+    def load_config(path):
+        raise AssertionError("config parsed again")
+
+    monkeypatch.setattr(ptt_config, 'load_config', load_config)
+    assert group_artists(config_path) == (['gracie'], set())
+
+
+def test_size_change_rebuilds_the_snapshot(config_path):
+    group_artists(config_path)
+    write_config(config_path, ['IU', 'gracie'], mtime_ns=1700000000 * 10**9)
+    assert group_artists(config_path) == (['IU', 'gracie'], {0})
+
+
+def test_mtime_change_rebuilds_the_snapshot(config_path):
+    group_artists(config_path)
+    size = os.path.getsize(config_path)
+    # Same size, only the mtime tells the edit apart
+    write_config(config_path, ['iu0000'], mtime_ns=1700000000 * 10**9 + 1)
+    assert os.path.getsize(config_path) == size
+    assert group_artists(config_path)[0] == ['iu0000']
+
+
+def test_damaged_snapshot_is_rebuilt(config_path):
+    group_artists(config_path)
+    with open(snapshot_path(config_path), 'w', encoding='utf-8') as f:
+        f.write('{"stamp": ')
+    assert group_artists(config_path) == (['gracie'], set())
+    with open(snapshot_path(config_path), 'r', encoding='utf-8') as f:
+        assert json.load(f)['stamp']['size'] == os.path.getsize(config_path)
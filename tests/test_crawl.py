@@ -0,0 +1,140 @@
+import pytest
+
+from fixtures import POSTS_PER_PAGE, search_posts
+from ptt_crawler_multiple import PTTCrawler
+from ptt_http import HttpClient
+from ptt_notify import close_outboxes
+from stubs import StubLineServer, StubPttServer
+
+
+@pytest.fixture
+def servers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ptt = StubPttServer(last_page=200).start()
+    line = StubLineServer().start()
+    client = HttpClient(cookies=[('over18', '1', '127.0.0.1')])
+    yield ptt, line, client
+    close_outboxes()
+    client.close()
+    ptt.stop()
+    line.stop()
+
+
+def open_crawler(servers, artist_keywords, max_pages=3, strategy='index'):
+    ptt, line, client = servers
+    return PTTCrawler(
+        board=ptt.board, ticket_keywords=['售'], artist_keywords=artist_keywords, max_pages=max_pages,
+        line_token='token', line_user_id='user', http=client, base_url=ptt.url, line_api_url=line.url,
+        strategy=strategy
+    )
+
+
+def crawl(servers, artist_keywords, max_pages=3, **options):
+    crawler = open_crawler(servers, artist_keywords, max_pages)
+    for name, value in options.items():
+        setattr(crawler, name, value)
+    try:
+        result = crawler.crawl_articles()
+        return result, crawler.load_watermark()
+    finally:
+        crawler.close()
+
+
+def index_requests(ptt):
+    return ptt.counts.get('index', 0) + ptt.counts.get('not_modified', 0)
+
+
+def test_walk_stops_at_the_watermark(servers):
+    ptt = servers[0]
+    _, watermark = crawl(servers, ['gracie'])
+    assert watermark is not None
+    assert index_requests(ptt) == 3
+
+    # One new page: the old newest page is the first one reaching the watermark
+    ptt.last_page += 1
+    ptt.reset_counts()
+    _, new_watermark = crawl(servers, ['gracie'])
+    assert index_requests(ptt) == 2
+    assert new_watermark > watermark
+
+
+def test_watermark_is_kept_per_watchlist(servers):
+    ptt = servers[0]
+    crawl(servers, ['gracie'])
+
+    # Another watchlist of the board has not checked these pages yet
+    ptt.reset_counts()
+    _, watermark = crawl(servers, ['iu'])
+    assert index_requests(ptt) == 3
+    assert watermark is not None
+
+
+def test_watermark_does_not_advance_past_failed_details(servers):
+    ptt = servers[0]
+    result, watermark = crawl(servers, ['gracie'], fetch_article_details=lambda article, throttle=True: None)
+    assert result['new_articles_count'] == 0
+    assert watermark is None
+
+    # The next run walks the same pages again and picks up the articles it missed
+    ptt.reset_counts()
+    result, watermark = crawl(servers, ['gracie'])
+    assert index_requests(ptt) == 3
+    assert result['new_articles_count'] > 0
+    assert watermark is not None
+
+
+def test_search_results_are_merged_across_keywords(servers):
+    ptt = servers[0]
+    keywords = ['gracie', 'Gracie Abrams', 'IU']
+    crawler = open_crawler(servers, keywords, strategy='search')
+    try:
+        crawler.start_crawl()
+        rows = crawler.search_articles()
+    finally:
+        crawler.close()
+
+    # Every query reads max_pages result pages; 'Gracie Abrams' posts are found by 'gracie' too
+    expected = {
+        post_id for query in keywords
+        for _, post_id, _ in search_posts(query, ptt.last_page, ptt.board)[:3 * POSTS_PER_PAGE]
+    }
+    urls = [row['url'] for row in rows]
+    assert len(urls) == len(set(urls)) == len(expected)
+    assert {url.split('/')[-1][:-len('.html')] for url in urls} == expected
+    assert ptt.counts['search'] == 3 * len(keywords)
+
+    # Interleaved results of the queries come back oldest first, like the index
+    timestamps = [crawler.article_timestamp(url) for url in urls]
+    assert timestamps == sorted(timestamps)
+
+
+def test_unchanged_index_pages_reuse_the_parsed_rows(servers, monkeypatch):
+    ptt = servers[0]
+    crawler = open_crawler(servers, ['gracie'])
+    parsed = []
+    parse_index_page = crawler.parse_index_page
+    monkeypatch.setattr(crawler, 'parse_index_page', lambda content: parsed.append(1) or parse_index_page(content))
+    url = f"{ptt.url}/bbs/{ptt.board}/index.html"
+    try:
+        rows, prev_page_url = crawler.fetch_index_page(url)
+        assert len(parsed) == 1
+
+        # The stored ETag is sent along and PTT answers 304
+        assert crawler.fetch_index_page(url) == (rows, prev_page_url)
+        assert ptt.counts == {'index': 1, 'not_modified': 1}
+        assert len(parsed) == 1
+
+        # Without validators the full body comes back, with the same hash
+        cached = crawler.article_cache.get_page(url)
+        crawler.article_cache.set_page(url, None, None, cached['body_hash'], cached['parsed'])
+        assert crawler.fetch_index_page(url) == (rows, prev_page_url)
+        assert ptt.counts == {'index': 2, 'not_modified': 1}
+        assert len(parsed) == 1
+
+        # A new post changes the newest page, it is parsed again
+        ptt.last_page += 1
+        new_rows, new_prev_page_url = crawler.fetch_index_page(url)
+        assert len(parsed) == 2
+        assert new_rows != rows and new_prev_page_url != prev_page_url
+    finally:
+        crawler.close()
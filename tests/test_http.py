@@ -0,0 +1,58 @@
+import concurrent.futures
+
+import pytest
+
+from ptt_crawler_multiple import build_shared_matcher, crawl_shared_index, create_crawlers
+from ptt_http import DEFAULT_HOST_RATES, HostRateLimiter, HttpClient
+from ptt_notify import close_outboxes
+from stubs import StubLineServer, StubPttServer
+
+
+@pytest.fixture
+def servers():
+    ptt = StubPttServer(last_page=200).start()
+    line = StubLineServer().start()
+    yield ptt, line
+    ptt.stop()
+    line.stop()
+
+
+def test_sessions_do_not_pile_up_across_polls(servers, tmp_path, monkeypatch):
+    ptt, line = servers
+    monkeypatch.chdir(tmp_path)
+    client = HttpClient(cookies=[('over18', '1', '127.0.0.1')])
+    crawlers = create_crawlers(
+        [['gracie'], ['babymonster', '寶怪'], ['iu']], ptt.board, ['售'], 3, 'token', 'user',
+        http=client, base_url=ptt.url, line_api_url=line.url
+    )
+    matcher = build_shared_matcher(crawlers)
+    counts = []
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        for _ in range(8):
+            # New posts every poll, so each poll fetches article pages on fresh detail pools
+            ptt.last_page += 1
+            crawl_shared_index(crawlers, executor, matcher)
+            counts.append(len(client._sessions))
+    for crawler in crawlers:
+        crawler.close()
+    close_outboxes()
+    client.close()
+
+    # Only the sessions of live threads, plus the last pools' until the next session opens
+    assert max(counts[2:]) <= counts[1], counts
+
+
+def test_adaptive_rate_stays_at_or_below_the_configured_rate():
+    limiter = HostRateLimiter(adaptive=True, max_in_flight=4)
+    url = 'https://www.ptt.cc/bbs/Drama-Ticket/index.html'
+    for _ in range(200):
+        limiter.record(url, 200, 0.05)
+    assert limiter.bucket(url).rate == DEFAULT_HOST_RATES['www.ptt.cc'][0] == 0.5
+
+
+def test_max_rates_lets_the_adaptive_rate_climb():
+    limiter = HostRateLimiter({'www.ptt.cc': (0.5, 1)}, adaptive=True, max_rates={'www.ptt.cc': 1.0})
+    url = 'https://www.ptt.cc/bbs/Drama-Ticket/index.html'
+    for _ in range(200):
+        limiter.record(url, 200, 0.05)
+    assert limiter.bucket(url).rate == 1.0
@@ -0,0 +1,88 @@
+import random
+import string
+
+import pytest
+
+from ptt_crawler_multiple import PTTCrawler
+from ptt_matcher import KeywordMatcher
+
+TICKET_KEYWORDS = ['售', '換票', '降售', '售票']
+CJK = '寶怪演唱會台北高雄場次票券座位區域搖滾站位'
+
+
+def random_keyword(rng):
+    if rng.random() < 0.3:
+        return ''.join(rng.choice(CJK) for _ in range(rng.randint(2, 3)))
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(rng.randint(4, 10)))
+
+
+def make_groups(rng, keyword_count, keywords_per_group=3):
+    return {
+        idx: (TICKET_KEYWORDS, [random_keyword(rng) for _ in range(keywords_per_group)])
+        for idx in range(max(1, keyword_count // keywords_per_group))
+    }
+
+
+def make_titles(rng, groups, count):
+    """Titles of which about a fifth hold an artist keyword of groups, in another case"""
+    artist_pool = [keyword for _, artists in groups.values() for keyword in artists]
+    titles = []
+    for _ in range(count):
+        prefix = rng.choice(['[售票]', '[換票]', '[徵票]', '[讓票]', '[公告]'])
+        body = rng.choice(artist_pool).upper() if rng.random() < 0.2 else random_keyword(rng)
+        titles.append(f"{prefix} {body} 台北場 {rng.randint(1, 4)}張")
+    return titles
+
+
+def any_match(groups, title):
+    """Reference: the per-keyword any() checks the crawlers used before KeywordMatcher, for every group"""
+    title = title.lower()
+    return {
+        key for key, (ticket_keywords, artist_keywords) in groups.items()
+        if (not ticket_keywords or any(keyword.lower() in title for keyword in ticket_keywords))
+        and (not artist_keywords or any(keyword.lower() in title for keyword in artist_keywords))
+    }
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('keyword_count', [3, 30, 300])
+def test_matcher_agrees_with_any(seed, keyword_count):
+    rng = random.Random(seed * 1000 + keyword_count)
+    groups = make_groups(rng, keyword_count)
+    titles = make_titles(rng, groups, 500)
+    matcher = KeywordMatcher(groups)
+    for title in titles:
+        assert matcher.match(title) == any_match(groups, title), title
+
+
+def test_empty_keyword_lists_match_everything():
+    groups = {0: ([], []), 1: (['售'], []), 2: ([], ['IU'])}
+    matcher = KeywordMatcher(groups)
+    for title in ['[售票] iu 台北', '[徵票] 寶怪', '']:
+        assert matcher.match(title) == any_match(groups, title)
+
+
+def test_state_round_trip():
+    rng = random.Random(7)
+    groups = make_groups(rng, 30)
+    matcher = KeywordMatcher(groups)
+    restored = KeywordMatcher.from_state(matcher.to_state())
+    for title in make_titles(rng, groups, 200):
+        assert restored.match(title) == matcher.match(title)
+
+
+def test_crawler_filter_uses_same_rules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(3)
+    groups = make_groups(rng, 3)
+    ticket_keywords, artist_keywords = groups[0]
+    crawler = PTTCrawler(
+        board='Test', ticket_keywords=ticket_keywords, artist_keywords=artist_keywords, max_pages=1
+    )
+    try:
+        rows = [{'title': title, 'url': f'https://www.ptt.cc/bbs/Test/M.{idx}.A.000.html'}
+                for idx, title in enumerate(make_titles(rng, groups, 300))]
+        expected = [row['url'] for row in rows if any_match({0: groups[0]}, row['title'])]
+        assert [record.url for record in crawler.filter_articles(rows)] == expected
+    finally:
+        crawler.close()
@@ -0,0 +1,124 @@
+import json
+import os
+
+import pytest
+
+from ptt_http import HttpClient
+from ptt_notify import LineOutbox
+from stubs import StubLineServer
+
+
+def format_articles(articles):
+    return '\n'.join(
+        article['title'] + (f" ({', '.join(article['groups'])})" if article.get('groups') else '')
+        for article in articles
+    )
+
+
+def articles(count, prefix='post'):
+    return [{'title': f"{prefix} {idx}", 'url': f"https://www.ptt.cc/bbs/Drama-Ticket/{prefix}{idx}.html"}
+            for idx in range(count)]
+
+
+@pytest.fixture
+def http():
+    client = HttpClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def line():
+    server = StubLineServer().start()
+    yield server
+    server.stop()
+
+
+def open_outbox(http, line, path, **options):
+    options.setdefault('linger', 0.05)
+    return LineOutbox(http, 'token', 'user', str(path), format_articles, api_url=line.url, **options)
+
+
+def test_batches_five_articles_per_message_and_five_messages_per_push(http, line, tmp_path):
+    outbox = open_outbox(http, line, tmp_path / 'line_outbox.json')
+    outbox.enqueue(articles(30))
+    assert outbox.close()
+
+    assert [len(push['messages']) for push in line.pushes] == [5, 1]
+    assert all(len(text.split('\n')) == 5 for text in line.messages)
+    assert line.messages[0].startswith('post 0\n')
+    assert line.messages[-1].endswith('post 29')
+
+
+def test_merges_groups_of_the_same_url(http, line, tmp_path):
+    outbox = open_outbox(http, line, tmp_path / 'line_outbox.json', linger=0.3)
+    article = articles(1)[0]
+    outbox.enqueue([dict(article, groups=['gracie'])])
+    outbox.enqueue([dict(article, groups=['babymonster', 'gracie'])])
+    assert outbox.close()
+
+    assert line.messages == ['post 0 (gracie, babymonster)']
+
+
+def test_resends_the_pending_file_after_a_restart(http, tmp_path):
+    path = tmp_path / 'line_outbox.json'
+    down = StubLineServer(fail=1000, fail_status=503).start()
+    try:
+        outbox = open_outbox(http, down, path, backoff_base=60)
+        outbox.enqueue(articles(3))
+        assert not outbox.close(timeout=0.5)
+    finally:
+        down.stop()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert [article['title'] for article in json.load(f)] == ['post 0', 'post 1', 'post 2']
+
+    up = StubLineServer().start()
+    try:
+        assert open_outbox(http, up, path).close()
+    finally:
+        up.stop()
+    assert up.messages == ['post 0\npost 1\npost 2']
+    assert not os.path.exists(path)
+
+
+def test_409_counts_as_sent(http, tmp_path):
+    # LINE answers 409 when an earlier attempt with the same retry key was accepted
+    line = StubLineServer(fail=1, fail_status=409).start()
+    try:
+        outbox = open_outbox(http, line, tmp_path / 'line_outbox.json')
+        outbox.enqueue(articles(2))
+        assert outbox.close()
+        assert line.requests == 1
+        assert outbox.push(['again'], 'key') == 'sent'
+        assert outbox.push(['again'], 'key') == 'sent'
+        assert line.messages == ['again']
+    finally:
+        line.stop()
+    assert not os.path.exists(tmp_path / 'line_outbox.json')
+
+
+def test_replays_the_journal_after_a_crash(http, tmp_path):
+    path = tmp_path / 'line_outbox.json'
+    down = StubLineServer(fail=1000, fail_status=503).start()
+    try:
+        crashed = open_outbox(http, down, path, backoff_base=60)
+        crashed.enqueue([dict(article, groups=['gracie']) for article in articles(2)])
+        crashed.enqueue([dict(articles(1)[0], groups=['iu'])])
+        # enqueue only appends to the journal, the pending file waits for the dispatcher
+        assert not os.path.exists(path)
+        with open(str(path) + '.journal', 'r', encoding='utf-8') as f:
+            assert len(f.read().splitlines()) == 3
+
+        up = StubLineServer().start()
+        try:
+            assert open_outbox(http, up, path).close()
+        finally:
+            up.stop()
+        assert up.messages == ['post 0 (gracie, iu)\npost 1 (gracie)']
+        assert not os.path.exists(str(path) + '.journal')
+    finally:
+        # Stop the crashed outbox's dispatcher without the final save of close
+        with crashed.condition:
+            crashed.closed = True
+            crashed.condition.notify_all()
+        down.stop()
@@ -0,0 +1,44 @@
+import multiprocessing
+
+from ptt_output import JsonlSink, read_jsonl
+
+WRITERS = 4
+BATCHES = 50
+
+
+def append_records(path, writer):
+    # Large records, so a batch takes several write calls' worth of bytes
+    sink = JsonlSink(path, fsync_every=1000)
+    try:
+        for batch in range(BATCHES):
+            sink.write_many([
+                {'writer': writer, 'batch': batch, 'idx': idx, 'content': f"{writer}-{batch}-{idx} " * 500}
+                for idx in range(5)
+            ])
+    finally:
+        sink.close()
+
+
+def test_appends_from_several_processes_never_interleave(tmp_path):
+    path = str(tmp_path / 'Drama-Ticket_gracie_202410.jsonl')
+    processes = [multiprocessing.Process(target=append_records, args=(path, writer)) for writer in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    records = list(read_jsonl(path))
+    # Every line parses, so no write was torn or interleaved with another
+    assert len(records) == len(lines) == WRITERS * BATCHES * 5
+    assert all(record['content'] == f"{record['writer']}-{record['batch']}-{record['idx']} " * 500 for record in records)
+
+    # Each batch landed as one contiguous block, in the writer's order
+    for writer in range(WRITERS):
+        positions = [pos for pos, record in enumerate(records) if record['writer'] == writer]
+        own = [(records[pos]['batch'], records[pos]['idx']) for pos in positions]
+        assert own == [(batch, idx) for batch in range(BATCHES) for idx in range(5)]
+        for first in range(0, len(positions), 5):
+            assert positions[first:first + 5] == list(range(positions[first], positions[first] + 5))
@@ -0,0 +1,38 @@
+import pytest
+
+from fixtures import (
+    BASE_URL, article_id, load_fixture, load_golden, render_article_page, render_index_page, render_search_page,
+    search_posts
+)
+from ptt_parser import PARSERS, Bs4Parser, get_parser
+
+
+@pytest.fixture(params=sorted(PARSERS))
+def parser(request):
+    try:
+        return get_parser(request.param)
+    except ImportError:
+        pytest.skip(f"{request.param} is not installed")
+
+
+@pytest.mark.parametrize('fixture', sorted(load_golden()))
+def test_golden_fixtures(parser, fixture):
+    content = load_fixture(fixture)
+    if fixture.startswith('index'):
+        rows, prev_page_url = parser.parse_index(content, BASE_URL)
+        actual = {'rows': rows, 'prev_page_url': prev_page_url}
+    else:
+        actual = parser.parse_article(content)
+    assert actual == load_golden()[fixture]
+
+
+def test_rendered_pages_match_bs4(parser):
+    reference = Bs4Parser()
+    pages = [render_index_page(page, 40) for page in (1, 2, 17, 39, 40)]
+    hits = search_posts('gracie', 40)
+    pages += [render_search_page(hits, page, 'gracie') for page in (1, 2) if render_search_page(hits, page, 'gracie')]
+    for content in pages:
+        assert parser.parse_index(content, BASE_URL) == reference.parse_index(content, BASE_URL)
+    for post_id in (article_id(40, 0), article_id(3, 19)):
+        content = render_article_page(post_id)
+        assert parser.parse_article(content) == reference.parse_article(content)
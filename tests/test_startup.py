@@ -0,0 +1,63 @@
+import pytest
+
+from ptt_crawler_multiple import PTTCrawler
+from ptt_http import HttpClient
+from ptt_notify import close_outboxes
+from ptt_startup import board_unchanged, mark_walk_completed
+from stubs import StubLineServer, StubPttServer
+
+GROUPS = [(['售'], ['gracie'])]
+
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    """Stub board after one complete crawl of GROUPS, as (server, data dir, index URL)"""
+    monkeypatch.chdir(tmp_path)
+    ptt = StubPttServer(last_page=50).start()
+    line = StubLineServer().start()
+    client = HttpClient(cookies=[('over18', '1', '127.0.0.1')])
+    crawler = PTTCrawler(
+        board=ptt.board, ticket_keywords=['售'], artist_keywords=['gracie'], max_pages=3,
+        line_token='token', line_user_id='user', http=client, base_url=ptt.url, line_api_url=line.url
+    )
+    try:
+        crawler.crawl_articles()
+        mark_walk_completed([crawler])
+    finally:
+        crawler.close()
+        close_outboxes()
+        client.close()
+        line.stop()
+    yield ptt, crawler.output_dir, f"{ptt.url}/bbs/{ptt.board}/index.html"
+    ptt.stop()
+
+
+def test_quiet_board_is_unchanged_after_one_request(board):
+    ptt, output_dir, index_url = board
+    ptt.reset_counts()
+    assert board_unchanged(output_dir, index_url, GROUPS)
+    assert ptt.counts == {'not_modified': 1}
+
+
+def test_new_post_changes_the_board(board):
+    ptt, output_dir, index_url = board
+    ptt.last_page += 1
+    assert not board_unchanged(output_dir, index_url, GROUPS)
+
+
+def test_other_watchlists_were_not_crawled(board):
+    _, output_dir, index_url = board
+    assert not board_unchanged(output_dir, index_url, [(['售'], ['iu'])])
+    assert not board_unchanged(output_dir, index_url, GROUPS + [(['售'], ['iu'])])
+
+
+@pytest.mark.parametrize('name', ['line_outbox.json', 'line_outbox.json.journal'])
+def test_pending_notifications_need_a_full_run(board, name):
+    _, output_dir, index_url = board
+    with open(f"{output_dir}/{name}", 'w', encoding='utf-8') as f:
+        f.write('[]')
+    assert not board_unchanged(output_dir, index_url, GROUPS)
+
+
+def test_board_without_a_cache_is_not_unchanged(tmp_path):
+    assert not board_unchanged(str(tmp_path), 'http://127.0.0.1:9/bbs/Drama-Ticket/index.html', GROUPS)